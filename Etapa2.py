@@ -1,12 +1,15 @@
 import os
 import sys
 import yaml
-import requests
-from azure.identity import InteractiveBrowserCredential, TokenCachePersistenceOptions
+from azure.identity import (InteractiveBrowserCredential, TokenCachePersistenceOptions, AuthenticationRecord,
+                            AuthenticationRequiredError)
 from msal import PublicClientApplication, TokenCache
-import json
+import time
+import threading
 from pathlib import Path
 import certifi
+from purview_client import obter_cliente
+from utilitarios import BloqueioArquivo, escrever_json_atomico, ler_json
 
 os.environ['SSL_CERT_FILE'] = certifi.where()
 
@@ -57,7 +60,10 @@ def carregar_configuracoes():
 
 # ---------------- Cache de Token Personalizado ----------------
 class CustomTokenCache:
-    """Cache personalizado para tokens usando arquivo JSON"""
+    """
+    Cache personalizado para tokens usando arquivo JSON.
+    O acesso ao arquivo é serializado com lock, permitindo vários processos ao mesmo tempo.
+    """
     
     def __init__(self, cache_file="token_cache.json"):
         self.cache_file = cache_file
@@ -65,28 +71,35 @@ class CustomTokenCache:
     
     def _carregar_cache(self):
         """Carrega o cache do arquivo"""
-        if os.path.exists(self.cache_file):
-            try:
-                with open(self.cache_file, 'r') as f:
-                    return json.load(f)
-            except:
-                return {}
-        return {}
+        with BloqueioArquivo(self.cache_file):
+            return ler_json(self.cache_file, {})
     
     def _salvar_cache(self):
-        """Salva o cache no arquivo"""
-        with open(self.cache_file, 'w') as f:
-            json.dump(self.cache, f)
+        """Salva o cache no arquivo, preservando tokens gravados por outros processos"""
+        with BloqueioArquivo(self.cache_file):
+            atual = ler_json(self.cache_file, {})
+            atual.update(self.cache)
+            escrever_json_atomico(self.cache_file, atual)
+            self.cache = atual
+    
+    def recarregar(self):
+        """Relê o arquivo (outro processo pode ter renovado o token)"""
+        self.cache = self._carregar_cache()
     
     def encontrar_token(self, scope, tenant_id):
         """Procura por token válido no cache"""
+        token_data = self.encontrar_dados_token(scope, tenant_id)
+        return token_data['access_token'] if token_data else None
+    
+    def encontrar_dados_token(self, scope, tenant_id):
+        """Procura por token válido no cache, devolvendo token e expiração"""
         cache_key = f"{tenant_id}_{scope}"
         
         if cache_key in self.cache:
             token_data = self.cache[cache_key]
             # Verificar se o token ainda é válido (considerando expiração)
             if self._token_valido(token_data):
-                return token_data['access_token']
+                return token_data
         return None
     
     def salvar_token(self, scope, tenant_id, token_data):
@@ -98,10 +111,187 @@ class CustomTokenCache:
         }
         self._salvar_cache()
     
+    def remover_token(self, scope, tenant_id, access_token):
+        """Apaga o token do arquivo, se ainda for o mesmo (outro processo pode já ter gravado um novo)"""
+        cache_key = f"{tenant_id}_{scope}"
+        with BloqueioArquivo(self.cache_file):
+            atual = ler_json(self.cache_file, {})
+            if atual.get(cache_key, {}).get('access_token') == access_token:
+                del atual[cache_key]
+                escrever_json_atomico(self.cache_file, atual)
+            self.cache = atual
+
+    def carregar_registro(self, tenant_id):
+        """AuthenticationRecord serializado do último login interativo (conta usada nas renovações silenciosas)"""
+        return self.cache.get(f"{tenant_id}_registro_autenticacao")
+
+    def salvar_registro(self, tenant_id, registro):
+        self.cache[f"{tenant_id}_registro_autenticacao"] = registro
+        self._salvar_cache()
+
     def _token_valido(self, token_data):
         """Verifica se o token ainda é válido (com margem de segurança de 5 minutos)"""
-        from time import time
-        return token_data.get('expires_on', 0) > (time() + 300)
+        return token_data.get('expires_on', 0) > (time.time() + 300)
+
+# ---------------- Gerenciador de Token Compartilhado ----------------
+# Tempo máximo de um login interativo; enquanto isso os outros processos esperam o token dele
+TEMPO_LOGIN = 300
+
+class GerenciadorToken:
+    """
+    Mantém o token do Purview em memória para todos os workers do processo.
+    Só uma thread autentica por vez (as outras esperam e reaproveitam o token) e,
+    entre processos, um lock em token_cache.json.autenticacao faz com que só um
+    abra o navegador: os demais conferem o cache de novo ao pegar o lock.
+
+    Uma thread em segundo plano renova o token `margem_renovacao` segundos antes
+    de expirar, sempre em silêncio (conta do AuthenticationRecord salvo no primeiro
+    login, sem abrir navegador). A margem fica abaixo dos 5 minutos em que o MSAL
+    passa a devolver um token novo; antes disso ele devolve o mesmo token em cache.
+    """
+
+    def __init__(self, configuracoes, margem_renovacao=240, cache_file="token_cache.json"):
+        self.tenant_id = configuracoes['tenant_id']
+        self.scope = configuracoes['scope']
+        self.margem_renovacao = margem_renovacao
+        self.cache = CustomTokenCache(cache_file)
+        self._lock = threading.Lock()
+        self._credential = None
+        self._credential_silenciosa = None
+        self._token = None
+        self._expira_em = 0
+        self._rejeitado = None
+        self._parar = threading.Event()
+        self._thread = None
+
+    def obter_token(self):
+        """Devolve um token válido, autenticando só se ninguém tiver um"""
+        with self._lock:
+            if self._token and self._expira_em > time.time() + 60:
+                return self._token
+
+            # Quem pega o lock confere o cache de novo: outro processo pode ter autenticado enquanto isso
+            with BloqueioArquivo(f"{self.cache.cache_file}.autenticacao", timeout=TEMPO_LOGIN, expira_em=TEMPO_LOGIN):
+                self.cache.recarregar()
+                token_data = self.cache.encontrar_dados_token(self.scope, self.tenant_id)
+                if token_data and token_data['access_token'] != self._rejeitado:
+                    print("✅ Token recuperado do cache")
+                    self._token, self._expira_em = token_data['access_token'], token_data['expires_on']
+                    return self._token
+
+                print("🔐 Nenhum token válido encontrado no cache. Iniciando autenticação interativa...")
+                self._autenticar()
+            print("✅ Autenticação realizada com sucesso! Token salvo no cache.")
+            return self._token
+
+    def _criar_credencial(self, silenciosa=False):
+        """
+        Credencial com o cache persistente do azure-identity e a conta do último login.
+        silenciosa=True nunca abre o navegador (None se ainda não houve login interativo)
+        """
+        registro = self.cache.carregar_registro(self.tenant_id)
+        if silenciosa and registro is None:
+            return None
+        opcoes = {"tenant_id": self.tenant_id,
+                  "cache_persistence_options": TokenCachePersistenceOptions(name="purview_cache")}
+        if registro is not None:
+            opcoes["authentication_record"] = AuthenticationRecord.deserialize(registro)
+        if silenciosa:
+            opcoes["disable_automatic_authentication"] = True
+        return InteractiveBrowserCredential(**opcoes)
+
+    def _autenticar(self):
+        """Obtém um token novo, com login interativo se preciso (deve ser chamado com os locks)"""
+        if self._credential is None:
+            self._credential = self._criar_credencial()
+        try:
+            if self.cache.carregar_registro(self.tenant_id) is None:
+                # Primeiro login: guarda a conta para as renovações silenciosas
+                registro = self._credential.authenticate(scopes=[self.scope])
+                self.cache.salvar_registro(self.tenant_id, registro.serialize())
+            token_data = self._credential.get_token(self.scope)
+            if token_data.token == self._rejeitado:
+                # O cache do MSAL devolveu o token que o Purview recusou (401): novo login
+                self._credential.authenticate(scopes=[self.scope])
+                token_data = self._credential.get_token(self.scope)
+        except Exception as e:
+            print(f"❌ Erro na autenticação: {e}")
+            raise
+        self._guardar(token_data)
+
+    def _guardar(self, token_data):
+        self.cache.salvar_token(self.scope, self.tenant_id, token_data)
+        self._token, self._expira_em = token_data.token, token_data.expires_on
+        self._rejeitado = None
+
+    def invalidar(self, token_rejeitado=None):
+        """
+        Descarta o token recusado pelo Purview (resposta 401) na memória e em
+        token_cache.json; a próxima chamada autentica de novo
+        """
+        with self._lock:
+            rejeitado = token_rejeitado or self._token
+            if not rejeitado:
+                return
+            if rejeitado == self._token:
+                self._token, self._expira_em = None, 0
+            self._rejeitado = rejeitado
+            self.cache.remover_token(self.scope, self.tenant_id, rejeitado)
+
+    # ---- Renovação proativa ----
+    def iniciar_renovacao(self):
+        """Inicia a thread que renova o token antes de expirar"""
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._parar.clear()
+                self._thread = threading.Thread(target=self._loop_renovacao, name="renovacao-token", daemon=True)
+                self._thread.start()
+
+    def parar_renovacao(self):
+        self._parar.set()
+
+    def _loop_renovacao(self):
+        while not self._parar.is_set():
+            espera = max(self._expira_em - self.margem_renovacao - time.time(), 0) if self._token else 30
+            if self._parar.wait(min(espera, 300)):
+                return
+            expira_em = self._expira_em
+            if not self._token or expira_em - time.time() > self.margem_renovacao:
+                continue
+            # A chamada de rede fica fora do lock: os workers seguem usando o token atual
+            try:
+                if self._credential_silenciosa is None:
+                    self._credential_silenciosa = self._criar_credencial(silenciosa=True)
+                if self._credential_silenciosa is None:
+                    print("⚠️  Sem login interativo registrado: o token não será renovado em segundo plano")
+                    return
+                token_data = self._credential_silenciosa.get_token(self.scope)
+            except AuthenticationRequiredError:
+                print("⚠️  Renovação silenciosa do token exige novo login; ele será pedido na próxima chamada ao Purview")
+                self._parar.wait(60)
+                continue
+            except Exception as e:
+                print(f"⚠️  Falha ao renovar token em segundo plano: {e}")
+                self._parar.wait(60)
+                continue
+            if token_data.expires_on <= expira_em:
+                # O MSAL ainda devolveu o token em cache: tenta de novo mais tarde, sem girar em falso
+                self._parar.wait(30)
+                continue
+            with self._lock:
+                self._guardar(token_data)
+            print("🔄 Token do Purview renovado em segundo plano")
+
+_gerenciadores = {}
+_lock_gerenciadores = threading.Lock()
+
+def obter_gerenciador_token(configuracoes):
+    """Um gerenciador por tenant/scope, compartilhado por todo o processo"""
+    chave = (configuracoes['tenant_id'], configuracoes['scope'])
+    with _lock_gerenciadores:
+        if chave not in _gerenciadores:
+            _gerenciadores[chave] = GerenciadorToken(configuracoes)
+        return _gerenciadores[chave]
 
 # ---------------- Autenticação com Cache e Cookies ----------------
 def get_access_token(configuracoes):
@@ -109,50 +299,20 @@ def get_access_token(configuracoes):
     Usa InteractiveBrowserCredential com cache de token e cookies
     Tenta usar cache primeiro, só abre navegador se necessário
     """
-    tenant_id = configuracoes['tenant_id']
-    scope = configuracoes['scope']
-    
-    # Inicializar cache personalizado
-    cache = CustomTokenCache()
-    
-    # Tentar obter token do cache primeiro
-    token = cache.encontrar_token(scope, tenant_id)
-    if token:
-        print("✅ Token recuperado do cache")
-        return token
-    
-    print("🔐 Nenhum token válido encontrado no cache. Iniciando autenticação interativa...")
-    
-    # Configurar opções de persistência de cache
-    cache_options = TokenCachePersistenceOptions(name="purview_cache")
-    
-    # Criar credential com cache persistente
-    credential = InteractiveBrowserCredential(
-        tenant_id=tenant_id,
-        cache_persistence_options=cache_options
-    )
-    
-    try:
-        # Obter novo token
-        token_data = credential.get_token(scope)
-        
-        # Salvar no cache personalizado
-        cache.salvar_token(scope, tenant_id, token_data)
-        
-        print("✅ Autenticação realizada com sucesso! Token salvo no cache.")
-        return token_data.token
-        
-    except Exception as e:
-        print(f"❌ Erro na autenticação: {e}")
-        raise
+    return obter_gerenciador_token(configuracoes).obter_token()
 
 # ---------------- API Purview ----------------
+def cliente_purview(purview_account, token):
+    """
+    Cliente compartilhado (reaproveita a conexão TLS entre chamadas). Se o token vier
+    do GerenciadorToken, uma resposta 401 invalida o token e a chamada é repetida uma vez
+    """
+    gerenciador = getattr(token, "__self__", None)
+    invalidar = gerenciador.invalidar if isinstance(gerenciador, GerenciadorToken) else None
+    return obter_cliente(purview_account, token, invalidar_token=invalidar)
+
 def get_purview_entity(guid, token, purview_account):
-    url = f"https://{purview_account}.purview.azure.com/catalog/api/atlas/v2/entity/guid/{guid}"
-    headers = {"Authorization": f"Bearer {token}"}
-    response = requests.get(url, headers=headers)
-    response.raise_for_status()
-    return response.json()
+    return cliente_purview(purview_account, token).buscar_entidade(guid)
 
 # ---------------- Funções para Limpeza de Dados Complexos ----------------
 def limpar_dados_para_yaml(dados):
@@ -240,14 +400,7 @@ def buscar_schema_e_colunas(guid, token, purview_account, entity_data):
         # Buscar dados COMPLETOS do schema attached (não filtrar)
         schema_data = get_purview_entity(attached_schema_guid, token, purview_account)
         
-        return {
-            "attachedSchema": {
-                "guid": attached_schema_guid,
-                "typeName": attached_schema.get("typeName"),
-                "displayText": attached_schema.get("displayText"),
-                "data": schema_data  # Dados completos do schema
-            }
-        }
+        return montar_schema_attached(attached_schema, schema_data)
         
     except Exception as e:
         print(f"⚠️  Erro ao buscar schema attached: {e}")
@@ -255,6 +408,17 @@ def buscar_schema_e_colunas(guid, token, purview_account, entity_data):
         traceback.print_exc()
         return None
 
+def montar_schema_attached(attached_schema, schema_data):
+    """Monta o bloco attachedSchema do YAML a partir da referência e dos dados do schema"""
+    return {
+        "attachedSchema": {
+            "guid": attached_schema.get("guid"),
+            "typeName": attached_schema.get("typeName"),
+            "displayText": attached_schema.get("displayText"),
+            "data": schema_data  # Dados completos do schema
+        }
+    }
+
 # ---------------- Salvar YAML Completo ----------------
 def salvar_yaml_completo(guid, entity_data, purview_account, schema_data=None):
     pasta = "Historico"
@@ -302,6 +466,131 @@ def salvar_yaml_completo(guid, entity_data, purview_account, schema_data=None):
     print(f"   - Atributos de relacionamento: {relationship_attrs}")
     print(f"   - Schema attached incluído: {has_schema}")
 
+# ---------------- Execução da Etapa (importável) ----------------
+TIPOS_COM_SCHEMA = ("aws_s3_v2_resource_set",)
+
+def processar_entidade(guid, entity_data, purview_account, schema_entity=None, buscar_schema=None):
+    """
+    Monta e grava {guid}_purview.yaml a partir da entidade já buscada.
+    O schema attached pode vir pronto (`schema_entity`) ou ser buscado por `buscar_schema`.
+    """
+    print("✅ Dados da entidade obtidos com sucesso")
+
+    # Verificar se é aws_s3_v2_resource_set e buscar schema attached se necessário
+    schema_data = None
+    entity_type = entity_data.get("entity", {}).get("typeName")
+    print(f"🔍 Tipo da entidade: {entity_type}")
+
+    if entity_type in TIPOS_COM_SCHEMA:
+        print("🎯 Entidade identificada como aws_s3_v2_resource_set. Buscando schema attached...")
+
+        # Debug: mostrar relationshipAttributes para verificar estrutura
+        relationship_attrs = entity_data.get("entity", {}).get("relationshipAttributes", {})
+        print(f"🔍 RelationshipAttributes keys: {list(relationship_attrs.keys())}")
+        if "attachedSchema" in relationship_attrs:
+            print(f"🔍 attachedSchema encontrado: {relationship_attrs['attachedSchema']}")
+
+        if schema_entity is not None:
+            schema_data = montar_schema_attached(relationship_attrs["attachedSchema"][0], schema_entity)
+        elif buscar_schema is not None:
+            schema_data = buscar_schema()
+
+        if schema_data:
+            print("✅ Schema attached e colunas obtidos com sucesso")
+            # Debug: mostrar informações do schema
+            schema_guid = schema_data["attachedSchema"]["guid"]
+            schema_type = schema_data["attachedSchema"]["typeName"]
+            print(f"📋 Schema encontrado - GUID: {schema_guid}, Type: {schema_type}")
+        else:
+            print("⚠️  Não foi possível obter o schema attached")
+    else:
+        print(f"ℹ️  Tipo de entidade {entity_type} não requer busca de schema adicional")
+
+    # Salvar YAML com 100% das informações (incluindo schema se disponível)
+    salvar_yaml_completo(guid, entity_data, purview_account, schema_data)
+
+    return os.path.join("Historico", f"{guid}_purview.yaml")
+
+def executar_etapa2(guid, configuracoes=None, token=None):
+    """
+    Busca a entidade (e o schema attached, se houver) e grava {guid}_purview.yaml.
+    Configurações e token podem ser reaproveitados por quem chama várias vezes.
+    """
+    if configuracoes is None:
+        print("📁 Carregando configurações do arquivo Purview.env...")
+        configuracoes = carregar_configuracoes()
+
+    purview_account = configuracoes['purview_account_name']
+    print(f"✅ Configurações carregadas. Purview Account: {purview_account}")
+
+    # Autenticação com cache (o token é a função do gerenciador, que reautentica após um 401)
+    if token is None:
+        token = obter_gerenciador_token(configuracoes).obter_token
+        token()
+
+    print(f"📊 Buscando dados completos do GUID: {guid}")
+
+    # Buscar dados da entidade
+    entity_data = get_purview_entity(guid, token, purview_account)
+
+    return processar_entidade(
+        guid, entity_data, purview_account,
+        buscar_schema=lambda: buscar_schema_e_colunas(guid, token, purview_account, entity_data)
+    )
+
+def executar_etapa2_lote(guids, configuracoes=None, token=None):
+    """
+    Versão em lote da Etapa 2: as entidades e depois os schemas attached são
+    buscados pelo endpoint bulk (poucas requisições para muitos GUIDs) e a
+    resposta é separada nos {guid}_purview.yaml de cada um.
+    Retorna {guid: caminho do YAML ou exceção}
+    """
+    if configuracoes is None:
+        configuracoes = carregar_configuracoes()
+    purview_account = configuracoes['purview_account_name']
+    if token is None:
+        token = obter_gerenciador_token(configuracoes).obter_token
+        token()
+
+    cliente = cliente_purview(purview_account, token)
+    requisicoes_antes = cliente.requisicoes
+
+    print(f"📦 Buscando {len(guids)} entidades via bulk...")
+    entidades = cliente.buscar_entidades_bulk(guids)
+
+    # Schemas attached de todas as entidades que precisam deles, também em bulk
+    schemas_guids = {}
+    for guid, entity_data in entidades.items():
+        if entity_data["entity"].get("typeName") in TIPOS_COM_SCHEMA:
+            attached = entity_data["entity"].get("relationshipAttributes", {}).get("attachedSchema") or []
+            if attached and attached[0].get("guid"):
+                schemas_guids[guid] = attached[0]["guid"]
+    schemas = cliente.buscar_entidades_bulk(list(schemas_guids.values())) if schemas_guids else {}
+
+    resultados = {}
+    for guid in guids:
+        if guid not in entidades:
+            resultados[guid] = LookupError(f"GUID {guid} não encontrado no Purview")
+            print(f"❌ {resultados[guid]}")
+            continue
+        schema = schemas.get(schemas_guids.get(guid))
+        try:
+            resultados[guid] = processar_entidade(guid, entidades[guid], purview_account, schema_entity=schema)
+        except Exception as e:
+            resultados[guid] = e
+
+    print(f"📈 {len(guids)} GUIDs consultados com {cliente.requisicoes - requisicoes_antes} requisições ao Purview")
+    metricas, limite = cliente.metricas_por_endpoint()
+    for endpoint, m in metricas.items():
+        print(f"   - {endpoint}: {m['requisicoes']} req, {m['throttled']} throttled, {m['retries']} retries, "
+              f"{m['espera_total']}s em espera, latência média {m['latencia_media']}s")
+    print(f"   - Concorrência adaptativa atual: {limite}")
+    if cliente.cache is not None:
+        stats = cliente.cache.estatisticas()
+        print(f"💾 Cache Purview: {stats['hits']} hits, {stats['misses']} misses, "
+              f"{stats['revalidados']} revalidados, {stats['itens']} itens ({stats['bytes']} bytes)")
+    return resultados
+
 # ---------------- Execução Principal ----------------
 if __name__ == "__main__":
     if len(sys.argv) < 2:
@@ -311,51 +600,7 @@ if __name__ == "__main__":
     guid = sys.argv[1]
 
     try:
-        # Carregar configurações do arquivo
-        print("📁 Carregando configurações do arquivo Purview.env...")
-        configuracoes = carregar_configuracoes()
-        
-        purview_account = configuracoes['purview_account_name']
-        print(f"✅ Configurações carregadas. Purview Account: {purview_account}")
-        
-        # Autenticação com cache
-        token = get_access_token(configuracoes)
-        
-        print(f"📊 Buscando dados completos do GUID: {guid}")
-        
-        # Buscar dados da entidade
-        entity_data = get_purview_entity(guid, token, purview_account)
-        print("✅ Dados da entidade obtidos com sucesso")
-        
-        # Verificar se é aws_s3_v2_resource_set e buscar schema attached se necessário
-        schema_data = None
-        entity_type = entity_data.get("entity", {}).get("typeName")
-        print(f"🔍 Tipo da entidade: {entity_type}")
-        
-        if entity_type == "aws_s3_v2_resource_set":
-            print("🎯 Entidade identificada como aws_s3_v2_resource_set. Buscando schema attached...")
-            
-            # Debug: mostrar relationshipAttributes para verificar estrutura
-            relationship_attrs = entity_data.get("entity", {}).get("relationshipAttributes", {})
-            print(f"🔍 RelationshipAttributes keys: {list(relationship_attrs.keys())}")
-            if "attachedSchema" in relationship_attrs:
-                print(f"🔍 attachedSchema encontrado: {relationship_attrs['attachedSchema']}")
-            
-            schema_data = buscar_schema_e_colunas(guid, token, purview_account, entity_data)
-            
-            if schema_data:
-                print("✅ Schema attached e colunas obtidos com sucesso")
-                # Debug: mostrar informações do schema
-                schema_guid = schema_data["attachedSchema"]["guid"]
-                schema_type = schema_data["attachedSchema"]["typeName"]
-                print(f"📋 Schema encontrado - GUID: {schema_guid}, Type: {schema_type}")
-            else:
-                print("⚠️  Não foi possível obter o schema attached")
-        else:
-            print(f"ℹ️  Tipo de entidade {entity_type} não requer busca de schema adicional")
-        
-        # Salvar YAML com 100% das informações (incluindo schema se disponível)
-        salvar_yaml_completo(guid, entity_data, purview_account, schema_data)
+        executar_etapa2(guid)
         
         print("🎉 Processamento concluído com sucesso!")
         
@@ -1,8 +1,8 @@
 import os
 import sys
 import yaml
-import requests
 from azure.identity import InteractiveBrowserCredential
+from purview_client import obter_cliente
 
 # Variáveis de ambiente (apenas Purview account name necessário)
 PURVIEW_ACCOUNT = os.getenv("PURVIEW_ACCOUNT_NAME")
@@ -19,18 +19,10 @@ def get_access_token():
 
 # ---------------- API Purview ----------------
 def get_purview_entity(guid, token):
-    url = f"https://{PURVIEW_ACCOUNT}.purview.azure.com/catalog/api/atlas/v2/entity/guid/{guid}"
-    headers = {"Authorization": f"Bearer {token}"}
-    response = requests.get(url, headers=headers)
-    response.raise_for_status()
-    return response.json()
+    return obter_cliente(PURVIEW_ACCOUNT, token).buscar_entidade(guid)
 
 def get_purview_lineage(guid, token):
-    url = f"https://{PURVIEW_ACCOUNT}.purview.azure.com/catalog/api/atlas/v2/lineage/{guid}?depth=3"
-    headers = {"Authorization": f"Bearer {token}"}
-    response = requests.get(url, headers=headers)
-    response.raise_for_status()
-    return response.json()
+    return obter_cliente(PURVIEW_ACCOUNT, token).buscar_linhagem(guid, profundidade=3)
 
 # ---------------- Salvar YAML ----------------
 def salvar_yaml_purview(guid, entity, lineage):
@@ -75,8 +67,11 @@ if __name__ == "__main__":
         print("✅ Autenticação realizada com sucesso!")
         
         print(f"📊 Buscando dados do GUID: {guid}")
-        entity = get_purview_entity(guid, token)
-        lineage = get_purview_lineage(guid, token)
+        # Entidade e linhagem são buscadas em paralelo
+        pacote = obter_cliente(PURVIEW_ACCOUNT, token).buscar_pacote(guid, incluir_linhagem=True, tipos_com_schema=())
+        entity, lineage = pacote["entity"], pacote["lineage"]
+        if isinstance(lineage, Exception):
+            raise lineage
         
         salvar_yaml_purview(guid, entity, lineage)
         
@@ -2,7 +2,8 @@ import os
 import sys
 import yaml
 import pyodbc
-import pandas as pd
+from amostragem import executar_amostragem, salvar_metadados_amostra, escritor_amostra
+from dremio_flight import ConexaoFlight, transporte_configurado
 
 def carregar_yaml(guid):
     caminho = os.path.join("Historico", f"{guid}.yaml")
@@ -12,7 +13,7 @@ def carregar_yaml(guid):
     with open(caminho, "r", encoding="utf-8") as f:
         return yaml.safe_load(f)
 
-def conectar_dremio():
+def conectar_odbc():
     conn_str = (
         "Driver={Dremio ODBC Driver 64-bit};"
         "ConnectionType=Direct;"
@@ -24,18 +25,43 @@ def conectar_dremio():
     )
     return pyodbc.connect(conn_str, autocommit=True)
 
-def gerar_amostra(guid, tabela):
-    conn = conectar_dremio()
-    query = f'SELECT * FROM "{tabela}" ORDER BY RANDOM() LIMIT 200'
-    df = pd.read_sql(query, conn)
-    conn.close()
+def conectar_dremio(transporte=None):
+    """Conecta pelo transporte de DREMIO_TRANSPORTE; se o Flight falhar, usa ODBC"""
+    if (transporte or transporte_configurado()) == "flight":
+        try:
+            conn = ConexaoFlight(
+                os.getenv("DREMIO_HOST"),
+                os.getenv("DREMIO_FLIGHT_PORT", "32010"),
+                os.getenv("DREMIO_USER"),
+                os.getenv("DREMIO_PASSWORD"),
+                tls=os.getenv("DREMIO_FLIGHT_TLS", "false").lower() == "true"
+            )
+            return conn, "flight"
+        except Exception as e:
+            print(f"⚠️  Arrow Flight indisponível ({e}). Usando ODBC.")
+    return conectar_odbc(), "odbc"
 
+def gerar_amostra(guid, tabela, config=None, transporte=None):
     pasta = "Historico"
-    os.makedirs(pasta, exist_ok=True)
-    caminho_csv = os.path.join(pasta, f"{guid}_amostra.csv")
-    df.to_csv(caminho_csv, index=False, encoding="utf-8")
 
-    print(f"✅ Amostra salva em {caminho_csv}")
+    conn, transporte = conectar_dremio(transporte)
+    try:
+        with escritor_amostra(guid, tabela, pasta) as escritor:
+            _, _, info = executar_amostragem(conn, tabela, config, escritor)
+        info["transporte"] = transporte
+        info["arquivos"] = escritor.caminhos
+    finally:
+        conn.close()
+    salvar_metadados_amostra(guid, tabela, info, pasta)
+
+    print(f"✅ Amostra salva em {', '.join(escritor.caminhos)} ({info['estrategia']} via {transporte}, query em {info['tempo_query']}s)")
+
+def executar_etapa3(guid):
+    """Lê a tabela do YAML da Etapa 1 e gera a amostra (usada pelo executor em processo)"""
+    tabela = carregar_yaml(guid).get("dremio_table")
+    if not tabela:
+        raise ValueError("⚠️ Campo 'dremio_table' não encontrado no YAML da Etapa 1.")
+    gerar_amostra(guid, tabela)
 
 if __name__ == "__main__":
     if len(sys.argv) < 2:
@@ -45,12 +71,7 @@ if __name__ == "__main__":
     guid = sys.argv[1]
 
     try:
-        dados = carregar_yaml(guid)
-        tabela = dados.get("dremio_table")
-        if not tabela:
-            raise ValueError("⚠️ Campo 'dremio_table' não encontrado no YAML da Etapa 1.")
-
-        gerar_amostra(guid, tabela)
+        executar_etapa3(guid)
 
     except Exception as e:
         print(f"❌ Erro na Etapa 3: {e}")
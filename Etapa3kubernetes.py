@@ -1,9 +1,16 @@
 import os
 import sys
 import yaml
+import atexit
+import time
 import pyodbc
-import pandas as pd
+import threading
 from pathlib import Path
+from contextlib import contextmanager
+from amostragem import executar_amostragem, salvar_metadados_amostra, escritor_amostra
+from dremio_flight import ConexaoFlight, transporte_configurado
+from pool_dremio import PoolDremio, configuracao_pool
+from schema_dremio import ler_schemas, salvar_schema
 
 # ---------------- Função para carregar dados do YAML (Etapa 1) ----------------
 def carregar_yaml(guid):
@@ -15,84 +22,158 @@ def carregar_yaml(guid):
         return yaml.safe_load(f)
 
 # ---------------- Conectar ao Dremio usando Docker Secrets ----------------
-def conectar_dremio():
+SECRETS_PATH = Path('/run/secrets')
+
+def ler_secret(nome_secret, valor_default=None):
+    """Lê um secret ou usa valor padrão/fallback"""
+    secret_file = SECRETS_PATH / nome_secret
+    
+    if secret_file.exists():
+        with open(secret_file, 'r') as f:
+            return f.read().strip()
+    elif valor_default is not None:
+        return valor_default
+    else:
+        raise FileNotFoundError(f"Secret {nome_secret} não encontrado e nenhum valor padrão definido")
+
+def conectar_odbc():
     """
-    Conecta ao Dremio lendo credenciais de Docker Secrets
+    Conecta ao Dremio via ODBC lendo credenciais de Docker Secrets
     Secrets esperados: dremio-host, dremio-port, dremio-user, dremio-password
     """
-    secrets_path = Path('/run/secrets')
+    # Lê secrets com fallbacks
+    host = ler_secret('dremio-host')
+    port = ler_secret('dremio-port', '31010')  # Porta padrão
+    user = ler_secret('dremio-user')
+    password = ler_secret('dremio-password')
     
-    def ler_secret(nome_secret, valor_default=None):
-        """Lê um secret ou usa valor padrão/fallback"""
-        secret_file = secrets_path / nome_secret
-        
-        if secret_file.exists():
-            with open(secret_file, 'r') as f:
-                return f.read().strip()
-        elif valor_default is not None:
-            return valor_default
-        else:
-            raise FileNotFoundError(f"Secret {nome_secret} não encontrado e nenhum valor padrão definido")
+    # Construção da string de conexão
+    conn_str = (
+        "Driver={Dremio ODBC Driver 64-bit};"
+        "ConnectionType=Direct;"
+        f"HOST={host};"
+        f"PORT={port};"
+        f"UID={user};"
+        f"PWD={password};"
+        "AuthenticationType=Plain;"
+        "UseUnicode=Yes;"
+        "CharacterSet=UTF-8;"
+    )
     
+    print(f"🔗 Conectando ao Dremio (ODBC) em {host}:{port}...")
+    return pyodbc.connect(conn_str, autocommit=True, timeout=30)
+
+def conectar_flight():
+    """
+    Conecta ao Dremio via Arrow Flight com os mesmos secrets do ODBC
+    Secrets opcionais: dremio-flight-port (padrão 32010), dremio-flight-tls (true/false)
+    """
+    host = ler_secret('dremio-host')
+    port = ler_secret('dremio-flight-port', '32010')
+    tls = ler_secret('dremio-flight-tls', 'false').lower() == 'true'
+    
+    print(f"🔗 Conectando ao Dremio (Arrow Flight) em {host}:{port}...")
+    return ConexaoFlight(host, port, ler_secret('dremio-user'), ler_secret('dremio-password'), tls=tls)
+
+def conectar_dremio(transporte=None):
+    """
+    Abre a conexão pelo transporte configurado (DREMIO_TRANSPORTE=odbc|flight).
+    Se o Flight não estiver disponível ou falhar, usa ODBC como fallback.
+    Retorna (conexão, transporte usado)
+    """
+    transporte = transporte or transporte_configurado()
     try:
-        # Lê secrets com fallbacks
-        host = ler_secret('dremio-host')
-        port = ler_secret('dremio-port', '31010')  # Porta padrão
-        user = ler_secret('dremio-user')
-        password = ler_secret('dremio-password')
-        
-        # Construção da string de conexão
-        conn_str = (
-            "Driver={Dremio ODBC Driver 64-bit};"
-            "ConnectionType=Direct;"
-            f"HOST={host};"
-            f"PORT={port};"
-            f"UID={user};"
-            f"PWD={password};"
-            "AuthenticationType=Plain;"
-            "UseUnicode=Yes;"
-            "CharacterSet=UTF-8;"
-        )
+        if transporte == "flight":
+            try:
+                connection = conectar_flight()
+                print("✅ Conexão estabelecida com sucesso")
+                return connection, "flight"
+            except Exception as e:
+                print(f"⚠️  Arrow Flight indisponível ({e}). Usando ODBC.")
         
-        print(f"🔗 Conectando ao Dremio em {host}:{port}...")
-        connection = pyodbc.connect(conn_str, autocommit=True, timeout=30)
+        connection = conectar_odbc()
         print("✅ Conexão estabelecida com sucesso")
-        return connection
+        return connection, "odbc"
         
     except Exception as e:
         print(f"❌ Erro ao conectar ao Dremio: {e}")
         raise
 
+# ---------------- Pool de Conexões (compartilhado entre GUIDs) ----------------
+_pool = None
+_lock_pool = threading.Lock()
+
+def obter_pool():
+    """Pool do processo; None se desligado por DREMIO_POOL=0"""
+    global _pool
+    with _lock_pool:
+        if _pool is None:
+            config = configuracao_pool()
+            if not config["ativo"]:
+                return None
+            _pool = PoolDremio(conectar_dremio, config["max_conexoes"], config["max_ocioso"])
+            atexit.register(fechar_pool)
+        return _pool
+
+def fechar_pool():
+    if _pool is not None:
+        _pool.fechar()
+
+def estatisticas():
+    """Métricas do pool de conexões, lidas pelo executor ao final do lote"""
+    return {"pool_dremio": _pool.estatisticas()} if _pool is not None else {}
+
+@contextmanager
+def conexao_dremio(transporte=None):
+    """
+    Empresta uma conexão do pool. Com transporte explícito (ou pool desligado)
+    abre uma conexão só para este uso e a fecha no final.
+    """
+    pool = obter_pool() if transporte is None else None
+    if pool is not None:
+        with pool.conexao() as (conn, transporte):
+            yield conn, transporte
+        return
+
+    conn, transporte = conectar_dremio(transporte)
+    try:
+        yield conn, transporte
+    finally:
+        conn.close()
+        print("🔌 Conexão fechada")
+
 # ---------------- Rodar query e salvar CSV ----------------
-def gerar_amostra(guid, tabela):
+def gerar_amostra(guid, tabela, config=None, transporte=None):
     """
-    Gera amostra aleatória da tabela e salva como CSV
+    Gera amostra da tabela com a estratégia configurada (ver amostragem.py),
+    salva como Parquet (tipado) e/ou CSV (AMOSTRA_FORMATOS) e registra estratégia,
+    transporte e tempos em {guid}_amostra_meta.yaml.
+    As linhas são lidas em lotes e gravadas conforme chegam (memória limitada a um lote).
     """
-    conn = None
     try:
-        conn = conectar_dremio()
-        
-        # Query com amostragem aleatória
-        query = f'SELECT * FROM "{tabela}" ORDER BY RANDOM() LIMIT 200'
-        print(f"📊 Executando query: {query}")
-        
-        df = pd.read_sql(query, conn)
-        print(f"✅ Query executada. {len(df)} registros recuperados")
-        
-        # Salvar CSV
         pasta = "Historico"
-        os.makedirs(pasta, exist_ok=True)
-        caminho_csv = os.path.join(pasta, f"{guid}_amostra.csv")
-        df.to_csv(caminho_csv, index=False, encoding="utf-8")
+        with escritor_amostra(guid, tabela, pasta) as escritor:
+            with conexao_dremio(transporte) as (conn, transporte):
+                colunas, _, info = executar_amostragem(conn, tabela, config, escritor)
+        info["transporte"] = transporte
+        info["arquivos"] = escritor.caminhos
+        print(f"✅ Query executada em {info['tempo_query']}s via {transporte}. {info['linhas']} registros recuperados")
+        caminho_meta = salvar_metadados_amostra(guid, tabela, info, pasta)
         
         # Estatísticas básicas
         print(f"📈 Estatísticas da amostra:")
-        print(f"   - Total de registros: {len(df)}")
-        print(f"   - Colunas: {len(df.columns)}")
-        print(f"   - Tamanho do arquivo: {os.path.getsize(caminho_csv)} bytes")
-        print(f"💾 Amostra salva em: {caminho_csv}")
+        print(f"   - Estratégia: {info['estrategia']} ({transporte})")
+        print(f"   - Total de registros: {info['linhas']}")
+        print(f"   - Colunas: {info['colunas']}")
+        if info.get("estatisticas_tabela"):
+            print(f"   - Linhas na tabela inteira: {info['estatisticas_tabela']['linhas']}")
+        if info["celulas_truncadas"]:
+            print(f"   - Células truncadas: {info['celulas_truncadas']} (limite de {info['parametros']['max_bytes_celula']} bytes)")
+        for caminho in escritor.caminhos:
+            print(f"   - Tamanho de {os.path.basename(caminho)}: {os.path.getsize(caminho)} bytes")
+        print(f"💾 Amostra salva em: {', '.join(escritor.caminhos)} (metadados em {caminho_meta})")
         
-        return caminho_csv
+        return escritor.caminhos[0]
         
     except pyodbc.Error as e:
         print(f"❌ Erro de banco de dados: {e}")
@@ -100,10 +181,49 @@ def gerar_amostra(guid, tabela):
     except Exception as e:
         print(f"❌ Erro inesperado: {e}")
         raise
-    finally:
-        if conn:
-            conn.close()
-            print("🔌 Conexão fechada")
+
+# ---------------- Somente Schema (sem ler dados) ----------------
+def gerar_schemas(tabelas_por_guid, transporte=None):
+    """
+    Lê o schema de várias tabelas em uma única consulta ao INFORMATION_SCHEMA
+    e grava {guid}_schema.yaml para cada GUID. Retorna {guid: caminho}
+    """
+    inicio = time.perf_counter()
+    with conexao_dremio(transporte) as (conn, transporte):
+        schemas = ler_schemas(conn, list(tabelas_por_guid.values()))
+    duracao = time.perf_counter() - inicio
+
+    caminhos = {}
+    for guid, tabela in tabelas_por_guid.items():
+        fonte, colunas = schemas[tabela]
+        caminhos[guid] = salvar_schema(guid, tabela, fonte, colunas, duracao)
+    print(f"📐 Schema de {len(tabelas_por_guid)} tabela(s) lido em {duracao:.2f}s via {transporte}")
+    return caminhos
+
+def executar_schema(guid):
+    """Gera só o schema da tabela do GUID ({guid}_schema.yaml), sem amostra"""
+    tabela = carregar_yaml(guid).get("dremio_table")
+    if not tabela:
+        raise ValueError("⚠️ Campo 'dremio_table' não encontrado no YAML da Etapa 1.")
+    return gerar_schemas({guid: tabela})[guid]
+
+def executar_schema_lote(guids):
+    """
+    Schema de vários GUIDs com uma consulta só. Retorna {guid: caminho ou exceção};
+    GUIDs sem YAML/tabela voltam com a exceção e os demais seguem normalmente
+    """
+    resultados, tabelas = {}, {}
+    for guid in guids:
+        try:
+            tabela = carregar_yaml(guid).get("dremio_table")
+            if not tabela:
+                raise ValueError("⚠️ Campo 'dremio_table' não encontrado no YAML da Etapa 1.")
+            tabelas[guid] = tabela
+        except Exception as e:
+            resultados[guid] = e
+    if tabelas:
+        resultados.update(gerar_schemas(tabelas))
+    return resultados
 
 # ---------------- Validação de Secrets ----------------
 def validar_secrets():
@@ -130,14 +250,27 @@ def validar_secrets():
     
     return True
 
+# ---------------- Execução da Etapa (importável) ----------------
+def executar_etapa3(guid):
+    """Lê a tabela do YAML da Etapa 1 e gera a amostra"""
+    dados = carregar_yaml(guid)
+    tabela = dados.get("dremio_table")
+
+    if not tabela:
+        raise ValueError("⚠️ Campo 'dremio_table' não encontrado no YAML da Etapa 1.")
+
+    print(f"📋 Tabela alvo: {tabela}")
+    return gerar_amostra(guid, tabela)
+
 # ---------------- Execução Principal ----------------
 if __name__ == "__main__":
     if len(sys.argv) < 2:
-        print("❌ Uso: python Etapa3.py <GUID>")
+        print("❌ Uso: python Etapa3.py <GUID> [--somente-schema]")
         print("💡 Exemplo: python Etapa3.py 123e4567-e89b-12d3-a456-426614174000")
         sys.exit(1)
 
     guid = sys.argv[1]
+    somente_schema = "--somente-schema" in sys.argv[2:]
     print(f"🚀 Iniciando Etapa 3 para GUID: {guid}")
 
     try:
@@ -145,20 +278,11 @@ if __name__ == "__main__":
         if not validar_secrets():
             sys.exit(1)
         
-        # Carrega configuração do YAML
-        dados = carregar_yaml(guid)
-        tabela = dados.get("dremio_table")
-        
-        if not tabela:
-            raise ValueError("⚠️ Campo 'dremio_table' não encontrado no YAML da Etapa 1.")
-
-        print(f"📋 Tabela alvo: {tabela}")
-        
-        # Gera amostra
-        caminho_csv = gerar_amostra(guid, tabela)
+        # Carrega configuração do YAML e gera amostra (ou só o schema)
+        caminho_amostra = executar_schema(guid) if somente_schema else executar_etapa3(guid)
         
         print(f"🎉 Etapa 3 concluída com sucesso!")
-        print(f"📁 Arquivo gerado: {caminho_csv}")
+        print(f"📁 Arquivo gerado: {caminho_amostra}")
 
     except FileNotFoundError as e:
         print(f"❌ Arquivo não encontrado: {e}")
@@ -1,56 +1,199 @@
 import os
 import sys
 import yaml
-import asyncio
-from playwright.async_api import async_playwright
+import atexit
+import shutil
+import tempfile
+import threading
+from pool_navegador import configuracao_navegador, criar_navegador
+from cache_documentos import criar_cache_documentos
+from texto_documento import extrair_markdown
 
 # ---------------- Carregar YAML ----------------
 def carregar_yaml(guid):
     caminho = os.path.join("Historico", f"{guid}.yaml")
     if not os.path.exists(caminho):
         raise FileNotFoundError(f"❌ Arquivo {caminho} não encontrado. Rode a Etapa 1 antes.")
-    
+
     with open(caminho, "r", encoding="utf-8") as f:
         return yaml.safe_load(f)
 
-# ---------------- Função assíncrona para baixar PDFs ----------------
-async def baixar_pdfs(guid, links):
+# ---------------- Pool de Navegador (compartilhado entre GUIDs) ----------------
+_pool = None
+_lock_pool = threading.Lock()
+
+def obter_pool():
+    """Navegador do processo; None se desligado por ETAPA4_POOL=0"""
+    global _pool
+    with _lock_pool:
+        if _pool is None:
+            config = configuracao_navegador()
+            if not config["ativo"]:
+                return None
+            _pool = criar_navegador(config)
+            atexit.register(fechar_pool)
+        return _pool
+
+def fechar_pool():
+    if _pool is not None:
+        _pool.fechar()
+
+# ---------------- Cache de Documentos (compartilhado entre GUIDs) ----------------
+_cache = None
+_cache_criado = False
+
+def obter_cache():
+    """Cache de documentos do processo; None se desligado por DOCS_CACHE=0"""
+    global _cache, _cache_criado
+    with _lock_pool:
+        if not _cache_criado:
+            _cache = criar_cache_documentos()
+            _cache_criado = True
+        return _cache
+
+def estatisticas():
+    """Métricas do navegador e do cache de documentos, lidas pelo executor ao final do lote"""
+    metricas = {}
+    if _pool is not None:
+        metricas["navegador"] = _pool.estatisticas()
+    if _cache is not None:
+        metricas["cache_docs"] = _cache.estatisticas()
+    return metricas
+
+# ---------------- Formatos ----------------
+# md: texto do conteúdo principal (títulos, listas e tabelas), lido direto pela Etapa 5
+# pdf: página renderizada em A4, só como arquivo de consulta
+FORMATOS = ("md", "pdf")
+
+def formatos_documentos():
+    """ETAPA4_FORMATOS: lista separada por vírgula (padrão "md"; use "md,pdf" para guardar também o PDF)"""
+    formatos = [f.strip().lower() for f in os.getenv("ETAPA4_FORMATOS", "md").split(",") if f.strip()]
+    invalidos = [f for f in formatos if f not in FORMATOS]
+    if invalidos or not formatos:
+        raise ValueError(f"⚠️ Formato de documento inválido: {invalidos}. Use um ou mais de {FORMATOS}")
+    return formatos
+
+def _validadores(resposta):
+    headers = resposta.headers if resposta is not None else {}
+    return {k: headers.get(k) for k in ("etag", "last-modified")}
+
+def gerar_pdf(caminho_pdf):
+    """
+    Ação de renderização: salva a página carregada como PDF A4 (via arquivo
+    temporário) e devolve o caminho com os validadores HTTP da resposta
+    """
+    async def acao(page, resposta):
+        caminho_tmp = f"{caminho_pdf}.tmp"
+        await page.pdf(path=caminho_tmp, format="A4")
+        os.replace(caminho_tmp, caminho_pdf)
+        return caminho_pdf, _validadores(resposta)
+    return acao
+
+def gerar_markdown(caminho_md):
+    """Ação de renderização: extrai o texto do DOM e salva como markdown (sem gerar PDF)"""
+    async def acao(page, resposta):
+        texto = await extrair_markdown(page)
+        caminho_tmp = f"{caminho_md}.tmp"
+        with open(caminho_tmp, "w", encoding="utf-8") as f:
+            f.write(texto)
+        os.replace(caminho_tmp, caminho_md)
+        return caminho_md, _validadores(resposta)
+    return acao
+
+ACOES = {"md": gerar_markdown, "pdf": gerar_pdf}
+# O PDF é o arquivo de consulta: renderizado com imagens e fontes (sem o bloqueio de ETAPA4_BLOQUEAR)
+FORMATOS_COMPLETOS = ("pdf",)
+
+# ---------------- Baixar Documentos ----------------
+def renderizar_links(pool, links, caminho_para, formato="pdf"):
+    """Renderiza os links em paralelo no pool. Retorna {link: (caminho, validadores) ou exceção}"""
+    itens = [(link, ACOES[formato](caminho_para(link))) for link in links]
+    return dict(zip(links, pool.renderizar(itens, bloquear_recursos=formato not in FORMATOS_COMPLETOS)))
+
+def baixar_formato(pool, cache, destinos, formato):
+    """Garante os documentos de um formato nos destinos {link: [caminhos]}. Retorna {link: None ou exceção}"""
+    if cache is None:
+        resultados = {}
+        for link, r in renderizar_links(pool, list(destinos), lambda link: destinos[link][0], formato).items():
+            resultados[link] = r if isinstance(r, Exception) else None
+            for copia in ([] if isinstance(r, Exception) else destinos[link][1:]):
+                shutil.copyfile(destinos[link][0], copia)
+        return resultados
+
+    pasta_tmp = os.path.join(cache.diretorio, "tmp")
+    os.makedirs(pasta_tmp, exist_ok=True)
+
+    def renderizar_para_cache(pendentes):
+        caminhos = {}
+        for link in pendentes:
+            fd, caminhos[link] = tempfile.mkstemp(dir=pasta_tmp, suffix=f".{formato}")
+            os.close(fd)
+        renderizados = renderizar_links(pool, pendentes, caminhos.get, formato)
+        for link, r in renderizados.items():
+            if isinstance(r, Exception) and os.path.exists(caminhos[link]):
+                os.remove(caminhos[link])
+        return renderizados
+
+    return cache.obter(destinos, formato, renderizar_para_cache, pool.revalidar)
+
+def baixar_documentos(guid, links, formatos=None):
+    """
+    Renderiza os links do GUID em paralelo no navegador compartilhado e grava
+    {guid}_docN.md (texto) e/ou {guid}_docN.pdf conforme ETAPA4_FORMATOS. Com o
+    cache de documentos, páginas já baixadas (por este ou outro GUID) são só
+    ligadas aos artefatos. Com o pool desligado, abre um navegador só para
+    este GUID e o fecha no final. Links que falham (depois das retentativas)
+    são avisados e pulados.
+    """
     pasta = "Historico"
     os.makedirs(pasta, exist_ok=True)
+    formatos = formatos or formatos_documentos()
+
+    pool = obter_pool()
+    proprio = pool is None
+    if proprio:
+        pool = criar_navegador()
 
-    async with async_playwright() as p:
-        browser = await p.chromium.launch(headless=True)
-        context = await browser.new_context()
+    salvos = []
+    try:
+        cache = obter_cache()
+        for formato in formatos:
+            destinos = {}
+            for i, link in enumerate(links, start=1):
+                destinos.setdefault(link, []).append(os.path.join(pasta, f"{guid}_doc{i}.{formato}"))
 
-        for i, link in enumerate(links, start=1):
-            caminho_pdf = os.path.join(pasta, f"{guid}_doc{i}.pdf")
-            try:
-                page = await context.new_page()
-                await page.goto(link, timeout=60000)  # 60s timeout
-                await page.pdf(path=caminho_pdf, format="A4")
-                print(f"✅ PDF salvo em {caminho_pdf}")
-                await page.close()
-            except Exception as e:
-                print(f"❌ Erro ao baixar {link}: {e}")
+            for link, erro in baixar_formato(pool, cache, destinos, formato).items():
+                if erro is not None:
+                    print(f"❌ Erro ao baixar {link} ({formato}): {erro}")
+                else:
+                    print(f"✅ {formato.upper()} salvo em {', '.join(destinos[link])}")
+                    salvos.extend(destinos[link])
+    finally:
+        if proprio:
+            pool.fechar()
+    return salvos
 
-        await browser.close()
+# ---------------- Execução da Etapa (importável) ----------------
+def executar_etapa4(guid):
+    """Baixa os documentos dos links do YAML da Etapa 1 (não faz nada se não houver links)"""
+    dados = carregar_yaml(guid)
+    links = dados.get("confluence_docs", [])
+
+    if not links:
+        print(f"⚠️ Nenhum link de documentação encontrado no YAML de {guid}.")
+        return
+    return baixar_documentos(guid, links)
 
 # ---------------- Execução Principal ----------------
 if __name__ == "__main__":
     if len(sys.argv) < 2:
-        print("❌ Uso: python Etapa4_playwright.py <GUID>")
+        print("❌ Uso: python Etapa4.py <GUID>")
         sys.exit(1)
 
     guid = sys.argv[1]
 
     try:
-        dados = carregar_yaml(guid)
-        links = dados.get("confluence_docs", [])
-
-        if not links:
-            print(f"⚠️ Nenhum link de documentação encontrado no YAML de {guid}.")
-        else:
-            asyncio.run(baixar_pdfs(guid, links))
+        executar_etapa4(guid)
 
     except Exception as e:
         print(f"❌ Erro na Etapa 4: {e}")
@@ -1,99 +1,181 @@
 import os
 import sys
 import yaml
-import pandas as pd
-import PyPDF2
-from openai import OpenAI
-
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+from amostragem import caminho_amostra, ler_amostra
+from perfil import carregar_perfil, executar_perfil, resumo_coluna
+from schema_dremio import carregar_schema
+from texto_documento import ler_markdowns
+import texto_pdf
+import prompt_ia
+from prompt_ia import montar_prompt, montar_mensagens, registrar_uso, projetar_metadados, identidade_prompt
+import cliente_ia
+import indice_documentos
+from indice_documentos import configuracao_indice, consulta_tabela, selecionar_trechos
 
 def carregar_yaml(path_yaml):
     with open(path_yaml, "r", encoding="utf-8") as f:
         return yaml.safe_load(f)
 
-def carregar_csv(path_csv, n_linhas=5):
-    df = pd.read_csv(path_csv)
-    return df, df.head(n_linhas).to_string(index=False)
-
-def carregar_pdf(path_pdf):
-    texto = []
-    with open(path_pdf, "rb") as f:
-        leitor = PyPDF2.PdfReader(f)
-        for pagina in leitor.pages:
-            texto.append(pagina.extract_text())
-    return "\n".join(texto)
-
-def montar_prompt(metadados, amostra, doc):
-    return f"""
-Analise esta tabela para catálogo de dados corporativo:
-
-**METADADOS:**
-{metadados}
+def carregar_amostra(path_amostra, n_linhas=5):
+    """Lê só as primeiras linhas da amostra (Parquet ou CSV) para o prompt"""
+    df = ler_amostra(path_amostra, n_linhas=n_linhas)
+    return df, df.to_string(index=False)
 
-**AMOSTRA:**
-{amostra}
+def resumo_schema(schema):
+    """Sem amostra (lote --somente-schema): o prompt recebe as colunas e tipos do Dremio"""
+    linhas = [f"{c['nome']} ({c['tipo']}{'' if c.get('anulavel', True) else ', não nulo'})" for c in schema["colunas"]]
+    return "Sem amostra de dados; colunas da tabela:\n" + "\n".join(linhas)
 
-**DOCUMENTAÇÃO:**
-{doc}
-
-**INSTRUÇÕES:**
-- Comece com "Preenchido com IA"
-- 2 seções: Descrição da tabela e Contexto Negócio
-- Foco em produto/negócio - NÃO descreva colunas
-- Linguagem técnica para governança
-- Seja abrangente e descreva os produtos/serviços ou instrumentos financeiros identificados na tabela
-"""
-
-def descrever_colunas(df, metadados):
+def descrever_colunas(colunas, metadados, perfil=None, schema=None):
     """
-    Gera descrição detalhada de cada coluna com base na amostra do CSV.
+    Gera descrição detalhada de cada coluna com base na amostra e no perfil
+    ({guid}_perfil.yaml: tipo, nulos, distintos, faixa, valores frequentes e padrão).
+    Sem perfil, usa o tipo do schema ({guid}_schema.yaml), se houver.
     Se o YAML tiver metadados de colunas, pode ser ajustado aqui.
     """
+    colunas_perfil = (perfil or {}).get("colunas", {})
+    tipos_schema = {c["nome"]: c["tipo"] for c in (schema or {}).get("colunas", [])}
     descricoes = []
-    for coluna in df.columns:
-        descricoes.append(f"- {coluna}: Campo da tabela utilizado para armazenar informações relacionadas a '{coluna}'.")
+    for coluna in colunas:
+        descricao = f"- {coluna}: Campo da tabela utilizado para armazenar informações relacionadas a '{coluna}'."
+        if str(coluna) in colunas_perfil:
+            descricao += f" Perfil da amostra: {resumo_coluna(colunas_perfil[str(coluna)])}."
+        elif str(coluna) in tipos_schema:
+            descricao += f" Tipo no Dremio: {tipos_schema[str(coluna)]}."
+        descricoes.append(descricao)
     return "\n".join(descricoes)
 
-def main():
-    if len(sys.argv) < 2:
-        print("Uso: python script.py <GUID>")
-        sys.exit(1)
+def estatisticas():
+    """Métricas da extração de PDFs, da busca na documentação e do uso de tokens, lidas pelo executor ao final do lote"""
+    return {**texto_pdf.estatisticas(), **indice_documentos.estatisticas(), **prompt_ia.estatisticas(),
+            **cliente_ia.estatisticas()}
 
-    guid = sys.argv[1]
-    path_yaml = f"{guid}.yaml"
-    path_csv = f"{guid}.csv"
-    path_pdf = f"{guid}.pdf"
+def preparar_etapa5(guid, pasta="Historico"):
+    """Lê os artefatos das etapas 2, 3 e 4 e monta o prompt; retorna o contexto para concluir_etapa5"""
+    path_yaml = os.path.join(pasta, f"{guid}_purview.yaml")
+    path_amostra = caminho_amostra(guid, pasta)
+    schema = carregar_schema(guid, pasta)
 
-    if not (os.path.exists(path_yaml) and os.path.exists(path_csv) and os.path.exists(path_pdf)):
-        print("Erro: Arquivos correspondentes ao GUID não encontrados.")
-        sys.exit(1)
+    if not (os.path.exists(path_yaml) and (path_amostra or schema)):
+        raise FileNotFoundError("Erro: Arquivos correspondentes ao GUID não encontrados.")
 
     metadados = carregar_yaml(path_yaml)
-    df, amostra = carregar_csv(path_csv)
-    doc = carregar_pdf(path_pdf)
-
-    prompt = montar_prompt(metadados, amostra, doc)
-
-    resposta = client.chat.completions.create(
-        model="gpt-4.0",
-        messages=[
-            {"role": "system", "content": "Você é um assistente especializado em governança de dados corporativos."},
-            {"role": "user", "content": prompt}
-        ],
-        temperature=0.7
-    )
-
-    conteudo_ia = resposta.choices[0].message.content.strip()
-
-    descricao_colunas = descrever_colunas(df, metadados)
-
-    path_saida = f"{guid}_IA.txt"
+    if path_amostra:
+        df, amostra = carregar_amostra(path_amostra)
+        colunas = df.columns
+    else:
+        amostra = resumo_schema(schema)
+        colunas = [c["nome"] for c in schema["colunas"]]
+    # A Etapa 4 é opcional: sem links não há documentação. O texto extraído
+    # ({guid}_docN.md) é usado direto; os PDFs só quando não há texto. Do que
+    # houver, só entram os trechos mais relevantes para a tabela (BM25)
+    documentos = ler_markdowns(guid, pasta) or texto_pdf.ler_pdfs(guid, pasta)
+    config_indice = configuracao_indice()
+    if config_indice["busca"]:
+        consulta = consulta_tabela(projetar_metadados(metadados), colunas)
+        doc = selecionar_trechos(documentos, consulta, config_indice)
+    else:
+        doc = "\n\n---\n\n".join(documentos)
+
+    config = prompt_ia.configuracao_prompt()
+    prompt, relatorio = montar_prompt(metadados, amostra, doc, config["orcamento"], config["modelo"])
+    reduzidas = [f"{nome} ({v['tokens_originais']}→{v['tokens']})" for nome, v in relatorio.items()
+                 if nome != "total" and v["acao"] != "inteira"]
+    print(f"🧮 {guid}: prompt com {relatorio['total']['tokens']} tokens (orçamento {relatorio['total']['orcamento'] or 'livre'})"
+          + (f"; reduzidas: {', '.join(reduzidas)}" if reduzidas else ""))
+
+    return {
+        "guid": guid, "pasta": pasta, "modelo": config["modelo"], "mensagens": montar_mensagens(prompt),
+        # Chave do cache sem as linhas da amostra (sorteadas de novo a cada Etapa 3)
+        "identidade": identidade_prompt(metadados, doc, colunas, config["orcamento"]),
+        "relatorio": relatorio, "metadados": metadados, "colunas": colunas, "schema": schema,
+        "path_amostra": path_amostra,
+    }
+
+def concluir_etapa5(contexto, resposta):
+    """Registra o uso de tokens e grava {guid}_IA.txt com a resposta e a descrição das colunas"""
+    guid, pasta = contexto["guid"], contexto["pasta"]
+    registrar_uso(guid, contexto["modelo"], contexto["relatorio"], resposta["uso"], resposta["duracao"],
+                  cache=resposta["cache"])
+    if resposta["cache"]:
+        print(f"♻️ {guid}: resposta da IA reaproveitada do cache (IA_FORCAR=1 ou --forcar para chamar de novo)")
+
+    # O perfil é gerado pela etapa "perfil"; amostras antigas são perfiladas aqui
+    perfil = carregar_perfil(guid, pasta)
+    if perfil is None and contexto["path_amostra"]:
+        executar_perfil(guid, pasta)
+        perfil = carregar_perfil(guid, pasta)
+    descricao_colunas = descrever_colunas(contexto["colunas"], contexto["metadados"], perfil, contexto["schema"])
+
+    path_saida = os.path.join(pasta, f"{guid}_IA.txt")
     with open(path_saida, "w", encoding="utf-8") as f:
-        f.write(conteudo_ia)
+        f.write(resposta["conteudo"])
         f.write("\n\n=== DESCRIÇÃO DAS COLUNAS ===\n")
         f.write(descricao_colunas)
 
     print(f"\n✅ Análise concluída! Resultado salvo em: {path_saida}")
+    return path_saida
+
+def executar_etapa5(guid, forcar=None):
+    """
+    Gera a descrição com IA a partir dos artefatos das etapas 2, 3 e 4.
+    forcar=True ignora a resposta em cache (padrão: IA_FORCAR)
+    """
+    contexto = preparar_etapa5(guid)
+    # Mesmos modelo, parâmetros e prompt de uma execução anterior: resposta do cache, sem chamar a API
+    resposta = cliente_ia.completar(contexto["mensagens"], contexto["modelo"], forcar=forcar,
+                                    identidade=contexto["identidade"])
+    return concluir_etapa5(contexto, resposta)
+
+def executar_etapa5_lote(guids, forcar=None):
+    """
+    Etapa 5 de vários GUIDs com chamadas assíncronas em paralelo, dentro dos
+    limites IA_CONCORRENCIA/IA_RPM/IA_TPM (ver cliente_ia.configuracao_ia).
+    Cada {guid}_IA.txt é gravado assim que a sua resposta chega.
+    Retorna {guid: caminho do resultado ou exceção}
+    """
+    resultados, contextos = {}, {}
+    for guid in guids:
+        try:
+            contextos[guid] = preparar_etapa5(guid)
+        except Exception as e:
+            resultados[guid] = e
+    if not contextos:
+        return resultados
+
+    def ao_concluir(guid, resposta):
+        if isinstance(resposta, Exception):
+            return resposta
+        return concluir_etapa5(contextos[guid], resposta)
+
+    pedidos = [(guid, c["mensagens"], c["relatorio"]["total"]["tokens"], c["identidade"])
+               for guid, c in contextos.items()]
+    modelo = next(iter(contextos.values()))["modelo"]
+    resultados.update(cliente_ia.completar_lote(pedidos, modelo, ao_concluir, forcar=forcar))
+    return resultados
+
+def main():
+    guids = [a for a in sys.argv[1:] if not a.startswith("--")]
+    if not guids:
+        print("Uso: python Etapa5.py <GUID> [<GUID> ...] [--forcar]")
+        sys.exit(1)
+
+    forcar = True if "--forcar" in sys.argv[1:] else None
+
+    if len(guids) > 1:
+        # Vários GUIDs: chamadas assíncronas em paralelo, com limites de taxa
+        resultados = executar_etapa5_lote(guids, forcar=forcar)
+        falhas = {g: r for g, r in resultados.items() if isinstance(r, Exception)}
+        for guid, erro in falhas.items():
+            print(f"❌ {guid}: {erro}")
+        print(f"📦 Etapa 5 em lote: {len(resultados) - len(falhas)}/{len(guids)} GUIDs concluídos")
+        sys.exit(1 if falhas else 0)
+
+    try:
+        executar_etapa5(guids[0], forcar=forcar)
+    except FileNotFoundError as e:
+        print(e)
+        sys.exit(1)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,664 @@
+import os
+import json
+import math
+import time
+import random
+import re
+import decimal
+import datetime
+import yaml
+import tempfile
+import pandas as pd
+from contextlib import contextmanager, ExitStack
+from dremio_flight import truncar_lote_arrow, tabela_arrow
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # sem pyarrow a amostra fica só em CSV
+    pa = None
+    pq = None
+
+# Estratégias de amostragem disponíveis para a Etapa 3
+ESTRATEGIAS = ("aleatoria", "bernoulli", "tablesample", "hash", "particoes", "reservatorio")
+# Estratégias cujo resultado tem mais linhas que o tamanho pedido e é sorteado no cliente (reservatório)
+SORTEIO_NO_CLIENTE = ("bernoulli", "tablesample", "hash", "reservatorio")
+# Teto de linhas lidas pelas estratégias por fração, em múltiplos do tamanho (esperado: ~2x)
+FATOR_TETO_FRACAO = 10
+
+# ---------------- Configuração ----------------
+def configuracao_amostra(**sobrescritas):
+    """
+    Configuração da amostragem lida de variáveis de ambiente, com sobrescritas por parâmetro:
+    - AMOSTRA_ESTRATEGIA: uma de ESTRATEGIAS (padrão "bernoulli", que faz um COUNT(*) antes;
+      "aleatoria" é o antigo ORDER BY RANDOM())
+    - AMOSTRA_TAMANHO: linhas na amostra (padrão 200)
+    - AMOSTRA_SEED: semente (hash, particoes, tablesample e reservatorio ficam reprodutíveis)
+    - AMOSTRA_MAX_LEITURA: limite de linhas lidas pelo reservatorio (padrão 100000); o sorteio
+      é só entre essas primeiras linhas, não na tabela inteira
+    - AMOSTRA_COLUNA_HASH / AMOSTRA_COLUNA_PARTICAO / AMOSTRA_PARTICOES
+    - AMOSTRA_MAX_BYTES_CELULA: corta valores maiores que isso em bytes UTF-8 (padrão 4096, 0 desliga)
+    - AMOSTRA_LOTE: linhas por fetchmany (padrão 500) e AMOSTRA_MAX_MB_LOTE: teto de memória
+      de cada lote (padrão 32), que reduz o lote em tabelas muito largas
+    - AMOSTRA_AGREGADOS=1: calcula no Dremio estatísticas da tabela inteira (contagens, nulos,
+      distintos aproximados, min/max), em queries de até AMOSTRA_AGREGADOS_COLUNAS colunas (padrão 100)
+    """
+    seed = os.getenv("AMOSTRA_SEED")
+    config = {
+        "estrategia": os.getenv("AMOSTRA_ESTRATEGIA", "bernoulli"),
+        "tamanho": int(os.getenv("AMOSTRA_TAMANHO", "200")),
+        "seed": int(seed) if seed not in (None, "") else None,
+        "max_leitura": int(os.getenv("AMOSTRA_MAX_LEITURA", "100000")),
+        "coluna_hash": os.getenv("AMOSTRA_COLUNA_HASH") or None,
+        "coluna_particao": os.getenv("AMOSTRA_COLUNA_PARTICAO") or None,
+        "particoes": int(os.getenv("AMOSTRA_PARTICOES", "3")),
+        "max_bytes_celula": int(os.getenv("AMOSTRA_MAX_BYTES_CELULA", "4096")),
+        "lote": int(os.getenv("AMOSTRA_LOTE", "500")),
+        "max_mb_lote": float(os.getenv("AMOSTRA_MAX_MB_LOTE", "32")),
+        "agregados": os.getenv("AMOSTRA_AGREGADOS", "0") == "1",
+        "agregados_colunas": int(os.getenv("AMOSTRA_AGREGADOS_COLUNAS", "100")),
+    }
+    config.update({k: v for k, v in sobrescritas.items() if v is not None})
+
+    if config["estrategia"] not in ESTRATEGIAS:
+        raise ValueError(f"⚠️ Estratégia de amostragem inválida: {config['estrategia']}. Use uma de {ESTRATEGIAS}")
+    if config["estrategia"] == "particoes" and not config["coluna_particao"]:
+        raise ValueError("⚠️ A estratégia 'particoes' exige AMOSTRA_COLUNA_PARTICAO")
+    return config
+
+# ---------------- SQL ----------------
+def referencia_tabela(tabela):
+    return f'"{tabela}"'
+
+def identificador(coluna):
+    return '"' + str(coluna).replace('"', '""') + '"'
+
+def literal(valor):
+    if valor is None:
+        return "NULL"
+    if isinstance(valor, bool):
+        return "TRUE" if valor else "FALSE"
+    if isinstance(valor, (int, float)):
+        return repr(valor)
+    return "'" + str(valor).replace("'", "''") + "'"
+
+# ---------------- Execução ----------------
+@contextmanager
+def _consulta(cursor, query, consultas):
+    """Executa uma query e registra texto e tempo (incluindo a leitura) em `consultas`"""
+    inicio = time.perf_counter()
+    cursor.execute(query)
+    yield cursor
+    consultas.append({"query": query, "tempo": round(time.perf_counter() - inicio, 3)})
+
+def _contar_linhas(cursor, tabela, consultas):
+    with _consulta(cursor, f"SELECT COUNT(*) FROM {referencia_tabela(tabela)}", consultas):
+        return int(cursor.fetchone()[0] or 0)
+
+def _colunas(cursor, tabela, consultas):
+    """Nomes das colunas sem ler dados (LIMIT 0)"""
+    with _consulta(cursor, f"SELECT * FROM {referencia_tabela(tabela)} LIMIT 0", consultas):
+        nomes = [d[0] for d in cursor.description]
+        cursor.fetchall()
+    return nomes
+
+# Nomes de coluna que costumam ser chave (boa dispersão no hash): id, cliente_id, cod_produto, chave...
+PADRAO_CHAVE = re.compile(r"(^|_)(id|pk|key|chave|cod|codigo|uuid|guid)($|_)|[a-z]Id$")
+
+def coluna_chave(nomes):
+    """Primeira coluna com nome de chave, para a estratégia hash sem AMOSTRA_COLUNA_HASH"""
+    for nome in nomes:
+        if PADRAO_CHAVE.search(nome) or PADRAO_CHAVE.search(nome.lower()):
+            return nome
+    raise ValueError("⚠️ A estratégia 'hash' exige AMOSTRA_COLUNA_HASH: nenhuma coluna com nome de chave "
+                     f"(id, cod, chave...) em {', '.join(nomes[:20])}")
+
+def montar_query_amostra(cursor, tabela, config, consultas):
+    """
+    Monta a query final da estratégia escolhida. Algumas estratégias fazem
+    consultas auxiliares baratas antes (contagem, colunas, partições).
+    """
+    estrategia = config["estrategia"]
+    n = config["tamanho"]
+    ref = referencia_tabela(tabela)
+    rng = random.Random(config["seed"])
+
+    if estrategia == "aleatoria":
+        # Comportamento original: ordena a tabela inteira (caro em tabelas grandes)
+        return f"SELECT * FROM {ref} ORDER BY RANDOM() LIMIT {n}"
+
+    if estrategia == "reservatorio":
+        # Limite conhecido: só as primeiras max_leitura linhas (na ordem de leitura) entram no sorteio
+        return f"SELECT * FROM {ref} LIMIT {config['max_leitura']}"
+
+    if estrategia == "particoes":
+        coluna = identificador(config["coluna_particao"])
+        with _consulta(cursor, f"SELECT DISTINCT {coluna} FROM {ref} LIMIT 10000", consultas):
+            valores = [linha[0] for linha in cursor.fetchall()]
+        escolhidas = rng.sample(valores, min(config["particoes"], len(valores)))
+        config["particoes_escolhidas"] = [str(v) for v in escolhidas]
+        if not escolhidas:
+            return f"SELECT * FROM {ref} LIMIT {n}"
+        lista = ", ".join(literal(v) for v in escolhidas)
+        return f"SELECT * FROM {ref} WHERE {coluna} IN ({lista}) LIMIT {n}"
+
+    # Estratégias por fração: trazem ~2x o necessário da tabela inteira, sem LIMIT n (que
+    # ficaria com as primeiras linhas na ordem de leitura); as n linhas são sorteadas no cliente.
+    # O teto de FATOR_TETO_FRACAO * n só protege contra uma contagem muito errada
+    total = _contar_linhas(cursor, tabela, consultas)
+    config["total_linhas"] = total
+    if total <= n:
+        return f"SELECT * FROM {ref}"
+    fracao = min(1.0, 2.0 * n / total)
+    teto = FATOR_TETO_FRACAO * n
+
+    if estrategia == "tablesample":
+        percentual = max(fracao * 100, 0.0001)
+        repetivel = f" REPEATABLE ({config['seed']})" if config["seed"] is not None else ""
+        amostra = f"{ref} TABLESAMPLE SYSTEM ({percentual:.6f}){repetivel}"
+        # Nem toda versão/fonte do Dremio aceita TABLESAMPLE: testa sem ler dados e, se falhar, usa bernoulli
+        try:
+            with _consulta(cursor, f"SELECT * FROM {amostra} LIMIT 0", consultas):
+                cursor.fetchall()
+            return f"SELECT * FROM {amostra} LIMIT {teto}"
+        except Exception as e:
+            print(f"⚠️  TABLESAMPLE não suportado ({e}). Usando bernoulli.")
+            config["estrategia"] = estrategia = "bernoulli"
+            config["estrategia_pedida"] = "tablesample"
+
+    if estrategia == "bernoulli":
+        return f"SELECT * FROM {ref} WHERE RANDOM() < {fracao:.10f} LIMIT {teto}"
+
+    # hash: filtra um "balde" das linhas pelo hash de uma coluna (determinístico)
+    # Hash da primeira coluna (status, data...) costuma dar baldes vazios ou enviesados: usa uma chave
+    coluna = config["coluna_hash"] or coluna_chave(_colunas(cursor, tabela, consultas))
+    modulo = max(1, math.floor(1 / fracao))
+    resto = rng.randrange(modulo)
+    config["coluna_hash"] = coluna
+    return (f"SELECT * FROM {ref} WHERE MOD(ABS(HASH({identificador(coluna)})), {modulo}) = {resto} "
+            f"LIMIT {teto}")
+
+# ---------------- Leitura em Lotes ----------------
+SUFIXO_TRUNCADO = "…[truncado]"
+
+def truncar_celula(valor, limite):
+    """Corta textos/binários maiores que `limite` bytes. Retorna (valor, foi_truncado)"""
+    if not limite or not isinstance(valor, (str, bytes, bytearray)):
+        return valor, False
+    if isinstance(valor, str):
+        dados = valor.encode("utf-8")
+        if len(dados) <= limite:
+            return valor, False
+        return dados[:limite].decode("utf-8", "ignore") + SUFIXO_TRUNCADO, True
+    if len(valor) <= limite:
+        return valor, False
+    return bytes(valor[:limite]), True
+
+def truncar_linhas(linhas, limite, contadores):
+    """Aplica truncar_celula a um lote de linhas, contando as células cortadas"""
+    if not limite:
+        return [tuple(l) for l in linhas]
+    resultado = []
+    for linha in linhas:
+        nova = []
+        for valor in linha:
+            valor, truncado = truncar_celula(valor, limite)
+            contadores["celulas_truncadas"] += truncado
+            nova.append(valor)
+        resultado.append(tuple(nova))
+    return resultado
+
+def linhas_por_lote(n_colunas, config):
+    """Tamanho do fetchmany: AMOSTRA_LOTE, reduzido para o pior caso de uma linha caber no teto do lote"""
+    if not config["max_bytes_celula"]:
+        return config["lote"]
+    bytes_por_linha = max(n_colunas, 1) * config["max_bytes_celula"]
+    return max(1, min(config["lote"], int(config["max_mb_lote"] * 1024 * 1024 // bytes_por_linha)))
+
+def iterar_lotes(cursor, config, contadores):
+    """
+    Gera o resultado em lotes já truncados: RecordBatches quando o cursor lê
+    Arrow (Flight), listas de tuplas no ODBC. Só um lote fica em memória por vez.
+    """
+    limite = config["max_bytes_celula"]
+    if hasattr(cursor, "iterar_lotes_arrow"):
+        for lote in cursor.iterar_lotes_arrow():
+            lote, truncadas = truncar_lote_arrow(lote, limite, truncar_celula)
+            contadores["celulas_truncadas"] += truncadas
+            yield lote
+        return
+
+    tamanho = linhas_por_lote(len(cursor.description), config)
+    while True:
+        linhas = cursor.fetchmany(tamanho)
+        if not linhas:
+            return
+        yield truncar_linhas(linhas, limite, contadores)
+
+def amostra_reservatorio(lotes, tamanho, rng):
+    """Algoritmo R sobre os lotes de linhas (já truncadas) do cursor"""
+    reservatorio = []
+    vistos = 0
+    for linhas in lotes:
+        for linha in linhas:
+            if vistos < tamanho:
+                reservatorio.append(linha)
+            else:
+                j = rng.randrange(vistos + 1)
+                if j < tamanho:
+                    reservatorio[j] = linha
+            vistos += 1
+    return reservatorio, vistos
+
+def executar_amostragem(conn, tabela, config=None, escritor=None):
+    """
+    Executa a estratégia configurada em uma conexão DB-API (pyodbc) ou Flight.
+    Retorna (colunas, linhas, info) — info vai para o artefato da amostra.
+
+    Com `escritor` (ver escritor_amostra) os lotes são gravados conforme chegam e
+    `linhas` volta None, mantendo a memória limitada a um lote. Sem ele, as
+    linhas voltam em memória (pyarrow.Table em cursores Arrow).
+    """
+    config = dict(config or configuracao_amostra())
+    consultas = []
+    contadores = {"celulas_truncadas": 0}
+    cursor = conn.cursor()
+    try:
+        inicio_total = time.perf_counter()
+        query = montar_query_amostra(cursor, tabela, config, consultas)
+        print(f"📊 Executando query ({config['estrategia']}): {query}")
+
+        with _consulta(cursor, query, consultas):
+            colunas = [d[0] for d in cursor.description]
+            descricao, schema = cursor.description, getattr(cursor, "schema", None)
+            sorteio = config["estrategia"] in SORTEIO_NO_CLIENTE
+            if sorteio:
+                # O reservatório lê linha a linha mesmo no Flight; só guarda `tamanho` linhas
+                lotes = iterar_lotes(_CursorLinhas(cursor), config, contadores)
+                linhas, lidas = amostra_reservatorio(lotes, config["tamanho"], random.Random(config["seed"]))
+                config["linhas_lidas"] = lidas
+                if config["estrategia"] == "reservatorio" and lidas >= config["max_leitura"]:
+                    print(f"⚠️  Reservatório limitado às primeiras {lidas} linhas lidas da tabela "
+                          "(aumente AMOSTRA_MAX_LEITURA ou use bernoulli)")
+                tamanho = linhas_por_lote(len(colunas), config)
+                lotes = [linhas[i:i + tamanho] for i in range(0, len(linhas), tamanho)]
+            else:
+                lotes = iterar_lotes(cursor, config, contadores)
+
+            if escritor is not None:
+                escritor.iniciar(colunas, cursor.description, getattr(cursor, "schema", None))
+                for lote in lotes:
+                    escritor.escrever(lote)
+                total, linhas = escritor.linhas, None
+            elif hasattr(cursor, "iterar_lotes_arrow") and not sorteio:
+                linhas = tabela_arrow(list(lotes), cursor.schema)
+                total = linhas.num_rows
+            else:
+                linhas = [linha for lote in lotes for linha in lote]
+                total = len(linhas)
+
+        info = {
+            "estrategia": config["estrategia"],
+            "parametros": {k: v for k, v in config.items() if k != "estrategia"},
+            "consultas": consultas,
+            "tempo_query": consultas[-1]["tempo"],
+            "tempo_total": round(time.perf_counter() - inicio_total, 3),
+            "linhas": total,
+            "colunas": len(colunas),
+            "celulas_truncadas": contadores["celulas_truncadas"],
+        }
+        if config["agregados"]:
+            info["estatisticas_tabela"] = executar_agregados(conn, tabela, descricao, schema,
+                                                             config["agregados_colunas"])
+        return colunas, linhas, info
+    finally:
+        cursor.close()
+
+# ---------------- Estatísticas da Tabela Inteira (pushdown) ----------------
+def capacidades_colunas(descricao, schema=None):
+    """
+    Quais agregações cada coluna aceita: [(nome, min_max, distintos)].
+    Tipos aninhados e binários só entram na contagem de nulos.
+    """
+    if schema is not None:
+        capacidades = []
+        for campo in schema:
+            tipo = campo.type
+            simples = not (pa.types.is_nested(tipo) or pa.types.is_binary(tipo) or pa.types.is_large_binary(tipo))
+            capacidades.append((campo.name, simples and not pa.types.is_boolean(tipo), simples))
+        return capacidades
+
+    ordenaveis = (str, int, float, decimal.Decimal, datetime.date, datetime.datetime, datetime.time)
+    return [(d[0], d[1] in ordenaveis, d[1] in ordenaveis or d[1] is bool) for d in descricao]
+
+def montar_queries_agregados(tabela, capacidades, colunas_por_query=100):
+    """
+    Uma query de agregação por bloco de colunas (tabelas largas geram várias).
+    Aliases posicionais (a{i}_...) evitam problemas com nomes de coluna.
+    Retorna [(query, [(alias, coluna, estatistica)])]
+    """
+    queries = []
+    for inicio in range(0, len(capacidades), max(colunas_por_query, 1)):
+        expressoes = ["COUNT(*) AS total"]
+        campos = []
+        for i, (nome, min_max, distintos) in enumerate(capacidades[inicio:inicio + colunas_por_query], start=inicio):
+            coluna = identificador(nome)
+            agregacoes = [("preenchidos", f"COUNT({coluna})")]
+            if distintos:
+                agregacoes.append(("distintos_aprox", f"APPROX_COUNT_DISTINCT({coluna})"))
+            if min_max:
+                agregacoes += [("min", f"MIN({coluna})"), ("max", f"MAX({coluna})")]
+            for estatistica, expressao in agregacoes:
+                alias = f"a{i}_{estatistica}"
+                expressoes.append(f"{expressao} AS {alias}")
+                campos.append((alias, nome, estatistica))
+        queries.append((f"SELECT {', '.join(expressoes)} FROM {referencia_tabela(tabela)}", campos))
+    return queries
+
+def _valor_estatistica(valor):
+    """Valores do Dremio em tipos aceitos pelo YAML (datas em ISO, decimais em float, textos curtos)"""
+    if isinstance(valor, decimal.Decimal):
+        return float(valor)
+    if isinstance(valor, (datetime.date, datetime.datetime, datetime.time)):
+        return valor.isoformat()
+    if isinstance(valor, (bytes, bytearray)):
+        return None
+    return truncar_celula(valor, 200)[0]
+
+def executar_agregados(conn, tabela, descricao, schema=None, colunas_por_query=100):
+    """
+    Calcula no Dremio, sobre a tabela inteira, contagem de linhas, nulos,
+    distintos aproximados e min/max por coluna. Blocos que falharem são
+    registrados em "erros" sem derrubar a amostra.
+    """
+    consultas = []
+    resultado = {"linhas": None, "colunas": {}, "consultas": consultas, "erros": []}
+    inicio = time.perf_counter()
+    cursor = conn.cursor()
+    try:
+        for query, campos in montar_queries_agregados(tabela, capacidades_colunas(descricao, schema), colunas_por_query):
+            try:
+                with _consulta(cursor, query, consultas):
+                    nomes = [d[0].lower() for d in cursor.description]
+                    linha = dict(zip(nomes, cursor.fetchone()))
+            except Exception as e:
+                resultado["erros"].append(f"{type(e).__name__}: {e}")
+                continue
+
+            total = int(linha["total"] or 0)
+            resultado["linhas"] = total
+            for alias, coluna, estatistica in campos:
+                valor = linha.get(alias.lower())
+                estatisticas = resultado["colunas"].setdefault(coluna, {})
+                if estatistica == "preenchidos":
+                    estatisticas["nulos"] = round(1 - int(valor or 0) / total, 4) if total else 0.0
+                elif estatistica == "distintos_aprox":
+                    estatisticas["distintos_aprox"] = int(valor or 0)
+                else:
+                    estatisticas[estatistica] = _valor_estatistica(valor)
+    finally:
+        cursor.close()
+
+    resultado["tempo"] = round(time.perf_counter() - inicio, 3)
+    print(f"📐 Estatísticas da tabela inteira: {len(resultado['colunas'])} colunas em "
+          f"{len(consultas)} queries ({resultado['tempo']}s)")
+    return resultado
+
+class _CursorLinhas:
+    """Esconde a leitura Arrow de um cursor, forçando o caminho fetchmany (linhas)"""
+
+    def __init__(self, cursor):
+        self._cursor = cursor
+        self.description = cursor.description
+
+    def fetchmany(self, tamanho):
+        return self._cursor.fetchmany(tamanho)
+
+def amostra_para_dataframe(colunas, linhas):
+    """DataFrame da amostra; tabelas Arrow são convertidas coluna a coluna, sem passar por tuplas"""
+    if hasattr(linhas, "to_pandas"):
+        return linhas.to_pandas()
+    return pd.DataFrame.from_records([tuple(l) for l in linhas], columns=colunas)
+
+# ---------------- Artefato ----------------
+# Formatos gravados pela Etapa 3: parquet (tipado, padrão) e csv (exportação opcional)
+FORMATOS = ("parquet", "csv")
+
+def formatos_amostra():
+    """AMOSTRA_FORMATOS: lista separada por vírgula (padrão "parquet"; sem pyarrow cai para csv)"""
+    formatos = [f.strip().lower() for f in os.getenv("AMOSTRA_FORMATOS", "parquet").split(",") if f.strip()]
+    invalidos = [f for f in formatos if f not in FORMATOS]
+    if invalidos or not formatos:
+        raise ValueError(f"⚠️ Formato de amostra inválido: {invalidos}. Use um ou mais de {FORMATOS}")
+    if "parquet" in formatos and pq is None:
+        print("⚠️  pyarrow não instalado: a amostra será gravada só em CSV")
+        formatos = ["csv"]
+    return formatos
+
+class _EscritorArquivo:
+    """
+    Base dos escritores de amostra: grava em um temporário e só substitui o
+    destino ao final, então uma falha no meio não deixa uma amostra parcial no
+    lugar da anterior.
+    """
+    sufixo = ""
+
+    def __init__(self, caminho):
+        self.caminho = caminho
+        self.colunas = None
+        self.linhas = 0
+        self._caminho_tmp = None
+
+    def __enter__(self):
+        pasta = os.path.dirname(os.path.abspath(self.caminho))
+        os.makedirs(pasta, exist_ok=True)
+        fd, self._caminho_tmp = tempfile.mkstemp(dir=pasta, prefix=".tmp_", suffix=self.sufixo)
+        os.close(fd)
+        self._abrir()
+        return self
+
+    def iniciar(self, colunas, descricao=None, schema=None):
+        self.colunas = colunas
+
+    def __exit__(self, tipo_erro, *exc):
+        try:
+            self._fechar(sucesso=tipo_erro is None)
+            if tipo_erro is None:
+                os.replace(self._caminho_tmp, self.caminho)
+        finally:
+            if os.path.exists(self._caminho_tmp):
+                os.remove(self._caminho_tmp)
+
+class EscritorCSV(_EscritorArquivo):
+    """Grava a amostra em CSV lote a lote (mesmo formato do DataFrame.to_csv)"""
+    sufixo = ".csv"
+
+    def _abrir(self):
+        self._arquivo = open(self._caminho_tmp, "w", encoding="utf-8", newline="")
+        self._cabecalho = True
+
+    def escrever(self, lote):
+        df = amostra_para_dataframe(self.colunas, lote)
+        df.to_csv(self._arquivo, header=self._cabecalho, index=False)
+        self._cabecalho = False
+        self.linhas += len(df)
+
+    def _fechar(self, sucesso):
+        if sucesso and self._cabecalho and self.colunas is not None:
+            # Resultado vazio: grava só o cabeçalho
+            pd.DataFrame(columns=self.colunas).to_csv(self._arquivo, index=False)
+        self._arquivo.close()
+
+def _tipo_arrow_odbc(descricao_coluna):
+    """Tipo Arrow a partir do tipo Python que o pyodbc informa em cursor.description"""
+    _, tipo, _, _, precisao, escala, _ = descricao_coluna
+    if tipo is decimal.Decimal:
+        return pa.decimal128(precisao, escala or 0) if precisao and precisao <= 38 else pa.string()
+    tipos = {
+        str: pa.string(),
+        int: pa.int64(),
+        float: pa.float64(),
+        bool: pa.bool_(),
+        bytes: pa.binary(),
+        bytearray: pa.binary(),
+        datetime.datetime: pa.timestamp("us"),
+        datetime.date: pa.date32(),
+        datetime.time: pa.time64("us"),
+    }
+    return tipos.get(tipo, pa.string())
+
+def schema_amostra(descricao, schema=None, tabela=None):
+    """
+    Schema Arrow da amostra com o schema de origem embutido nos metadados
+    (`dremio_schema`: nome, tipo e nulidade de cada coluna como o Dremio informou).
+    No Flight o schema já vem tipado; no ODBC é montado a partir do cursor.description.
+    """
+    if schema is None:
+        # null_ok do ODBC pode vir None (desconhecido): só é NOT NULL quando o driver diz False
+        schema = pa.schema([pa.field(d[0], _tipo_arrow_odbc(d), nullable=d[6] is not False) for d in descricao])
+        origem = [{"nome": d[0], "tipo": getattr(d[1], "__name__", str(d[1])), "precisao": d[4], "escala": d[5],
+                   "anulavel": d[6] is not False} for d in descricao]
+    else:
+        origem = [{"nome": f.name, "tipo": str(f.type), "anulavel": f.nullable} for f in schema]
+    metadados = {b"dremio_schema": json.dumps(origem, ensure_ascii=False, default=str).encode("utf-8")}
+    if tabela:
+        metadados[b"dremio_tabela"] = str(tabela).encode("utf-8")
+    return schema.with_metadata(metadados)
+
+class EscritorParquet(_EscritorArquivo):
+    """
+    Grava a amostra em Parquet (tipado, com o schema de origem nos metadados),
+    um row group por lote. Leitores podem abrir com memory map e ler só as
+    colunas e linhas de que precisam (ver ler_amostra).
+    """
+    sufixo = ".parquet"
+
+    def __init__(self, caminho, tabela=None):
+        super().__init__(caminho)
+        self.tabela = tabela
+        self.schema = None
+        self._escritor = None
+
+    def _abrir(self):
+        self._escritor = None
+
+    def iniciar(self, colunas, descricao=None, schema=None):
+        super().iniciar(colunas)
+        self.schema = schema_amostra(descricao, schema, self.tabela)
+        self._escritor = pq.ParquetWriter(self._caminho_tmp, self.schema, compression="zstd")
+
+    def _para_tabela(self, lote):
+        if isinstance(lote, pa.RecordBatch):
+            return pa.Table.from_batches([lote]).replace_schema_metadata(self.schema.metadata)
+        colunas = []
+        for i, campo in enumerate(self.schema):
+            valores = [linha[i] for linha in lote]
+            try:
+                colunas.append(pa.array(valores, type=campo.type))
+            except (pa.ArrowInvalid, pa.ArrowTypeError):
+                if not pa.types.is_string(campo.type):
+                    raise
+                # Coluna de texto com valores de outro tipo (tipo desconhecido pelo driver)
+                colunas.append(pa.array([None if v is None else str(v) for v in valores], type=campo.type))
+        return pa.Table.from_arrays(colunas, schema=self.schema)
+
+    def escrever(self, lote):
+        tabela = self._para_tabela(lote)
+        self._escritor.write_table(tabela)
+        self.linhas += tabela.num_rows
+
+    def _fechar(self, sucesso):
+        if self._escritor is not None:
+            self._escritor.close()
+
+class EscritorMultiplo:
+    """Repassa os lotes para vários escritores (ex.: Parquet e CSV ao mesmo tempo)"""
+
+    def __init__(self, escritores):
+        self.escritores = escritores
+        self._pilha = ExitStack()
+
+    @property
+    def linhas(self):
+        return self.escritores[0].linhas
+
+    @property
+    def caminhos(self):
+        return [e.caminho for e in self.escritores]
+
+    def __enter__(self):
+        with ExitStack() as pilha:
+            for escritor in self.escritores:
+                pilha.enter_context(escritor)
+            self._pilha = pilha.pop_all()
+        return self
+
+    def iniciar(self, colunas, descricao=None, schema=None):
+        for escritor in self.escritores:
+            escritor.iniciar(colunas, descricao, schema)
+
+    def escrever(self, lote):
+        for escritor in self.escritores:
+            escritor.escrever(lote)
+
+    def __exit__(self, *exc):
+        return self._pilha.__exit__(*exc)
+
+def escritor_amostra(guid, tabela=None, pasta="Historico", formatos=None):
+    """Escritor para os formatos configurados: {guid}_amostra.parquet e/ou {guid}_amostra.csv"""
+    escritores = []
+    for formato in formatos or formatos_amostra():
+        caminho = os.path.join(pasta, f"{guid}_amostra.{formato}")
+        escritores.append(EscritorParquet(caminho, tabela) if formato == "parquet" else EscritorCSV(caminho))
+    return EscritorMultiplo(escritores)
+
+# ---------------- Leitura do Artefato ----------------
+def caminho_amostra(guid, pasta="Historico"):
+    """Artefato da amostra disponível, preferindo o Parquet; None se não houver"""
+    for formato in FORMATOS:
+        caminho = os.path.join(pasta, f"{guid}_amostra.{formato}")
+        if os.path.exists(caminho) and (formato != "parquet" or pq is not None):
+            return caminho
+    return None
+
+def ler_amostra(caminho, colunas=None, n_linhas=None):
+    """
+    Lê a amostra como DataFrame carregando só as colunas e as primeiras
+    `n_linhas` pedidas. No Parquet (memory map) o restante do arquivo nem é lido.
+    """
+    if caminho.endswith(".parquet"):
+        arquivo = pq.ParquetFile(caminho, memory_map=True)
+        if n_linhas is None:
+            return arquivo.read(columns=colunas).to_pandas()
+        lotes, lidas = [], 0
+        for lote in arquivo.iter_batches(batch_size=max(n_linhas, 1), columns=colunas):
+            lotes.append(lote)
+            lidas += lote.num_rows
+            if lidas >= n_linhas:
+                break
+        if not lotes:
+            vazia = arquivo.schema_arrow.empty_table()
+            return (vazia.select(colunas) if colunas else vazia).to_pandas()
+        return pa.Table.from_batches(lotes).slice(0, n_linhas).to_pandas()
+    return pd.read_csv(caminho, usecols=colunas, nrows=n_linhas)
+
+def schema_origem_amostra(caminho):
+    """Schema de origem (Dremio) embutido no Parquet, sem ler os dados; [] para CSV"""
+    if not caminho.endswith(".parquet"):
+        return []
+    metadados = pq.read_schema(caminho, memory_map=True).metadata or {}
+    return json.loads(metadados.get(b"dremio_schema", b"[]"))
+
+def salvar_metadados_amostra(guid, tabela, info, pasta="Historico"):
+    """Grava {guid}_amostra_meta.yaml com estratégia, parâmetros e tempos da amostra"""
+    os.makedirs(pasta, exist_ok=True)
+    caminho = os.path.join(pasta, f"{guid}_amostra_meta.yaml")
+    dados = {
+        "guid": guid,
+        "tabela": tabela,
+        "gerado_em": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        **info,
+    }
+    with open(caminho, "w", encoding="utf-8") as f:
+        yaml.safe_dump(dados, f, allow_unicode=True, sort_keys=False)
+    return caminho
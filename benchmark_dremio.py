@@ -0,0 +1,99 @@
+"""
+Benchmark dos transportes do Dremio (ODBC x Arrow Flight) lendo uma tabela até
+virar DataFrame, como na Etapa 3. Cada medição roda em um processo novo para o
+pico de memória de uma não contaminar a outra.
+
+Uso: python benchmark_dremio.py <tabela> [--linhas 100000] [--repeticoes 3] [--transportes odbc flight]
+"""
+
+import sys
+import time
+import argparse
+import tracemalloc
+import multiprocessing
+
+try:
+    import pyarrow as pa
+except ImportError:
+    pa = None
+
+from amostragem import referencia_tabela, amostra_para_dataframe
+from Etapa3kubernetes import conectar_odbc, conectar_flight
+
+CONEXOES = {"odbc": conectar_odbc, "flight": conectar_flight}
+
+# ---------------- Medição ----------------
+def medir(transporte, tabela, linhas, fila):
+    """Roda em processo separado: conecta, lê a tabela e mede tempo e pico de memória"""
+    try:
+        conn = CONEXOES[transporte]()
+        tracemalloc.start()
+        pico_arrow_inicial = pa.default_memory_pool().max_memory() if pa else 0
+        inicio = time.perf_counter()
+
+        cursor = conn.cursor()
+        cursor.execute(f"SELECT * FROM {referencia_tabela(tabela)} LIMIT {linhas}")
+        colunas = [d[0] for d in cursor.description]
+        dados = cursor.fetch_arrow() if hasattr(cursor, "fetch_arrow") else cursor.fetchall()
+        df = amostra_para_dataframe(colunas, dados)
+
+        duracao = time.perf_counter() - inicio
+        _, pico_python = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        # Buffers Arrow são alocados fora do alocador do Python
+        pico_arrow = (pa.default_memory_pool().max_memory() - pico_arrow_inicial) if pa else 0
+        cursor.close()
+        conn.close()
+
+        fila.put({
+            "transporte": transporte,
+            "linhas": len(df),
+            "colunas": len(df.columns),
+            "duracao": duracao,
+            "pico_mb": (pico_python + max(pico_arrow, 0)) / (1024 * 1024),
+        })
+    except Exception as e:
+        fila.put({"transporte": transporte, "erro": f"{type(e).__name__}: {e}"})
+
+def rodar_isolado(transporte, tabela, linhas):
+    fila = multiprocessing.Queue()
+    processo = multiprocessing.Process(target=medir, args=(transporte, tabela, linhas, fila))
+    processo.start()
+    resultado = fila.get()
+    processo.join()
+    return resultado
+
+# ---------------- Relatório ----------------
+def imprimir_resultados(resultados):
+    print("\n📊 Resultado do benchmark")
+    print(f"   {'transporte':<10} {'linhas':>9} {'colunas':>8} {'tempo (s)':>10} {'linhas/s':>12} {'pico (MB)':>10}")
+    for transporte, medicoes in resultados.items():
+        validas = [m for m in medicoes if "erro" not in m]
+        if not validas:
+            print(f"   {transporte:<10} ❌ {medicoes[0]['erro']}")
+            continue
+        melhor = min(validas, key=lambda m: m["duracao"])
+        taxa = melhor["linhas"] / melhor["duracao"] if melhor["duracao"] else 0.0
+        pico = max(m["pico_mb"] for m in validas)
+        print(f"   {transporte:<10} {melhor['linhas']:>9} {melhor['colunas']:>8} {melhor['duracao']:>10.2f} "
+              f"{taxa:>12,.0f} {pico:>10.1f}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compara ODBC e Arrow Flight na leitura de uma tabela do Dremio")
+    parser.add_argument("tabela", help="Tabela do Dremio (de preferência larga, com muitas colunas)")
+    parser.add_argument("--linhas", type=int, default=100000, help="LIMIT da leitura (default 100000)")
+    parser.add_argument("--repeticoes", type=int, default=3, help="Execuções por transporte; vale a mais rápida")
+    parser.add_argument("--transportes", nargs="+", choices=list(CONEXOES), default=list(CONEXOES))
+    args = parser.parse_args(argv)
+
+    resultados = {}
+    for transporte in args.transportes:
+        print(f"⏱️  {transporte}: lendo {args.linhas} linhas de {args.tabela} ({args.repeticoes}x)...")
+        resultados[transporte] = [rodar_isolado(transporte, args.tabela, args.linhas)
+                                  for _ in range(args.repeticoes)]
+
+    imprimir_resultados(resultados)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
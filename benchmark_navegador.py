@@ -0,0 +1,172 @@
+"""
+Benchmark da Etapa 4 contra um conjunto local de páginas parecidas com as do
+Confluence (texto + imagens, fonte, vídeo e um script de analytics em outro
+host, com latência simulada e login por redirecionamento). Compara o
+carregamento sem interceptação, com bloqueio de recursos e com bloqueio +
+sessão persistida, medindo tempo de renderização e bytes transferidos.
+
+Uso: python benchmark_navegador.py [--paginas 20] [--repeticoes 2] [--atraso 0.05]
+"""
+
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from pool_navegador import PoolNavegador, RASTREADORES
+from texto_documento import extrair_markdown
+
+COOKIE_SESSAO = "sessao_benchmark=ok"
+
+# ---------------- Páginas Locais ----------------
+def gerar_recursos(tamanho_imagem=150_000, tamanho_fonte=80_000, tamanho_video=400_000):
+    aleatorio = random.Random(0)
+    return {
+        "/img.png": (b"\x89PNG" + aleatorio.randbytes(tamanho_imagem), "image/png"),
+        "/fonte.woff2": (aleatorio.randbytes(tamanho_fonte), "font/woff2"),
+        "/video.mp4": (aleatorio.randbytes(tamanho_video), "video/mp4"),
+        "/analytics.js": (b"/* analytics */" + b" " * 60_000, "application/javascript"),
+    }
+
+def gerar_pagina(numero, porta_rastreador):
+    linhas = "".join(f"<tr><td>campo_{i}</td><td>Descrição do campo {i}</td></tr>" for i in range(15))
+    imagens = "".join(f'<img src="/img.png?p={numero}&i={i}">' for i in range(4))
+    return f"""<!doctype html><html><head><title>Produto {numero}</title>
+<style>@font-face {{ font-family: F; src: url(/fonte.woff2?p={numero}); }} body {{ font-family: F; }}</style>
+<script src="http://localhost:{porta_rastreador}/analytics.js?p={numero}"></script></head>
+<body><nav>Menu</nav><div id="main-content"><h1>Produto {numero}</h1>
+<p>Documentação do produto {numero} usada pelas tabelas do catálogo.</p>{imagens}
+<video src="/video.mp4?p={numero}" preload="auto"></video>
+<table><tr><th>Campo</th><th>Descrição</th></tr>{linhas}</table></div><footer>Rodapé</footer></body></html>""".encode()
+
+class ServidorPaginas:
+    """Servidor HTTP local que conta requisições e bytes enviados"""
+
+    def __init__(self, atraso):
+        self.atraso = atraso
+        self.recursos = gerar_recursos()
+        self.lock = threading.Lock()
+        self.bytes = 0
+        self.requisicoes = 0
+        servidor = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                caminho = self.path.split("?")[0]
+                time.sleep(servidor.atraso)
+                if caminho.startswith("/pagina"):
+                    # Sem o cookie de sessão, passa por um "SSO" lento antes da página
+                    if COOKIE_SESSAO not in (self.headers.get("Cookie") or ""):
+                        time.sleep(servidor.atraso * 10)
+                        self.send_response(302)
+                        self.send_header("Set-Cookie", f"{COOKIE_SESSAO}; Path=/; Max-Age=3600")
+                        self.send_header("Location", self.path)
+                        self.end_headers()
+                        return
+                    corpo, tipo = gerar_pagina(caminho[len("/pagina"):], servidor.porta), "text/html; charset=utf-8"
+                elif caminho in servidor.recursos:
+                    corpo, tipo = servidor.recursos[caminho]
+                else:
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", tipo)
+                self.send_header("Content-Length", str(len(corpo)))
+                self.send_header("Cache-Control", "no-store")
+                self.end_headers()
+                self.wfile.write(corpo)
+                with servidor.lock:
+                    servidor.bytes += len(corpo)
+                    servidor.requisicoes += 1
+
+        self.http = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.porta = self.http.server_address[1]
+        threading.Thread(target=self.http.serve_forever, daemon=True).start()
+
+    def zerar(self):
+        with self.lock:
+            self.bytes = self.requisicoes = 0
+
+    def fechar(self):
+        self.http.shutdown()
+
+# ---------------- Medição ----------------
+async def _extrair(page, resposta):
+    return len(await extrair_markdown(page))
+
+def medir(servidor, paginas, bloquear, rastreadores, sessao):
+    """Renderiza todas as páginas num navegador novo e devolve tempo, bytes e bloqueios"""
+    pool = PoolNavegador(max_paginas=4, timeout=60, tentativas=1, bloquear=bloquear,
+                         rastreadores=rastreadores, sessao=sessao)
+    links = [f"http://127.0.0.1:{servidor.porta}/pagina{i}" for i in range(paginas)]
+    try:
+        servidor.zerar()
+        inicio = time.perf_counter()
+        resultados = pool.renderizar([(link, _extrair) for link in links])
+        duracao = time.perf_counter() - inicio
+    finally:
+        pool.fechar()
+    erros = [r for r in resultados if isinstance(r, Exception)]
+    return {
+        "duracao": duracao,
+        "por_pagina": duracao / paginas,
+        "mb": servidor.bytes / (1024 * 1024),
+        "requisicoes": servidor.requisicoes,
+        "bloqueadas": pool.contadores["bloqueadas"],
+        "erros": len(erros),
+        "erro": f"{type(erros[0]).__name__}: {erros[0]}" if erros else None,
+    }
+
+# ---------------- Relatório ----------------
+def imprimir_resultados(resultados):
+    base = resultados.get("sem bloqueio")
+    print("\n📊 Resultado do benchmark")
+    print(f"   {'cenário':<18} {'tempo (s)':>10} {'s/página':>9} {'MB':>8} {'requisições':>12} {'bloqueadas':>11} {'ganho':>7}")
+    for cenario, m in resultados.items():
+        ganho = f"{1 - m['duracao'] / base['duracao']:.0%}" if base and m is not base and base["duracao"] else "-"
+        print(f"   {cenario:<18} {m['duracao']:>10.2f} {m['por_pagina']:>9.2f} {m['mb']:>8.2f} "
+              f"{m['requisicoes']:>12} {m['bloqueadas']:>11} {ganho:>7}")
+        if m["erros"]:
+            print(f"   ⚠️  {m['erros']} página(s) com erro, ex.: {m['erro']}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Mede o ganho de bloquear recursos e reaproveitar a sessão na Etapa 4")
+    parser.add_argument("--paginas", type=int, default=20, help="Páginas no conjunto local (default 20)")
+    parser.add_argument("--repeticoes", type=int, default=2, help="Execuções por cenário; vale a mais rápida")
+    parser.add_argument("--atraso", type=float, default=0.05, help="Latência simulada por requisição, em segundos")
+    args = parser.parse_args(argv)
+
+    servidor = ServidorPaginas(args.atraso)
+    pasta = tempfile.mkdtemp(prefix="benchmark_navegador_")
+    sessao = os.path.join(pasta, "sessao.json")
+    bloquear = ("image", "media", "font")
+    rastreadores = RASTREADORES + ("localhost",)  # o "analytics" local é servido por outro host
+    cenarios = {
+        "sem bloqueio": ((), (), None),
+        "bloqueio": (bloquear, rastreadores, None),
+        "bloqueio + sessão": (bloquear, rastreadores, sessao),
+    }
+
+    try:
+        # Uma passada para gravar a sessão (como um login feito antes)
+        medir(servidor, 1, bloquear, rastreadores, sessao)
+        resultados = {}
+        for cenario, (bloq, rast, sess) in cenarios.items():
+            print(f"⏱️  {cenario}: {args.paginas} páginas ({args.repeticoes}x)...")
+            medicoes = [medir(servidor, args.paginas, bloq, rast, sess) for _ in range(args.repeticoes)]
+            resultados[cenario] = min(medicoes, key=lambda m: m["duracao"])
+    finally:
+        servidor.fechar()
+
+    imprimir_resultados(resultados)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
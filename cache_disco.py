@@ -0,0 +1,138 @@
+import os
+import time
+import hashlib
+import threading
+from utilitarios import escrever_json_atomico, ler_json
+
+# ---------------- Cache Persistente em Disco ----------------
+class CacheDisco:
+    """
+    Cache em disco com um arquivo JSON por chave. Entradas mais antigas que `ttl`
+    segundos são tratadas como expiradas (mas continuam disponíveis para
+    revalidação) e, quando o total passa de `max_bytes`, as menos usadas
+    recentemente são removidas (LRU pela data de modificação do arquivo).
+    """
+
+    def __init__(self, diretorio, ttl=None, max_bytes=None):
+        self.diretorio = diretorio
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self.contadores = {"hits": 0, "misses": 0, "expirados": 0, "revalidados": 0, "removidos": 0}
+        os.makedirs(diretorio, exist_ok=True)
+        self._tamanhos = self._indexar()
+
+    def _indexar(self):
+        tamanhos = {}
+        for raiz, _, arquivos in os.walk(self.diretorio):
+            for nome in arquivos:
+                if nome.endswith(".json") and not nome.startswith(".tmp_"):
+                    caminho = os.path.join(raiz, nome)
+                    tamanhos[caminho] = os.path.getsize(caminho)
+        return tamanhos
+
+    def _caminho(self, chave):
+        resumo = hashlib.sha256(chave.encode("utf-8")).hexdigest()
+        return os.path.join(self.diretorio, resumo[:2], f"{resumo}.json")
+
+    # ---- Leitura ----
+    def obter_entrada(self, chave):
+        """
+        Retorna (valor, meta, expirado) ou None se a chave não existir.
+        Não conta hit/miss: serve para quem quer revalidar entradas expiradas.
+        """
+        caminho = self._caminho(chave)
+        entrada = ler_json(caminho)
+        if not entrada or entrada.get("chave") != chave:
+            return None
+        expirado = self.ttl is not None and time.time() - entrada.get("criado_em", 0) > self.ttl
+        return entrada.get("valor"), entrada.get("meta") or {}, expirado
+
+    def obter(self, chave):
+        """Retorna o valor se existir e não estiver expirado; senão None"""
+        entrada = self.obter_entrada(chave)
+        if entrada is None:
+            self.registrar("misses")
+            return None
+        valor, _, expirado = entrada
+        if expirado:
+            self.registrar("expirados")
+            return None
+        self.registrar_uso(chave)
+        return valor
+
+    def registrar_uso(self, chave):
+        """Conta um hit e marca a entrada como usada recentemente"""
+        self.registrar("hits")
+        try:
+            os.utime(self._caminho(chave))
+        except OSError:
+            pass
+
+    def registrar(self, contador, quantidade=1):
+        with self._lock:
+            self.contadores[contador] += quantidade
+
+    # ---- Escrita ----
+    def gravar(self, chave, valor, meta=None):
+        caminho = self._caminho(chave)
+        escrever_json_atomico(caminho, {
+            "chave": chave,
+            "criado_em": time.time(),
+            "meta": meta or {},
+            "valor": valor,
+        })
+        with self._lock:
+            self._tamanhos[caminho] = os.path.getsize(caminho)
+        self._remover_excesso()
+
+    def renovar(self, chave):
+        """Reinicia o TTL de uma entrada que foi revalidada e continua igual"""
+        entrada = self.obter_entrada(chave)
+        if entrada is not None:
+            valor, meta, _ = entrada
+            self.gravar(chave, valor, meta)
+            self.registrar("revalidados")
+
+    def remover(self, chave):
+        caminho = self._caminho(chave)
+        with self._lock:
+            self._tamanhos.pop(caminho, None)
+        if os.path.exists(caminho):
+            os.remove(caminho)
+
+    def _remover_excesso(self):
+        """Remove as entradas usadas há mais tempo até o cache caber em max_bytes"""
+        if self.max_bytes is None:
+            return
+        with self._lock:
+            total = sum(self._tamanhos.values())
+            if total <= self.max_bytes:
+                return
+
+            def ultimo_uso(caminho):
+                try:
+                    return os.path.getmtime(caminho)
+                except OSError:
+                    return 0
+
+            for caminho in sorted(self._tamanhos, key=ultimo_uso):
+                if total <= self.max_bytes:
+                    break
+                total -= self._tamanhos.pop(caminho)
+                try:
+                    os.remove(caminho)
+                except OSError:
+                    pass
+                self.contadores["removidos"] += 1
+
+    # ---- Estatísticas ----
+    def estatisticas(self):
+        with self._lock:
+            consultas = self.contadores["hits"] + self.contadores["misses"] + self.contadores["expirados"]
+            return {
+                **self.contadores,
+                "itens": len(self._tamanhos),
+                "bytes": sum(self._tamanhos.values()),
+                "taxa_acerto": round(self.contadores["hits"] / consultas, 3) if consultas else 0.0,
+            }
@@ -0,0 +1,215 @@
+import os
+import shutil
+import hashlib
+import threading
+from cache_disco import CacheDisco
+
+# ---------------- Cache de Documentos (Etapa 4) ----------------
+class CacheDocumentos:
+    """
+    Cache dos documentos renderizados na Etapa 4, endereçado por conteúdo: o
+    arquivo fica uma vez só em objetos/{sha256}.{formato} e um índice
+    (CacheDisco) liga cada URL ao hash, com ETag/Last-Modified da resposta.
+
+    Dentro do TTL o documento é só ligado (hard link, ou cópia) ao artefato do
+    GUID. Depois do TTL, se houver validadores, uma requisição condicional
+    confirma que nada mudou (304) antes de reaproveitar. Enquanto uma thread
+    renderiza uma URL, as outras que pedem a mesma esperam e reaproveitam o
+    resultado, então cada página é buscada uma vez só por lote.
+    """
+
+    def __init__(self, diretorio, ttl=None):
+        self.diretorio = diretorio
+        self.indice = CacheDisco(os.path.join(diretorio, "indice"), ttl=ttl)
+        self.pasta_objetos = os.path.join(diretorio, "objetos")
+        os.makedirs(self.pasta_objetos, exist_ok=True)
+        self._lock = threading.Lock()
+        self._em_andamento = {}
+        self.contadores = {"hits": 0, "misses": 0, "revalidados": 0, "deduplicados": 0, "bytes_economizados": 0}
+
+    @staticmethod
+    def chave(link, formato):
+        return f"{formato}:{link}"
+
+    def caminho_objeto(self, resumo, formato):
+        return os.path.join(self.pasta_objetos, resumo[:2], f"{resumo}.{formato}")
+
+    def _registrar(self, contador, quantidade=1):
+        with self._lock:
+            self.contadores[contador] += quantidade
+
+    # ---- Consulta ----
+    def consultar(self, link, formato):
+        """Retorna (entrada, expirado) ou None se a URL não estiver no cache (ou o objeto sumiu)"""
+        entrada = self.indice.obter_entrada(self.chave(link, formato))
+        if entrada is None:
+            return None
+        valor, _, expirado = entrada
+        if not os.path.exists(self.caminho_objeto(valor["hash"], formato)):
+            return None
+        return valor, expirado
+
+    def validadores(self, valor):
+        """Cabeçalhos da requisição condicional (vazio se a resposta original não tinha ETag/Last-Modified)"""
+        headers = {}
+        if valor.get("etag"):
+            headers["If-None-Match"] = valor["etag"]
+        if valor.get("last_modified"):
+            headers["If-Modified-Since"] = valor["last_modified"]
+        return headers
+
+    # ---- Reserva (deduplicação entre threads) ----
+    def reservar(self, link, formato):
+        """
+        Marca a URL como "sendo buscada". Retorna None se esta thread ficou
+        responsável por buscá-la, ou o Event a esperar se outra já está buscando
+        """
+        chave = self.chave(link, formato)
+        with self._lock:
+            evento = self._em_andamento.get(chave)
+            if evento is not None:
+                return evento
+            self._em_andamento[chave] = threading.Event()
+            return None
+
+    def liberar(self, link, formato):
+        with self._lock:
+            evento = self._em_andamento.pop(self.chave(link, formato), None)
+        if evento is not None:
+            evento.set()
+
+    # ---- Escrita ----
+    def armazenar(self, link, formato, caminho_tmp, validadores=None):
+        """Move o arquivo renderizado para o objeto do seu hash e aponta a URL para ele"""
+        sha = hashlib.sha256()
+        with open(caminho_tmp, "rb") as f:
+            for bloco in iter(lambda: f.read(1024 * 1024), b""):
+                sha.update(bloco)
+        resumo = sha.hexdigest()
+        destino = self.caminho_objeto(resumo, formato)
+        os.makedirs(os.path.dirname(destino), exist_ok=True)
+        if os.path.exists(destino):
+            os.remove(caminho_tmp)  # mesmo conteúdo de outra URL (ou de antes)
+        else:
+            os.replace(caminho_tmp, destino)
+        validadores = validadores or {}
+        self.indice.gravar(self.chave(link, formato), {
+            "hash": resumo,
+            "bytes": os.path.getsize(destino),
+            "etag": validadores.get("etag"),
+            "last_modified": validadores.get("last-modified"),
+        })
+        return {"hash": resumo, "bytes": os.path.getsize(destino)}
+
+    def renovar(self, link, formato):
+        self.indice.renovar(self.chave(link, formato))
+        self._registrar("revalidados")
+
+    def materializar(self, valor, formato, destinos, economizado=True):
+        """Liga o objeto aos artefatos dos GUIDs (hard link; cópia se o sistema não suportar)"""
+        origem = self.caminho_objeto(valor["hash"], formato)
+        for destino in destinos:
+            if os.path.exists(destino):
+                os.remove(destino)
+            try:
+                os.link(origem, destino)
+            except OSError:
+                shutil.copyfile(origem, destino)
+        if economizado:
+            self._registrar("bytes_economizados", valor["bytes"] * len(destinos))
+
+    # ---- Orquestração ----
+    def obter(self, destinos_por_link, formato, renderizar, revalidar, espera=300):
+        """
+        Garante cada documento em seus destinos, buscando só o que não está no cache.
+
+        destinos_por_link: {link: [caminhos dos artefatos]}
+        renderizar(links) -> {link: (caminho_tmp, validadores) ou exceção}
+        revalidar([(link, headers)]) -> {link: True se não mudou (304)}
+        Retorna {link: None ou a exceção da busca}
+        """
+        resultados = {}
+        buscar, expirados, esperar = [], [], {}
+
+        for link in destinos_por_link:
+            consulta = self.consultar(link, formato)
+            if consulta is not None and not consulta[1]:
+                self._registrar("hits")
+                self.materializar(consulta[0], formato, destinos_por_link[link])
+                resultados[link] = None
+                continue
+            evento = self.reservar(link, formato)
+            if evento is not None:
+                esperar[link] = evento
+            elif consulta is not None and self.validadores(consulta[0]):
+                expirados.append((link, consulta[0]))
+            else:
+                buscar.append(link)
+
+        reservados = buscar + [link for link, _ in expirados]
+        try:
+            if expirados:
+                inalterados = revalidar([(link, self.validadores(valor)) for link, valor in expirados])
+                for link, valor in expirados:
+                    if inalterados.get(link):
+                        self.renovar(link, formato)
+                        self.materializar(valor, formato, destinos_por_link[link])
+                        resultados[link] = None
+                    else:
+                        buscar.append(link)
+            self._buscar(buscar, formato, destinos_por_link, renderizar, resultados)
+        finally:
+            for link in reservados:
+                self.liberar(link, formato)
+
+        # Só depois de liberar as próprias reservas espera as das outras threads
+        # (duas threads esperando uma pela outra travariam); o que a outra não
+        # conseguiu buscar é buscado aqui
+        pendentes = []
+        for link, evento in esperar.items():
+            evento.wait(espera)
+            consulta = self.consultar(link, formato)
+            if consulta is not None and not consulta[1]:
+                self._registrar("deduplicados")
+                self.materializar(consulta[0], formato, destinos_por_link[link])
+                resultados[link] = None
+            else:
+                pendentes.append(link)
+        self._buscar(pendentes, formato, destinos_por_link, renderizar, resultados)
+        return resultados
+
+    def _buscar(self, links, formato, destinos_por_link, renderizar, resultados):
+        if not links:
+            return
+        self._registrar("misses", len(links))
+        for link, resultado in renderizar(links).items():
+            if isinstance(resultado, Exception):
+                resultados[link] = resultado
+                continue
+            caminho_tmp, validadores = resultado
+            valor = self.armazenar(link, formato, caminho_tmp, validadores)
+            self.materializar(valor, formato, destinos_por_link[link], economizado=False)
+            resultados[link] = None
+
+    # ---- Estatísticas ----
+    def estatisticas(self):
+        with self._lock:
+            contadores = dict(self.contadores)
+        reaproveitados = contadores["hits"] + contadores["revalidados"] + contadores["deduplicados"]
+        consultas = reaproveitados + contadores["misses"]
+        return {
+            **contadores,
+            "taxa_acerto": round(reaproveitados / consultas, 3) if consultas else 0.0,
+        }
+
+def criar_cache_documentos():
+    """
+    DOCS_CACHE=0 desliga; DOCS_CACHE_TTL (s, padrão 7 dias);
+    DOCS_CACHE_DIR (padrão Historico/cache/docs)
+    """
+    if os.getenv("DOCS_CACHE", "1") == "0":
+        return None
+    return CacheDocumentos(
+        os.getenv("DOCS_CACHE_DIR", os.path.join("Historico", "cache", "docs")),
+        ttl=float(os.getenv("DOCS_CACHE_TTL", "604800"))
+    )
@@ -0,0 +1,280 @@
+import os
+import re
+import json
+import time
+import random
+import asyncio
+import hashlib
+import threading
+from collections import deque
+from openai import OpenAI, AsyncOpenAI, RateLimitError, APITimeoutError, APIConnectionError, InternalServerError
+from cache_disco import CacheDisco
+
+# ---------------- Configuração ----------------
+def configuracao_ia():
+    """
+    IA_TEMPERATURA (padrão 0.7); IA_BASE_URL (endpoint compatível com a API da OpenAI, p.ex. um stub
+    local); IA_CACHE=0 desliga o cache de respostas; IA_FORCAR=1 ignora o que está no cache (e grava
+    a resposta nova); IA_CACHE_DIR (padrão Historico/cache/respostas_ia); IA_CACHE_MAX_MB (padrão 64);
+    IA_CACHE_TTL (segundos; padrão sem expiração).
+    Modo em lote (assíncrono): IA_CONCORRENCIA requisições simultâneas (padrão 8), IA_RPM e IA_TPM
+    limites por minuto (padrão 60 e 90000; 0 = sem limite), IA_TOKENS_RESPOSTA tokens de resposta
+    reservados no TPM até a API informar o uso (padrão 800), IA_TENTATIVAS (padrão 5), IA_BACKOFF e
+    IA_BACKOFF_MAX (segundos, padrão 1 e 60), IA_TIMEOUT por requisição (segundos, padrão 120)
+    """
+    ttl = float(os.getenv("IA_CACHE_TTL", "0"))
+    return {
+        "temperatura": float(os.getenv("IA_TEMPERATURA", "0.7")),
+        "base_url": os.getenv("IA_BASE_URL") or None,
+        "cache": os.getenv("IA_CACHE", "1") != "0",
+        "forcar": os.getenv("IA_FORCAR", "0") == "1",
+        "cache_dir": os.getenv("IA_CACHE_DIR", os.path.join("Historico", "cache", "respostas_ia")),
+        "cache_max_bytes": int(float(os.getenv("IA_CACHE_MAX_MB", "64")) * 1024 * 1024),
+        "cache_ttl": ttl or None,
+        "concorrencia": max(int(os.getenv("IA_CONCORRENCIA", "8")), 1),
+        "rpm": int(os.getenv("IA_RPM", "60")),
+        "tpm": int(os.getenv("IA_TPM", "90000")),
+        "tokens_resposta": int(os.getenv("IA_TOKENS_RESPOSTA", "800")),
+        "tentativas": max(int(os.getenv("IA_TENTATIVAS", "5")), 1),
+        "backoff": float(os.getenv("IA_BACKOFF", "1")),
+        "backoff_max": float(os.getenv("IA_BACKOFF_MAX", "60")),
+        "timeout": float(os.getenv("IA_TIMEOUT", "120")),
+    }
+
+# ---------------- Recursos Compartilhados ----------------
+_lock = threading.Lock()
+_cliente = None
+_cache = None
+_cache_criado = False
+_contadores = {"chamadas_api": 0, "respostas_cache": 0, "tokens_economizados": 0,
+               "retentativas": 0, "esperas_limite": 0, "segundos_espera_limite": 0.0}
+
+def obter_cliente(config=None):
+    """Cliente da OpenAI criado na primeira chamada (importar o módulo não exige OPENAI_API_KEY)"""
+    global _cliente
+    config = config or configuracao_ia()
+    with _lock:
+        if _cliente is None:
+            _cliente = OpenAI(api_key=os.getenv("OPENAI_API_KEY"), base_url=config["base_url"])
+        return _cliente
+
+def obter_cache(config):
+    global _cache, _cache_criado
+    with _lock:
+        if not _cache_criado:
+            _cache = CacheDisco(config["cache_dir"], ttl=config["cache_ttl"],
+                                max_bytes=config["cache_max_bytes"]) if config["cache"] else None
+            _cache_criado = True
+        return _cache
+
+def estatisticas():
+    with _lock:
+        metricas = {"cliente_ia": {k: round(v, 3) if isinstance(v, float) else v for k, v in _contadores.items()}}
+    if _cache is not None:
+        metricas["cache_ia"] = _cache.estatisticas()
+    return metricas
+
+def _registrar(contador, quantidade=1):
+    with _lock:
+        _contadores[contador] += quantidade
+
+# ---------------- Chave do Cache ----------------
+def normalizar(texto):
+    """Sem espaços no fim das linhas, espaços/tabs repetidos nem linhas em branco extras"""
+    linhas = [re.sub(r"[ \t]+", " ", linha).strip() for linha in (texto or "").splitlines()]
+    return re.sub(r"\n{3,}", "\n\n", "\n".join(linhas)).strip()
+
+def _normalizar_valores(valor):
+    if isinstance(valor, str):
+        return normalizar(valor)
+    if isinstance(valor, dict):
+        return {k: _normalizar_valores(v) for k, v in valor.items()}
+    if isinstance(valor, (list, tuple)):
+        return [_normalizar_valores(v) for v in valor]
+    return valor
+
+def chave_resposta(modelo, mensagens, parametros, identidade=None):
+    """
+    Hash do modelo, dos parâmetros e do conteúdo normalizado de cada mensagem. Com
+    `identidade` (ex.: prompt_ia.identidade_prompt), ela entra no lugar das mensagens:
+    partes que mudam a cada execução (linhas da amostra) não invalidam o cache
+    """
+    dados = {"modelo": modelo, "parametros": parametros}
+    if identidade is not None:
+        dados["identidade"] = _normalizar_valores(identidade)
+    else:
+        dados["mensagens"] = [{"role": m["role"], "content": normalizar(m["content"])} for m in mensagens]
+    return hashlib.sha256(json.dumps(dados, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+def _uso(resposta):
+    uso = getattr(resposta, "usage", None)
+    return {"prompt_tokens": getattr(uso, "prompt_tokens", None),
+            "completion_tokens": getattr(uso, "completion_tokens", None)}
+
+# ---------------- Chamada ----------------
+def _do_cache(cache, chave, forcar):
+    if cache is None or forcar:
+        return None
+    valor = cache.obter(chave)
+    if valor is None:
+        return None
+    _registrar("respostas_cache")
+    _registrar("tokens_economizados", sum(v or 0 for v in valor["uso"].values()))
+    return {**valor, "cache": True}
+
+def _guardar(cache, chave, modelo, resposta):
+    valor = {"conteudo": resposta.choices[0].message.content.strip(), "uso": _uso(resposta)}
+    _registrar("chamadas_api")
+    if cache is not None:
+        cache.gravar(chave, valor, {"modelo": modelo})
+    return {**valor, "cache": False}
+
+def completar(mensagens, modelo, parametros=None, forcar=None, config=None, identidade=None):
+    """
+    Resposta do chat completions, reaproveitando a de uma chamada idêntica
+    (mesmo modelo, parâmetros e mensagens normalizadas, ou mesma `identidade`) se estiver no cache.
+    Retorna {"conteudo", "uso": {"prompt_tokens", "completion_tokens"}, "cache": bool, "duracao"}
+    """
+    inicio = time.perf_counter()
+    config = config or configuracao_ia()
+    parametros = parametros if parametros is not None else {"temperature": config["temperatura"]}
+    forcar = config["forcar"] if forcar is None else forcar
+    cache = obter_cache(config)
+    chave = chave_resposta(modelo, mensagens, parametros, identidade)
+    em_cache = _do_cache(cache, chave, forcar)
+    if em_cache is not None:
+        return {**em_cache, "duracao": time.perf_counter() - inicio}
+    resposta = obter_cliente(config).chat.completions.create(model=modelo, messages=mensagens, **parametros)
+    return {**_guardar(cache, chave, modelo, resposta), "duracao": time.perf_counter() - inicio}
+
+# ---------------- Execução em Lote (assíncrona) ----------------
+ERROS_TRANSITORIOS = (RateLimitError, APITimeoutError, APIConnectionError, InternalServerError)
+
+class LimiteTaxa:
+    """
+    Janela deslizante de 60s com limite de requisições (rpm) e de tokens (tpm).
+    Cada requisição reserva os tokens estimados; quando a resposta chega, a
+    reserva é trocada pelo uso real informado pela API (concluir)
+    """
+
+    JANELA = 60.0
+
+    def __init__(self, rpm=0, tpm=0):
+        self.rpm, self.tpm = rpm, tpm
+        self.registros = deque()  # [instante, tokens]
+        self._lock = asyncio.Lock()
+
+    def _limpar(self, agora):
+        self.registros = deque(r for r in self.registros if agora - r[0] < self.JANELA)
+
+    async def aguardar(self, tokens):
+        """Espera até a requisição caber nos limites; retorna o registro para ajuste posterior"""
+        inicio = time.monotonic()
+        async with self._lock:
+            while True:
+                agora = time.monotonic()
+                self._limpar(agora)
+                usados = sum(r[1] for r in self.registros)
+                cabe_rpm = not self.rpm or len(self.registros) < self.rpm
+                # uma requisição maior que o TPM inteiro passa sozinha com a janela vazia
+                cabe_tpm = not self.tpm or usados + tokens <= self.tpm or not self.registros
+                if cabe_rpm and cabe_tpm:
+                    registro = [agora, tokens]
+                    self.registros.append(registro)
+                    break
+                mais_antigo = min(r[0] for r in self.registros)
+                await asyncio.sleep(max(self.JANELA - (agora - mais_antigo), 0.01))
+        espera = time.monotonic() - inicio
+        if espera > 0.01:
+            _registrar("esperas_limite")
+            _registrar("segundos_espera_limite", round(espera, 3))
+        return registro
+
+    def concluir(self, registro, tokens=None):
+        """
+        Conta a requisição a partir do fim dela (a API a registra em algum momento
+        entre o envio e a resposta) e troca a reserva pelos tokens reais, se informados
+        """
+        registro[0] = time.monotonic()
+        if tokens is not None:
+            registro[1] = tokens
+
+def _espera_retentativa(erro, tentativa, config):
+    """Retry-After da API, se houver; senão backoff exponencial com jitter"""
+    resposta = getattr(erro, "response", None)
+    retry_after = resposta.headers.get("retry-after") if resposta is not None else None
+    try:
+        if retry_after is not None:
+            return min(float(retry_after), config["backoff_max"])
+    except ValueError:
+        pass
+    return min(config["backoff"] * 2 ** tentativa, config["backoff_max"]) * random.uniform(0.5, 1.0)
+
+async def completar_async(cliente, limite, mensagens, modelo, parametros, tokens_estimados, forcar, config,
+                          identidade=None):
+    """Como completar(), respeitando o limite de taxa e com retentativas em erros transitórios (429, 5xx, rede)"""
+    inicio = time.perf_counter()
+    cache = obter_cache(config)
+    chave = chave_resposta(modelo, mensagens, parametros, identidade)
+    em_cache = _do_cache(cache, chave, forcar)
+    if em_cache is not None:
+        return {**em_cache, "duracao": time.perf_counter() - inicio}
+    for tentativa in range(config["tentativas"]):
+        registro = await limite.aguardar(tokens_estimados + config["tokens_resposta"])
+        try:
+            resposta = await cliente.chat.completions.create(model=modelo, messages=mensagens, **parametros)
+        except ERROS_TRANSITORIOS as e:
+            limite.concluir(registro)
+            if tentativa == config["tentativas"] - 1:
+                raise
+            _registrar("retentativas")
+            await asyncio.sleep(_espera_retentativa(e, tentativa, config))
+            continue
+        except Exception:
+            limite.concluir(registro)
+            raise
+        uso = _uso(resposta)
+        limite.concluir(registro, uso["prompt_tokens"] + (uso["completion_tokens"] or 0)
+                        if uso["prompt_tokens"] is not None else None)
+        return {**_guardar(cache, chave, modelo, resposta), "duracao": time.perf_counter() - inicio}
+
+async def _executar_lote(pedidos, modelo, parametros, forcar, ao_concluir, config):
+    cliente = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"), base_url=config["base_url"],
+                          timeout=config["timeout"], max_retries=0)
+    limite = LimiteTaxa(config["rpm"], config["tpm"])
+    semaforo = asyncio.Semaphore(config["concorrencia"])
+    resultados = {}
+
+    async def tarefa(identificador, mensagens, tokens_estimados, identidade=None):
+        async with semaforo:
+            try:
+                resultado = await completar_async(cliente, limite, mensagens, modelo, parametros,
+                                                  tokens_estimados, forcar, config, identidade)
+            except Exception as e:
+                resultado = e
+        # o resultado vai para o disco assim que chega, sem esperar o resto do lote
+        if ao_concluir is not None:
+            try:
+                resultado = await asyncio.to_thread(ao_concluir, identificador, resultado)
+            except Exception as e:
+                resultado = e
+        resultados[identificador] = resultado
+
+    try:
+        await asyncio.gather(*(tarefa(*pedido) for pedido in pedidos))
+    finally:
+        await cliente.close()
+    return resultados
+
+def completar_lote(pedidos, modelo, ao_concluir=None, parametros=None, forcar=None, config=None):
+    """
+    Várias chamadas em paralelo (asyncio) sob IA_CONCORRENCIA, IA_RPM e IA_TPM.
+    pedidos: [(identificador, mensagens, tokens estimados do prompt[, identidade para o cache])]
+    ao_concluir(identificador, resposta ou exceção) roda (numa thread) assim que
+    cada uma termina; o que ele retornar vira o resultado.
+    Retorna {identificador: resultado ou exceção}
+    """
+    config = config or configuracao_ia()
+    parametros = parametros if parametros is not None else {"temperature": config["temperatura"]}
+    forcar = config["forcar"] if forcar is None else forcar
+    return asyncio.run(_executar_lote(pedidos, modelo, parametros, forcar, ao_concluir, config))
@@ -0,0 +1,153 @@
+import os
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    from pyarrow import flight
+except ImportError:  # pyarrow vem com o dremio-simple-query; sem ele só o ODBC fica disponível
+    pa = None
+    pc = None
+    flight = None
+
+# Transportes suportados para ler dados do Dremio
+TRANSPORTES = ("odbc", "flight")
+
+def transporte_configurado():
+    """DREMIO_TRANSPORTE: "odbc" (padrão) ou "flight" (Arrow Flight, porta 32010)"""
+    transporte = os.getenv("DREMIO_TRANSPORTE", "odbc").lower()
+    if transporte not in TRANSPORTES:
+        raise ValueError(f"⚠️ Transporte do Dremio inválido: {transporte}. Use um de {TRANSPORTES}")
+    return transporte
+
+def flight_disponivel():
+    return flight is not None
+
+# ---------------- Lotes Arrow ----------------
+def _tipo_texto_ou_binario(tipo):
+    return (pa.types.is_string(tipo) or pa.types.is_large_string(tipo)
+            or pa.types.is_binary(tipo) or pa.types.is_large_binary(tipo))
+
+def truncar_lote_arrow(lote, limite, truncar_celula):
+    """
+    Aplica `truncar_celula(valor, limite)` às colunas de texto/binárias de um
+    RecordBatch. Colunas sem nenhum valor acima do limite (caso comum) são
+    mantidas como estão, sem sair do Arrow. Retorna (lote, células truncadas)
+    """
+    if not limite:
+        return lote, 0
+    colunas = list(lote.columns)
+    truncadas = 0
+    for i, coluna in enumerate(colunas):
+        if not _tipo_texto_ou_binario(coluna.type):
+            continue
+        maior = pc.max(pc.binary_length(coluna)).as_py()
+        if maior is None or maior <= limite:
+            continue
+        valores = []
+        for valor in coluna.to_pylist():
+            valor, truncado = truncar_celula(valor, limite)
+            truncadas += truncado
+            valores.append(valor)
+        colunas[i] = pa.array(valores, type=coluna.type)
+    if not truncadas:
+        return lote, 0
+    return pa.RecordBatch.from_arrays(colunas, schema=lote.schema), truncadas
+
+def tabela_arrow(lotes, schema):
+    return pa.Table.from_batches(lotes, schema=schema)
+
+# ---------------- Conexão Arrow Flight ----------------
+class ConexaoFlight:
+    """
+    Conexão com o Dremio via Arrow Flight com a mesma interface mínima de uma
+    conexão DB-API (cursor/close), para as estratégias de amostragem rodarem
+    sem mudança. Os resultados chegam em record batches colunares, sem a
+    conversão linha a linha do ODBC.
+    """
+
+    def __init__(self, host, port, user, password, tls=False, timeout=30):
+        if flight is None:
+            raise ImportError("pyarrow não está instalado (necessário para DREMIO_TRANSPORTE=flight)")
+        esquema = "grpc+tls" if tls else "grpc+tcp"
+        self.cliente = flight.FlightClient(f"{esquema}://{host}:{port}")
+        token = self.cliente.authenticate_basic_token(user, password, flight.FlightCallOptions(timeout=timeout))
+        self.opcoes = flight.FlightCallOptions(headers=[token])
+
+    def cursor(self):
+        return CursorFlight(self)
+
+    def ler(self, query):
+        """Executa a query e devolve um leitor de record batches (streaming)"""
+        descritor = flight.FlightDescriptor.for_command(query)
+        info = self.cliente.get_flight_info(descritor, self.opcoes)
+        return self.cliente.do_get(info.endpoints[0].ticket, self.opcoes)
+
+    def close(self):
+        self.cliente.close()
+
+class CursorFlight:
+    """Cursor no estilo DB-API sobre um stream Flight, lendo um record batch por vez"""
+
+    def __init__(self, conexao):
+        self.conexao = conexao
+        self.description = None
+        self.schema = None
+        self._leitor = None
+        self._pendentes = []
+
+    def execute(self, query):
+        self._leitor = self.conexao.ler(query)
+        self._pendentes = []
+        self.schema = self._leitor.schema
+        self.description = [(campo.name, campo.type, None, None, None, None, True)
+                            for campo in self._leitor.schema]
+        return self
+
+    def _proximo_lote(self):
+        try:
+            lote = self._leitor.read_chunk().data
+        except StopIteration:
+            return None
+        return list(zip(*(coluna.to_pylist() for coluna in lote.columns))) if lote.num_columns else []
+
+    def fetchmany(self, tamanho=1000):
+        while len(self._pendentes) < tamanho:
+            linhas = self._proximo_lote()
+            if linhas is None:
+                break
+            self._pendentes.extend(linhas)
+        linhas, self._pendentes = self._pendentes[:tamanho], self._pendentes[tamanho:]
+        return linhas
+
+    def fetchone(self):
+        linhas = self.fetchmany(1)
+        return linhas[0] if linhas else None
+
+    def fetchall(self):
+        linhas = self._pendentes
+        self._pendentes = []
+        while True:
+            lote = self._proximo_lote()
+            if lote is None:
+                return linhas
+            linhas.extend(lote)
+
+    def iterar_lotes_arrow(self):
+        """Gera os RecordBatches conforme chegam do servidor (um por vez em memória)"""
+        if self._pendentes:
+            raise RuntimeError("iterar_lotes_arrow não pode ser usado depois de fetchmany/fetchone")
+        while True:
+            try:
+                yield self._leitor.read_chunk().data
+            except StopIteration:
+                return
+
+    def fetch_arrow(self):
+        """Lê o restante do resultado como pyarrow.Table, sem passar por objetos Python"""
+        if self._pendentes:
+            raise RuntimeError("fetch_arrow não pode ser usado depois de fetchmany/fetchone")
+        return self._leitor.read_all()
+
+    def close(self):
+        self._leitor = None
+        self._pendentes = []
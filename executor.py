@@ -0,0 +1,360 @@
+import os
+import sys
+import time
+import importlib
+import threading
+import traceback
+import subprocess
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+HISTORICO_DIR = "Historico"
+LOGS_DIR = os.path.join(HISTORICO_DIR, "logs")
+
+# Módulo da Etapa 3: Etapa3kubernetes (credenciais do Dremio em /run/secrets) ou
+# Etapa3 (variáveis DREMIO_*); ETAPA3_MODULO troca o padrão
+ETAPA3_MODULO = os.getenv("ETAPA3_MODULO", "Etapa3kubernetes")
+
+def definicao_etapa3(modulo):
+    return {"script": f"{modulo}.py", "modulo": modulo, "funcao": "executar_etapa3"}
+
+# Mapeamento etapa -> script (modo subprocesso) e função importável (modo em processo)
+ETAPAS = {
+    "etapa2": {"script": "Etapa2.py", "modulo": "Etapa2", "funcao": "executar_etapa2"},
+    "etapa3": definicao_etapa3(ETAPA3_MODULO),
+    "schema": {"script": "Etapa3kubernetes.py", "argumentos": ["--somente-schema"], "modulo": "Etapa3kubernetes",
+               "funcao": "executar_schema", "funcao_lote": "executar_schema_lote"},
+    "perfil": {"script": "perfil.py", "modulo": "perfil", "funcao": "executar_perfil"},
+    "etapa4": {"script": "Etapa4.py", "modulo": "Etapa4", "funcao": "executar_etapa4"},
+    "etapa5": {"script": "Etapa5.py", "modulo": "Etapa5", "funcao": "executar_etapa5",
+               "funcao_lote": "executar_etapa5_lote"},
+}
+
+# Etapas 2, 3 e 4 (e o schema) só dependem do YAML da Etapa 1; o perfil usa a amostra
+# da Etapa 3 e a Etapa 5 usa os artefatos de todas
+DEPENDENCIAS = {
+    "etapa2": [],
+    "etapa3": [],
+    "schema": [],
+    "perfil": ["etapa3"],
+    "etapa4": [],
+    "etapa5": ["etapa2", "etapa3", "schema", "perfil", "etapa4"],
+}
+
+# ---------------- Logs por GUID/Etapa ----------------
+def caminho_log(guid, script, argumentos=()):
+    """Historico/logs/{guid}_{script}[_{argumentos}].log, o mesmo nos dois modos de execução"""
+    nome_log = "_".join([guid, os.path.splitext(script)[0]] + [a.lstrip("-") for a in argumentos])
+    return os.path.join(LOGS_DIR, f"{nome_log}.log")
+
+class SaidaPorThread:
+    """
+    Substitui sys.stdout/sys.stderr: o que cada thread imprime vai para o arquivo que
+    ela registrou (capturar_saida) ou, sem registro, para a saída original. Assim as
+    etapas que rodam ao mesmo tempo não misturam as mensagens.
+    """
+
+    def __init__(self, original):
+        self.original = original
+        self.local = threading.local()
+
+    def _destino(self):
+        return getattr(self.local, "arquivo", None) or self.original
+
+    def write(self, texto):
+        return self._destino().write(texto)
+
+    def flush(self):
+        self._destino().flush()
+
+    def __getattr__(self, nome):
+        return getattr(self.original, nome)
+
+_lock_saida = threading.Lock()
+
+def _instalar_saida():
+    with _lock_saida:
+        if not isinstance(sys.stdout, SaidaPorThread):
+            sys.stdout = SaidaPorThread(sys.stdout)
+        if not isinstance(sys.stderr, SaidaPorThread):
+            sys.stderr = SaidaPorThread(sys.stderr)
+    return sys.stdout, sys.stderr
+
+@contextmanager
+def capturar_saida(caminho):
+    """
+    Grava em `caminho` o stdout/stderr da thread atual enquanto o bloco roda
+    (threads criadas pela própria etapa continuam na saída original)
+    """
+    os.makedirs(os.path.dirname(caminho), exist_ok=True)
+    saidas = _instalar_saida()
+    with open(caminho, "w", encoding="utf-8") as arquivo:
+        anteriores = [getattr(s.local, "arquivo", None) for s in saidas]
+        for saida in saidas:
+            saida.local.arquivo = arquivo
+        try:
+            yield arquivo
+        finally:
+            for saida, anterior in zip(saidas, anteriores):
+                saida.local.arquivo = anterior
+
+def ler_log(caminho):
+    if not os.path.exists(caminho):
+        return ""
+    with open(caminho, "r", encoding="utf-8", errors="replace") as f:
+        return f.read()
+
+# ---------------- Execução em Subprocesso (isolamento) ----------------
+def rodar_script(script, guid, timeout=None, argumentos=()):
+    """Executa uma etapa em subprocesso e grava a saída em Historico/logs"""
+    os.makedirs(LOGS_DIR, exist_ok=True)
+    caminho_log_etapa = caminho_log(guid, script, argumentos)
+    try:
+        result = subprocess.run(
+            [sys.executable, script, guid, *argumentos],
+            capture_output=True,
+            text=True,
+            timeout=timeout
+        )
+        saida, erro = result.stdout, result.stderr
+        ok = result.returncode == 0
+    except subprocess.TimeoutExpired as e:
+        saida, erro = e.stdout or "", f"Timeout de {timeout}s excedido"
+        ok = False
+
+    with open(caminho_log_etapa, "w", encoding="utf-8") as f:
+        f.write(saida if isinstance(saida, str) else saida.decode("utf-8", "replace"))
+        if erro:
+            f.write("\n--- stderr ---\n")
+            f.write(erro if isinstance(erro, str) else erro.decode("utf-8", "replace"))
+
+    if ok:
+        return True, None
+    # Última linha não vazia costuma ter a mensagem de erro da etapa
+    linhas = [l for l in (f"{saida}\n{erro}").splitlines() if l.strip()]
+    return False, linhas[-1] if linhas else f"{script} falhou sem mensagem"
+
+# ---------------- Executor de Etapas ----------------
+class ExecutorEtapas:
+    """
+    Executa as etapas chamando as funções dos módulos diretamente, num processo
+    de longa duração: imports, configurações e token do Purview são carregados
+    uma vez só. O modo "subprocesso" (ou uma falha de import) usa rodar_script
+    como fallback de isolamento. `modulo_etapa3` escolhe o módulo da Etapa 3
+    (padrão ETAPA3_MODULO).
+    """
+
+    def __init__(self, modo="processo", timeout=None, modulo_etapa3=None):
+        if modo not in ("processo", "subprocesso"):
+            raise ValueError(f"❌ Modo de execução inválido: {modo}")
+        self.modo = modo
+        self.timeout = timeout
+        self.etapas = dict(ETAPAS)
+        if modulo_etapa3:
+            self.etapas["etapa3"] = definicao_etapa3(modulo_etapa3)
+        self._modulos = {}
+        self._isoladas = set()
+        self._lock = threading.Lock()
+        self._configuracoes_purview = None
+        self._token_purview = None
+        self._custo_inicializacao = {}
+
+    # ---- Imports compartilhados ----
+    def _modulo(self, etapa):
+        """Importa o módulo da etapa uma única vez; se falhar, marca a etapa como isolada"""
+        with self._lock:
+            if etapa in self._modulos:
+                return self._modulos[etapa]
+            if etapa in self._isoladas:
+                return None
+            try:
+                self._modulos[etapa] = importlib.import_module(self.etapas[etapa]["modulo"])
+                return self._modulos[etapa]
+            except Exception as e:
+                print(f"⚠️  Não foi possível importar {self.etapas[etapa]['modulo']} ({e}). Usando subprocesso.")
+                self._isoladas.add(etapa)
+                return None
+
+    def _contexto_purview(self, modulo):
+        """
+        Carrega configurações do Purview uma vez para todos os GUIDs. O token é
+        a função do gerenciador compartilhado, que renova em segundo plano.
+        """
+        with self._lock:
+            if self._configuracoes_purview is None:
+                configuracoes = modulo.carregar_configuracoes()
+                gerenciador = modulo.obter_gerenciador_token(configuracoes)
+                gerenciador.obter_token()
+                gerenciador.iniciar_renovacao()
+                self._configuracoes_purview = configuracoes
+                self._token_purview = gerenciador.obter_token
+            return self._configuracoes_purview, self._token_purview
+
+    # ---- Execução ----
+    def caminho_log(self, etapa, guid):
+        definicao = self.etapas[etapa]
+        return caminho_log(guid, definicao["script"], definicao.get("argumentos", ()))
+
+    def log(self, etapa, guid):
+        """Saída da última execução da etapa para o GUID (Historico/logs)"""
+        return ler_log(self.caminho_log(etapa, guid))
+
+    def executar(self, etapa, guid):
+        """
+        Executa uma etapa para um GUID. Retorna (ok, erro). Em processo, o stdout/stderr
+        da chamada vai para o mesmo log por GUID/etapa do modo subprocesso
+        """
+        modulo = self._modulo(etapa) if self.modo == "processo" else None
+        if modulo is None:
+            definicao = self.etapas[etapa]
+            return rodar_script(definicao["script"], guid, self.timeout, definicao.get("argumentos", ()))
+
+        with capturar_saida(self.caminho_log(etapa, guid)):
+            try:
+                funcao = getattr(modulo, self.etapas[etapa]["funcao"])
+                if etapa == "etapa2":
+                    configuracoes, token = self._contexto_purview(modulo)
+                    funcao(guid, configuracoes=configuracoes, token=token)
+                else:
+                    funcao(guid)
+                return True, None
+            except Exception as e:
+                traceback.print_exc()
+                return False, f"{type(e).__name__}: {e}"
+
+    def executar_etapa2_lote(self, guids):
+        """
+        Roda a Etapa 2 de vários GUIDs de uma vez (endpoint bulk do Purview).
+        Retorna {guid: (ok, erro)}; vazio se a etapa não puder rodar em processo.
+        """
+        modulo = self._modulo("etapa2") if self.modo == "processo" else None
+        if modulo is None or not guids:
+            return {}
+        configuracoes, token = self._contexto_purview(modulo)
+        resultados = modulo.executar_etapa2_lote(guids, configuracoes=configuracoes, token=token)
+        return {
+            guid: (False, f"{type(r).__name__}: {r}") if isinstance(r, Exception) else (True, None)
+            for guid, r in resultados.items()
+        }
+
+    def executar_em_lote(self, etapa, guids):
+        """
+        Roda uma etapa com "funcao_lote" (ex.: schema, etapa5) para vários GUIDs de uma vez.
+        Retorna {guid: (ok, erro)}; vazio se a etapa não puder rodar em processo.
+        """
+        modulo = self._modulo(etapa) if self.modo == "processo" else None
+        if modulo is None or not guids or "funcao_lote" not in self.etapas[etapa]:
+            return {}
+        resultados = getattr(modulo, self.etapas[etapa]["funcao_lote"])(guids)
+        return {
+            guid: (False, f"{type(r).__name__}: {r}") if isinstance(r, Exception) else (True, None)
+            for guid, r in resultados.items()
+        }
+
+    def estatisticas(self):
+        """Métricas dos recursos compartilhados (pools, caches) dos módulos já carregados"""
+        metricas = {}
+        for modulo in list(self._modulos.values()):
+            if hasattr(modulo, "estatisticas"):
+                metricas.update(modulo.estatisticas())
+        return metricas
+
+    # ---- Medição da inicialização evitada ----
+    def custo_inicializacao(self, etapas):
+        """
+        Mede quanto custa subir o interpretador e importar o módulo de cada etapa
+        em um processo novo, que é o que o modo subprocesso paga por GUID. Cada
+        módulo é medido uma vez só (etapa3 e schema dividem o mesmo); módulo que
+        não importa fica como None (indisponível), não como um tempo
+        """
+        custos = self._custo_inicializacao
+        for etapa in dict.fromkeys(etapas):
+            modulo = self.etapas[etapa]["modulo"]
+            if modulo in custos:
+                continue
+            inicio = time.perf_counter()
+            resultado = subprocess.run([sys.executable, "-c", f"import {modulo}"], capture_output=True)
+            custos[modulo] = time.perf_counter() - inicio if resultado.returncode == 0 else None
+        return {etapa: custos[self.etapas[etapa]["modulo"]] for etapa in etapas}
+
+    def inicializacao_evitada(self, etapas_executadas):
+        """
+        Soma o custo de inicialização das etapas rodadas em processo (uma por GUID executado).
+        Retorna (segundos, etapas cujo módulo não importou num processo novo)
+        """
+        if self.modo != "processo":
+            return 0.0, []
+        em_processo = [e for e in etapas_executadas if e not in self._isoladas]
+        custos = self.custo_inicializacao(em_processo)
+        indisponiveis = sorted({e for e in em_processo if custos[e] is None})
+        return sum(custos[e] for e in em_processo if custos[e] is not None), indisponiveis
+
+# ---------------- Agendador de Etapas (DAG) ----------------
+def executar_dag(tarefas, dependencias=DEPENDENCIAS, max_paralelo=None):
+    """
+    Executa as tarefas {nome: callable() -> (ok, erro)} respeitando as dependências.
+    Tarefas independentes rodam em paralelo. Dependências que não estão em `tarefas`
+    são consideradas já concluídas (ex.: etapa retomada ou pulada). Se uma tarefa
+    falha, as que dependem dela ficam como "bloqueada".
+    Retorna {nome: {"status", "inicio", "fim", "duracao", "erro"}}
+    """
+    pendentes = dict(tarefas)
+    resultados = {}
+    origem = time.perf_counter()
+
+    def deps_de(nome):
+        return [d for d in dependencias.get(nome, []) if d in tarefas]
+
+    def rodar(nome):
+        inicio = time.perf_counter()
+        try:
+            ok, erro = tarefas[nome]()
+        except Exception as e:
+            ok, erro = False, f"{type(e).__name__}: {e}"
+        fim = time.perf_counter()
+        return nome, ok, erro, inicio - origem, fim - origem
+
+    with ThreadPoolExecutor(max_workers=max_paralelo or max(len(tarefas), 1)) as pool:
+        em_execucao = {}
+        while pendentes or em_execucao:
+            # Bloqueia quem depende de tarefa que falhou
+            for nome in list(pendentes):
+                falhas = [d for d in deps_de(nome) if d in resultados and resultados[d]["status"] != "ok"]
+                if falhas:
+                    resultados[nome] = {"status": "bloqueada", "inicio": None, "fim": None,
+                                        "duracao": 0.0, "erro": f"depende de {', '.join(falhas)}"}
+                    del pendentes[nome]
+
+            # Dispara todas as tarefas prontas
+            for nome in list(pendentes):
+                if all(d in resultados for d in deps_de(nome)):
+                    em_execucao[pool.submit(rodar, nome)] = nome
+                    del pendentes[nome]
+
+            if not em_execucao:
+                continue
+
+            concluidos, _ = wait(em_execucao, return_when=FIRST_COMPLETED)
+            for futuro in concluidos:
+                del em_execucao[futuro]
+                nome, ok, erro, inicio, fim = futuro.result()
+                resultados[nome] = {"status": "ok" if ok else "falha", "inicio": inicio, "fim": fim,
+                                    "duracao": fim - inicio, "erro": erro}
+
+    return resultados
+
+def caminho_critico(resultados, dependencias=DEPENDENCIAS):
+    """
+    Calcula o caminho crítico (a cadeia de dependências mais longa) usando as
+    durações medidas. Retorna (lista de etapas, duração total em segundos)
+    """
+    memo = {}
+
+    def mais_longo(nome):
+        if nome not in memo:
+            anteriores = [mais_longo(d) for d in dependencias.get(nome, []) if d in resultados]
+            cadeia, duracao = max(anteriores, key=lambda c: c[1], default=([], 0.0))
+            memo[nome] = (cadeia + [nome], duracao + resultados[nome]["duracao"])
+        return memo[nome]
+
+    return max((mais_longo(n) for n in resultados), key=lambda c: c[1], default=([], 0.0))
@@ -0,0 +1,200 @@
+import os
+import re
+import math
+import hashlib
+import threading
+import unicodedata
+from collections import Counter, OrderedDict
+from cache_disco import CacheDisco
+
+# Palavras que aparecem em qualquer página e não ajudam a achar o trecho da tabela
+STOPWORDS = set("""
+a ao aos as com como da das de do dos e em entre na nas no nos o os ou para pela pelas pelo pelos por que se sem
+sao um uma umas uns the and of to in for on is are be by with from this that it or as at an
+""".split())
+
+# ---------------- Configuração ----------------
+def configuracao_indice():
+    """
+    DOCS_BUSCA=0 manda a documentação inteira (como antes); DOCS_TOP_K trechos no prompt (padrão 8);
+    DOCS_TRECHO_CARACTERES tamanho máximo de cada trecho (padrão 1500); DOCS_INDICE_DIR (padrão
+    Historico/cache/indice_docs; DOCS_INDICE_CACHE=0 não grava em disco)
+    """
+    return {
+        "busca": os.getenv("DOCS_BUSCA", "1") != "0",
+        "top_k": max(int(os.getenv("DOCS_TOP_K", "8")), 1),
+        "caracteres": max(int(os.getenv("DOCS_TRECHO_CARACTERES", "1500")), 200),
+        "cache": os.getenv("DOCS_INDICE_CACHE", "1") != "0",
+        "cache_dir": os.getenv("DOCS_INDICE_DIR", os.path.join("Historico", "cache", "indice_docs")),
+    }
+
+# ---------------- Termos ----------------
+def termos(texto):
+    """Minúsculas, sem acento, separando snake_case/camelCase; sem stopwords e termos de 1 caractere"""
+    texto = re.sub(r"([a-z])([A-Z])", r"\1 \2", texto or "")
+    texto = unicodedata.normalize("NFKD", texto.lower()).encode("ascii", "ignore").decode()
+    return [t for t in re.split(r"[^a-z0-9]+", texto) if len(t) > 1 and t not in STOPWORDS]
+
+# ---------------- Trechos ----------------
+def dividir_trechos(texto, caracteres=1500):
+    """
+    Divide o markdown em trechos de até `caracteres`, quebrando nos títulos e
+    parágrafos (uma tabela ou parágrafo maior vira vários trechos, por linha).
+    Cada trecho leva o caminho de títulos em que está, p.ex. "Produto > Campos"
+    """
+    trechos, titulos, atual = [], [], []
+
+    def fechar():
+        corpo = "\n\n".join(atual).strip()
+        if corpo:
+            trechos.append({"secao": " > ".join(t for _, t in titulos), "texto": corpo})
+        atual.clear()
+
+    for bloco in re.split(r"\n\s*\n", texto or ""):
+        bloco = bloco.strip()
+        if not bloco:
+            continue
+        titulo = re.match(r"^(#{1,6})\s+(.*)", bloco)
+        if titulo and "\n" not in bloco:
+            fechar()
+            nivel = len(titulo.group(1))
+            titulos = [(n, t) for n, t in titulos if n < nivel] + [(nivel, titulo.group(2).strip())]
+            continue
+        partes = [bloco]
+        if len(bloco) > caracteres:
+            partes, linha_atual = [], ""
+            linhas = [linha[i:i + caracteres] for linha in bloco.splitlines() for i in range(0, len(linha), caracteres)]
+            for linha in linhas:
+                if linha_atual and len(linha_atual) + len(linha) + 1 > caracteres:
+                    partes.append(linha_atual)
+                    linha_atual = ""
+                linha_atual = f"{linha_atual}\n{linha}" if linha_atual else linha
+            partes.append(linha_atual)
+        for parte in partes:
+            if atual and sum(len(a) + 2 for a in atual) + len(parte) > caracteres:
+                fechar()
+            atual.append(parte)
+    fechar()
+    return trechos
+
+# ---------------- Índice por Documento (reaproveitado entre GUIDs) ----------------
+_lock = threading.Lock()
+_documentos = OrderedDict()
+MAX_DOCUMENTOS_MEMORIA = 256
+_cache = None
+_cache_criado = False
+_contadores = {"documentos_indexados": 0, "documentos_reaproveitados": 0, "trechos_indexados": 0,
+               "buscas": 0, "trechos_selecionados": 0, "caracteres_descartados": 0}
+
+def obter_cache(config):
+    global _cache, _cache_criado
+    with _lock:
+        if not _cache_criado:
+            _cache = CacheDisco(config["cache_dir"]) if config["cache"] else None
+            _cache_criado = True
+        return _cache
+
+def estatisticas():
+    with _lock:
+        metricas = {"indice_docs": dict(_contadores)}
+    if _cache is not None:
+        metricas["cache_indice_docs"] = _cache.estatisticas()
+    return metricas
+
+def _registrar(**quantidades):
+    with _lock:
+        for contador, quantidade in quantidades.items():
+            _contadores[contador] += quantidade
+
+def indexar_documento(texto, config=None):
+    """
+    Trechos do documento com a frequência de cada termo. A chave é o hash do
+    texto, então o mesmo documento em outro GUID (ou execução) não é dividido de novo
+    """
+    config = config or configuracao_indice()
+    chave = f"{config['caracteres']}:{hashlib.sha256(texto.encode('utf-8')).hexdigest()}"
+    with _lock:
+        if chave in _documentos:
+            _documentos.move_to_end(chave)
+            _contadores["documentos_reaproveitados"] += 1
+            return _documentos[chave]
+    cache = obter_cache(config)
+    trechos = cache.obter(chave) if cache is not None else None
+    if trechos is not None:
+        _registrar(documentos_reaproveitados=1)
+    else:
+        trechos = dividir_trechos(texto, config["caracteres"])
+        for trecho in trechos:
+            trecho["termos"] = dict(Counter(termos(f"{trecho['secao']} {trecho['texto']}")))
+        if cache is not None:
+            cache.gravar(chave, trechos)
+        _registrar(documentos_indexados=1, trechos_indexados=len(trechos))
+    with _lock:
+        _documentos[chave] = trechos
+        while len(_documentos) > MAX_DOCUMENTOS_MEMORIA:
+            _documentos.popitem(last=False)
+    return trechos
+
+# ---------------- BM25 ----------------
+class IndiceBM25:
+    """BM25 (Okapi) sobre os trechos de um ou mais documentos"""
+
+    def __init__(self, trechos, k1=1.5, b=0.75):
+        self.trechos = trechos
+        self.k1, self.b = k1, b
+        self.tamanhos = [sum(t["termos"].values()) for t in trechos]
+        self.media = sum(self.tamanhos) / len(trechos) if trechos else 0.0
+        frequencia_docs = Counter(termo for t in trechos for termo in t["termos"])
+        n = len(trechos)
+        self.idf = {termo: math.log(1 + (n - df + 0.5) / (df + 0.5)) for termo, df in frequencia_docs.items()}
+
+    def pontuar(self, consulta):
+        pesos = Counter(consulta)
+        pontuacoes = []
+        for trecho, tamanho in zip(self.trechos, self.tamanhos):
+            pontuacao = 0.0
+            for termo, peso in pesos.items():
+                tf = trecho["termos"].get(termo)
+                if tf:
+                    normalizacao = self.k1 * (1 - self.b + self.b * tamanho / (self.media or 1))
+                    pontuacao += peso * self.idf[termo] * tf * (self.k1 + 1) / (tf + normalizacao)
+            pontuacoes.append(pontuacao)
+        return pontuacoes
+
+    def buscar(self, consulta, k):
+        """Índices dos k trechos mais relevantes (só os com alguma pontuação)"""
+        pontuacoes = self.pontuar(consulta)
+        melhores = sorted(range(len(pontuacoes)), key=lambda i: -pontuacoes[i])[:k]
+        return [i for i in melhores if pontuacoes[i] > 0]
+
+# ---------------- Seleção para o Prompt ----------------
+def consulta_tabela(projecao, colunas=()):
+    """Termos da busca: nome e nome qualificado da tabela, descrição do Purview e colunas"""
+    tabela = projecao.get("tabela", {})
+    nomes_colunas = [c["nome"] for c in projecao.get("colunas", [])] + [str(c) for c in colunas]
+    # nome da tabela pesa mais que cada coluna
+    consulta = termos(tabela.get("nome", "")) * 3 + termos(tabela.get("nome_qualificado", ""))
+    consulta += termos(tabela.get("descricao", "")) + termos(" ".join(dict.fromkeys(nomes_colunas)))
+    return consulta
+
+def selecionar_trechos(documentos, consulta, config=None):
+    """
+    Junta os trechos mais relevantes dos documentos para a consulta, na ordem
+    em que aparecem nos documentos. Se tudo couber em top_k trechos, ou se nada
+    casar com a consulta, devolve os primeiros trechos
+    """
+    config = config or configuracao_indice()
+    por_documento = [indexar_documento(texto, config) for texto in documentos if texto.strip()]
+    trechos = [t for lista in por_documento for t in lista]
+    if not trechos:
+        return ""
+    if len(trechos) <= config["top_k"]:
+        escolhidos = list(range(len(trechos)))
+    else:
+        escolhidos = sorted(IndiceBM25(trechos).buscar(consulta, config["top_k"])) or list(range(config["top_k"]))
+    partes = [f"[{trechos[i]['secao']}]\n{trechos[i]['texto']}" if trechos[i]["secao"] else trechos[i]["texto"]
+              for i in escolhidos]
+    selecionados = set(escolhidos)
+    _registrar(buscas=1, trechos_selecionados=len(escolhidos),
+               caracteres_descartados=sum(len(t["texto"]) for i, t in enumerate(trechos) if i not in selecionados))
+    return "\n\n---\n\n".join(partes)
@@ -0,0 +1,329 @@
+import os
+import sys
+import time
+import shutil
+import argparse
+import functools
+import threading
+import yaml
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from utilitarios import escrever_json_atomico, ler_json
+from executor import ExecutorEtapas, executar_dag, caminho_critico
+
+HISTORICO_DIR = "Historico"
+ARQUIVO_STATUS_PADRAO = os.path.join(HISTORICO_DIR, "lote_status.json")
+
+# Etapas executadas para cada GUID (dependências em executor.DEPENDENCIAS)
+ETAPAS = ["etapa2", "etapa3", "perfil", "etapa4"]
+# --somente-schema: metadados do Purview + schema do Dremio, sem amostra nem documentação
+ETAPAS_SCHEMA = ["etapa2", "schema"]
+
+# ---------------- Leitura das Entradas ----------------
+def ler_entradas(caminhos):
+    """
+    Monta a lista de GUIDs a partir de arquivos texto (um GUID por linha)
+    ou de YAMLs da Etapa 1 (Historico/{guid}.yaml)
+    """
+    guids = []
+    for caminho in caminhos:
+        if not os.path.exists(caminho):
+            raise FileNotFoundError(f"❌ Arquivo de entrada não encontrado: {caminho}")
+
+        if caminho.endswith((".yaml", ".yml")):
+            with open(caminho, "r", encoding="utf-8") as f:
+                dados = yaml.safe_load(f) or {}
+            guid = dados.get("guid")
+            if not guid:
+                raise ValueError(f"⚠️ Campo 'guid' não encontrado em {caminho}")
+
+            # As etapas sempre leem Historico/{guid}.yaml
+            destino = os.path.join(HISTORICO_DIR, f"{guid}.yaml")
+            if os.path.abspath(caminho) != os.path.abspath(destino) and not os.path.exists(destino):
+                os.makedirs(HISTORICO_DIR, exist_ok=True)
+                shutil.copyfile(caminho, destino)
+            guids.append(guid)
+        else:
+            with open(caminho, "r", encoding="utf-8") as f:
+                for linha in f:
+                    linha = linha.strip()
+                    if linha and not linha.startswith("#"):
+                        guids.append(linha)
+
+    # Remove duplicados mantendo a ordem
+    return list(dict.fromkeys(guids))
+
+def carregar_yaml_etapa1(guid):
+    caminho = os.path.join(HISTORICO_DIR, f"{guid}.yaml")
+    if not os.path.exists(caminho):
+        raise FileNotFoundError(f"❌ Arquivo {caminho} não encontrado. Rode a Etapa 1 antes.")
+    with open(caminho, "r", encoding="utf-8") as f:
+        return yaml.safe_load(f) or {}
+
+# ---------------- Status Persistente do Lote ----------------
+class StatusLote:
+    """Guarda o status de cada GUID/etapa em JSON para permitir retomar o lote"""
+
+    def __init__(self, caminho=ARQUIVO_STATUS_PADRAO, reiniciar=False):
+        self.caminho = caminho
+        self.lock = threading.Lock()
+        self.dados = {} if reiniciar else ler_json(caminho, {})
+
+    def etapa_concluida(self, guid, etapa):
+        with self.lock:
+            registro = self.dados.get(guid, {}).get("etapas", {}).get(etapa, {})
+            return registro.get("status") in ("ok", "pulada")
+
+    def registrar_etapa(self, guid, etapa, status, duracao=0.0, erro=None):
+        with self.lock:
+            registro = self.dados.setdefault(guid, {"status": "pendente", "etapas": {}})
+            registro["etapas"][etapa] = {
+                "status": status,
+                "duracao": round(duracao, 3),
+                "erro": erro,
+                "atualizado_em": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            }
+            self._salvar()
+
+    def registrar_guid(self, guid, status, erro=None, caminho_critico=None):
+        with self.lock:
+            registro = self.dados.setdefault(guid, {"status": "pendente", "etapas": {}})
+            registro["status"] = status
+            registro["erro"] = erro
+            if caminho_critico:
+                registro["caminho_critico"] = caminho_critico
+            self._salvar()
+
+    def _salvar(self):
+        escrever_json_atomico(self.caminho, self.dados)
+
+# ---------------- Execução das Etapas ----------------
+def processar_guid(guid, status, executor, etapas=ETAPAS):
+    """
+    Roda as etapas pendentes de um GUID como um DAG: as independentes em paralelo,
+    a Etapa 5 (se pedida) depois das demais. Retorna (resultados do DAG, caminho crítico)
+    """
+    dados = carregar_yaml_etapa1(guid)
+    links = dados.get("confluence_docs", [])
+
+    tarefas = {}
+    for etapa in etapas:
+        if status.etapa_concluida(guid, etapa):
+            continue
+        if etapa == "etapa4" and not links:
+            status.registrar_etapa(guid, etapa, "pulada")
+            continue
+        tarefas[etapa] = functools.partial(executor.executar, etapa, guid)
+
+    resultados = executar_dag(tarefas)
+    for etapa, r in resultados.items():
+        status.registrar_etapa(guid, etapa, r["status"], r["duracao"], r["erro"])
+
+    falhas = [f"{e}: {r['erro']}" for e, r in resultados.items() if r["status"] == "falha"]
+    if falhas:
+        raise RuntimeError("; ".join(falhas))
+    return resultados, caminho_critico(resultados)
+
+def pre_executar_etapa2(guids, status, executor):
+    """
+    Resolve a Etapa 2 dos GUIDs pendentes em lote pelo endpoint bulk. Quem falhar
+    aqui é tentado de novo individualmente no DAG do GUID.
+    """
+    pendentes = [g for g in guids if not status.etapa_concluida(g, "etapa2")]
+    if len(pendentes) < 2:
+        return
+    inicio = time.perf_counter()
+    try:
+        resultados = executor.executar_etapa2_lote(pendentes)
+    except Exception as e:
+        print(f"⚠️  Etapa 2 em lote falhou ({e}); seguindo GUID a GUID")
+        return
+    if not resultados:
+        return
+    duracao = (time.perf_counter() - inicio) / len(resultados)
+    for guid, (ok, erro) in resultados.items():
+        if ok:
+            status.registrar_etapa(guid, "etapa2", "ok", duracao)
+    print(f"📦 Etapa 2 em lote: {sum(ok for ok, _ in resultados.values())}/{len(pendentes)} GUIDs resolvidos")
+
+def pre_executar_schema(guids, status, executor):
+    """
+    Lê o schema de todos os GUIDs pendentes em uma consulta ao INFORMATION_SCHEMA.
+    Quem falhar aqui é tentado de novo individualmente no DAG do GUID.
+    """
+    pendentes = [g for g in guids if not status.etapa_concluida(g, "schema")]
+    if len(pendentes) < 2:
+        return
+    inicio = time.perf_counter()
+    try:
+        resultados = executor.executar_em_lote("schema", pendentes)
+    except Exception as e:
+        print(f"⚠️  Schema em lote falhou ({e}); seguindo GUID a GUID")
+        return
+    if not resultados:
+        return
+    duracao = (time.perf_counter() - inicio) / len(resultados)
+    for guid, (ok, erro) in resultados.items():
+        if ok:
+            status.registrar_etapa(guid, "schema", "ok", duracao)
+    print(f"📐 Schema em lote: {sum(ok for ok, _ in resultados.values())}/{len(pendentes)} GUIDs resolvidos")
+
+def pos_executar_etapa5(resultados, status, executor):
+    """
+    Etapa 5 dos GUIDs concluídos, em lote: as chamadas à IA rodam juntas
+    (assíncronas, com limites de taxa) em vez de uma por worker do DAG
+    """
+    pendentes = [g for g, (r, _, _) in resultados.items() if r == "ok" and not status.etapa_concluida(g, "etapa5")]
+    if not pendentes:
+        return
+    inicio = time.perf_counter()
+    try:
+        resultados_ia = executor.executar_em_lote("etapa5", pendentes)
+    except Exception as e:
+        resultados_ia = {guid: (False, f"{type(e).__name__}: {e}") for guid in pendentes}
+    if not resultados_ia:
+        # Sem execução em lote (import falhou ou modo isolado): uma chamada por GUID
+        print("⚠️  Etapa 5 em lote indisponível; seguindo GUID a GUID")
+        resultados_ia = {guid: executor.executar("etapa5", guid) for guid in pendentes}
+    duracao = (time.perf_counter() - inicio) / len(pendentes)
+    for guid in pendentes:
+        ok, erro = resultados_ia.get(guid, (False, "sem resultado da Etapa 5 em lote"))
+        status.registrar_etapa(guid, "etapa5", "ok" if ok else "falha", duracao, erro)
+        if not ok:
+            status.registrar_guid(guid, "falha", f"etapa5: {erro}")
+            resultados[guid] = ("falha", resultados[guid][1], f"etapa5: {erro}")
+            print(f"❌ {guid} - etapa5: {erro}")
+    concluidos = sum(bool(resultados_ia.get(guid, (False,))[0]) for guid in pendentes)
+    print(f"🤖 Etapa 5 em lote: {concluidos}/{len(pendentes)} GUIDs concluídos")
+
+def executar_lote(guids, workers=4, status=None, executor=None, etapas=ETAPAS):
+    """
+    Processa os GUIDs em um pool limitado de workers.
+    Retorna ({guid: (status, duracao, erro)}, {guid: (resultados do DAG, caminho crítico)})
+    """
+    status = status or StatusLote()
+    executor = executor or ExecutorEtapas()
+    resultados = {}
+    tempos = {}
+
+    def tarefa(guid):
+        inicio = time.perf_counter()
+        try:
+            tempos[guid] = processar_guid(guid, status, executor, etapas)
+            caminho, duracao_cc = tempos[guid][1]
+            status.registrar_guid(guid, "ok", caminho_critico={"etapas": caminho, "duracao": round(duracao_cc, 3)})
+            return guid, "ok", time.perf_counter() - inicio, None
+        except Exception as e:
+            status.registrar_guid(guid, "falha", str(e))
+            return guid, "falha", time.perf_counter() - inicio, str(e)
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futuros = [pool.submit(tarefa, guid) for guid in guids]
+        for i, futuro in enumerate(as_completed(futuros), start=1):
+            guid, resultado, duracao, erro = futuro.result()
+            resultados[guid] = (resultado, duracao, erro)
+            icone = "✅" if resultado == "ok" else "❌"
+            print(f"{icone} [{i}/{len(guids)}] {guid} ({duracao:.1f}s){f' - {erro}' if erro else ''}")
+
+    return resultados, tempos
+
+# ---------------- Resumo ----------------
+def imprimir_resumo(resultados, duracao_total, tempos=None, inicializacao_evitada=None, estatisticas=None):
+    total = len(resultados)
+    falhas = {g: r for g, r in resultados.items() if r[0] != "ok"}
+    sucesso = total - len(falhas)
+    vazao = (sucesso / duracao_total * 60) if duracao_total > 0 else 0.0
+
+    print("\n📈 Resumo do lote:")
+    print(f"   - GUIDs processados: {total}")
+    print(f"   - Sucesso: {sucesso}")
+    print(f"   - Falhas: {len(falhas)}")
+    print(f"   - Tempo total: {duracao_total:.1f}s")
+    print(f"   - Vazão: {vazao:.2f} tabelas/min")
+    evitada, indisponiveis = inicializacao_evitada or (0.0, [])
+    if evitada and total:
+        print(f"   - Inicialização de subprocessos evitada: {evitada:.1f}s "
+              f"(~{evitada / total:.2f}s por GUID)")
+    if indisponiveis:
+        print(f"   - Inicialização não medida (módulo não importa em processo novo): {', '.join(indisponiveis)}")
+    if tempos:
+        por_etapa = {}
+        for dag, _ in tempos.values():
+            for etapa, r in dag.items():
+                por_etapa.setdefault(etapa, []).append(r["duracao"])
+        print("⏱️  Tempo médio por etapa:")
+        for etapa, duracoes in sorted(por_etapa.items()):
+            print(f"   - {etapa}: {sum(duracoes) / len(duracoes):.1f}s")
+        soma = sum(sum(r["duracao"] for r in dag.values()) for dag, _ in tempos.values()) / len(tempos)
+        critico = sum(cc[1] for _, cc in tempos.values()) / len(tempos)
+        print(f"   - Soma das etapas (sequencial): {soma:.1f}s por GUID")
+        print(f"   - Caminho crítico (paralelo): {critico:.1f}s por GUID")
+    for nome, metricas in (estatisticas or {}).items():
+        print(f"♻️  {nome}: " + ", ".join(f"{k}={v}" for k, v in metricas.items()))
+    if falhas:
+        print("❌ GUIDs com falha (rode novamente para retomar):")
+        for guid, (_, _, erro) in falhas.items():
+            print(f"   - {guid}: {erro}")
+
+# ---------------- Execução Principal ----------------
+def main():
+    parser = argparse.ArgumentParser(description="Executa as Etapas 2, 3 e 4 (e opcionalmente a 5) para uma lista de GUIDs")
+    parser.add_argument("entradas", nargs="+", help="Arquivo com GUIDs (um por linha) ou YAMLs da Etapa 1")
+    parser.add_argument("--workers", type=int, default=4, help="Quantidade de GUIDs processados em paralelo")
+    parser.add_argument("--status", default=ARQUIVO_STATUS_PADRAO, help="Arquivo JSON de status do lote")
+    parser.add_argument("--reiniciar", action="store_true", help="Ignora o status anterior e reprocessa tudo")
+    parser.add_argument("--timeout", type=int, default=None, help="Timeout por etapa no modo isolado, em segundos")
+    parser.add_argument("--com-ia", action="store_true", help="Inclui a Etapa 5 (IA) após as etapas 2, 3 e 4")
+    parser.add_argument("--ia-lote", action="store_true",
+                        help="Com --com-ia, roda a Etapa 5 de todos os GUIDs no final, com chamadas assíncronas em paralelo")
+    parser.add_argument("--forcar-ia", action="store_true",
+                        help="Com --com-ia, chama a IA mesmo quando a resposta já está no cache")
+    parser.add_argument("--sem-bulk", action="store_true", help="Não usa o endpoint bulk do Purview na Etapa 2")
+    parser.add_argument("--somente-schema", action="store_true",
+                        help="Lê só o schema das tabelas (INFORMATION_SCHEMA), sem amostra, perfil nem Etapa 4")
+    parser.add_argument("--isolado", action="store_true", help="Roda cada etapa em um subprocesso Python separado")
+    parser.add_argument("--medir-inicializacao", action="store_true",
+                        help="No resumo, mede (importando cada módulo executado num processo novo) a inicialização evitada")
+    args = parser.parse_args()
+
+    try:
+        guids = ler_entradas(args.entradas)
+    except (FileNotFoundError, ValueError) as e:
+        print(e)
+        sys.exit(1)
+
+    status = StatusLote(args.status, reiniciar=args.reiniciar)
+    # Com --com-ia, GUID concluído sem a Etapa 5 (p.ex. lote interrompido antes da IA em lote) volta
+    pendentes = [g for g in guids if status.dados.get(g, {}).get("status") != "ok"
+                 or (args.com_ia and not status.etapa_concluida(g, "etapa5"))]
+    executor = ExecutorEtapas(modo="subprocesso" if args.isolado else "processo", timeout=args.timeout)
+    print(f"🚀 {len(guids)} GUIDs na entrada, {len(pendentes)} pendentes, {args.workers} workers ({executor.modo})")
+
+    inicio = time.perf_counter()
+    if not args.sem_bulk:
+        pre_executar_etapa2(pendentes, status, executor)
+    etapas = ETAPAS_SCHEMA if args.somente_schema else ETAPAS
+    if args.somente_schema:
+        pre_executar_schema(pendentes, status, executor)
+    # A Etapa 5 em lote roda em processo; com --isolado fica no DAG de cada GUID
+    ia_lote = args.com_ia and args.ia_lote and not args.isolado
+    if args.com_ia:
+        if not ia_lote:
+            etapas = etapas + ["etapa5"]
+        if args.forcar_ia:
+            os.environ["IA_FORCAR"] = "1"  # vale também para as etapas em subprocesso
+    resultados, tempos = executar_lote(pendentes, workers=args.workers, status=status,
+                                       executor=executor, etapas=etapas)
+    if ia_lote:
+        pos_executar_etapa5(resultados, status, executor)
+    duracao = time.perf_counter() - inicio
+    inicializacao = None
+    if args.medir_inicializacao:
+        executadas = [e for dag, _ in tempos.values() for e, r in dag.items() if r["inicio"] is not None]
+        inicializacao = executor.inicializacao_evitada(executadas)
+    imprimir_resumo(resultados, duracao, tempos, inicializacao, executor.estatisticas())
+
+    if any(r[0] != "ok" for r in resultados.values()):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -1,29 +1,43 @@
 import streamlit as st
-import subprocess
 import os
+import functools
 import yaml
+from executor import ExecutorEtapas, executar_dag, caminho_critico
 
 HISTORICO_DIR = "Historico"
 os.makedirs(HISTORICO_DIR, exist_ok=True)
 
 # ----------------- Funções Auxiliares -----------------
 
-def run_script(script, args=[]):
-    """Executa um script python externo e captura o retorno"""
-    try:
-        result = subprocess.run(
-            ["python", script] + args,
-            capture_output=True,
-            text=True,
-            check=True
-        )
-        st.success(f"✅ {script} executado com sucesso")
-        st.text(result.stdout)
-        return True
-    except subprocess.CalledProcessError as e:
-        st.error(f"❌ Erro ao executar {script}")
-        st.text(e.stderr)
-        return False
+@st.cache_resource
+def obter_executor():
+    """
+    Executor único para a sessão do Streamlit (imports e token reaproveitados).
+    A Etapa 3 da interface é a Etapa3.py (variáveis DREMIO_*), salvo ETAPA3_MODULO
+    """
+    return ExecutorEtapas(modulo_etapa3=os.getenv("ETAPA3_MODULO", "Etapa3"))
+
+def run_pipeline(guid, etapas):
+    """Executa as etapas em paralelo (respeitando dependências) e mostra os tempos"""
+    executor = obter_executor()
+    tarefas = {etapa: functools.partial(executor.executar, etapa, guid) for etapa in etapas}
+    resultados = executar_dag(tarefas)
+
+    for etapa, r in resultados.items():
+        if r["status"] == "ok":
+            st.success(f"✅ {etapa} executada com sucesso ({r['duracao']:.1f}s)")
+        else:
+            st.error(f"❌ Erro ao executar {etapa}")
+            st.text(r["erro"])
+        # Saída da etapa (Historico/logs/{guid}_{etapa}.log), como o stdout do subprocesso antes
+        saida = executor.log(etapa, guid) if r["status"] != "bloqueada" else ""
+        if saida:
+            st.text(saida)
+
+    caminho, duracao = caminho_critico(resultados)
+    soma = sum(r["duracao"] for r in resultados.values())
+    st.info(f"⏱️ Caminho crítico: {' → '.join(caminho)} ({duracao:.1f}s); soma das etapas: {soma:.1f}s")
+    return {etapa: r["status"] == "ok" for etapa, r in resultados.items()}
 
 def carregar_yaml(guid):
     caminho = os.path.join(HISTORICO_DIR, f"{guid}.yaml")
@@ -60,18 +74,19 @@ if st.button("▶️ Executar Pipeline (Etapas 2, 3 e 4)"):
     if not guid:
         st.error("⚠️ Preencha primeiro a Etapa 1")
     else:
-        ok2 = run_script("Etapa2.py", [guid])
-        ok3 = run_script("Etapa3.py", [guid])
-
         # etapa 4 só roda se houver links
         dados = carregar_yaml(guid)
         links = dados.get("confluence_docs", [])
-        ok4 = None
+        etapas = ["etapa2", "etapa3", "perfil"]
         if links:
-            ok4 = run_script("Etapa4_playwright.py", [guid])
+            etapas.append("etapa4")
         else:
             st.info("ℹ️ Nenhum link de documentação informado, pulando Etapa 4.")
 
+        # Etapas 2, 3 e 4 são independentes e rodam ao mesmo tempo
+        status = run_pipeline(guid, etapas)
+        ok2, ok3, ok4 = status["etapa2"], status["etapa3"], status.get("etapa4")
+
         if ok2 and ok3:
             st.success("🎉 Etapas 1, 2 e 3 concluídas com sucesso!")
             if ok4 or ok4 is None:
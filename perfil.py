@@ -0,0 +1,295 @@
+import os
+import re
+import sys
+import time
+import yaml
+import datetime
+import pandas as pd
+from decimal import Decimal
+from amostragem import caminho_amostra, ler_amostra, schema_origem_amostra
+
+HISTORICO_DIR = "Historico"
+
+# Padrões reconhecidos nos valores de texto (ordem = prioridade quando mais de um casa)
+PADROES = {
+    "cnpj": r"\d{2}\.?\d{3}\.?\d{3}/?\d{4}-?\d{2}",
+    "cpf": r"\d{3}\.?\d{3}\.?\d{3}-?\d{2}",
+    "data": r"\d{4}-\d{2}-\d{2}(?:[ T]\d{2}:\d{2}(?::\d{2}(?:\.\d+)?)?)?|\d{2}/\d{2}/\d{4}",
+    "moeda": r"(?:R\$\s?)?-?\d{1,3}(?:\.\d{3})*,\d{2}|R\$\s?-?\d+(?:[.,]\d{2})?",
+    "email": r"[^@\s]+@[^@\s]+\.[A-Za-z]{2,}",
+    "codigo": r"(?=[A-Z0-9._/-]*\d)[A-Z0-9][A-Z0-9._/-]{1,29}",
+}
+# Fração mínima dos valores não nulos que precisa casar para o padrão ser atribuído
+LIMIAR_PADRAO = 0.9
+TOP_K = 5
+MAX_CARACTERES_VALOR = 100
+
+# Tipo do perfil pelo nome do tipo de origem, sem parâmetros: Arrow ("int64", "decimal128(10, 2)",
+# "timestamp[us, tz=UTC]") ou tipo Python do ODBC ("int", "Decimal", "datetime")
+TIPOS_ORIGEM = {
+    "bool": "booleano",
+    **dict.fromkeys(("int", "int8", "int16", "int32", "int64", "uint8", "uint16", "uint32", "uint64"), "inteiro"),
+    **dict.fromkeys(("halffloat", "float", "double", "decimal", "decimal32", "decimal64", "decimal128",
+                     "decimal256"), "decimal"),
+    **dict.fromkeys(("date", "date32", "date64", "datetime", "timestamp", "time", "time32", "time64"), "data/hora"),
+}
+
+# ---------------- Conversões ----------------
+def tipo_arrow(tipo):
+    """Tipo do perfil para o tipo de origem ("int64", "decimal128(10, 2)", ...); None se não reconhecido"""
+    nome = re.match(r"\w*", str(tipo or "").lower()).group()
+    return TIPOS_ORIGEM.get(nome)
+
+def preparar_colunas(df, tipos_origem=None):
+    """
+    Ajusta as colunas que o to_pandas deixa com dtype errado para o perfil:
+    booleanos com nulos viram "boolean", Decimal e números em colunas object
+    viram numéricas, date/datetime viram datetime64 e inteiros com nulos
+    (float64 no pandas) voltam a inteiro (Int64)
+    """
+    tipos_origem = tipos_origem or {}
+    convertidas = {}
+    for coluna in df.columns:
+        serie = df[coluna]
+        origem = tipo_arrow(tipos_origem.get(str(coluna)))
+        if pd.api.types.is_float_dtype(serie.dtype) and origem == "inteiro":
+            convertidas[coluna] = serie.astype("Int64")
+            continue
+        if serie.dtype != object:
+            continue
+        valores = serie.dropna()
+        if valores.empty:
+            continue
+        tipos = set(map(type, valores.tolist()))
+        if tipos <= {bool}:
+            convertidas[coluna] = serie.astype("boolean")
+        elif tipos <= {int} and origem in (None, "inteiro"):
+            convertidas[coluna] = serie.astype("Int64")
+        elif all(issubclass(t, (int, float, Decimal)) and not issubclass(t, bool) for t in tipos):
+            convertidas[coluna] = pd.to_numeric(serie.map(lambda v: None if v is None else float(v)))
+        elif all(issubclass(t, datetime.date) for t in tipos):
+            convertidas[coluna] = pd.to_datetime(serie, errors="coerce")
+    return df.assign(**{str(c): s for c, s in convertidas.items()}) if convertidas else df
+
+def tipo_coluna(dtype):
+    if pd.api.types.is_bool_dtype(dtype):
+        return "booleano"
+    if pd.api.types.is_integer_dtype(dtype):
+        return "inteiro"
+    if pd.api.types.is_float_dtype(dtype):
+        return "decimal"
+    if pd.api.types.is_datetime64_any_dtype(dtype):
+        return "data/hora"
+    return "texto"
+
+def _valor(valor):
+    """Converte escalares numpy/pandas para tipos que o YAML aceita"""
+    if valor is None or (not isinstance(valor, str) and pd.isna(valor)):
+        return None
+    if hasattr(valor, "item"):
+        valor = valor.item()
+    if isinstance(valor, float):
+        return round(valor, 4)
+    if isinstance(valor, (int, bool)):
+        return valor
+    texto = str(valor)
+    return texto if len(texto) <= MAX_CARACTERES_VALOR else texto[:MAX_CARACTERES_VALOR] + "…"
+
+# ---------------- Perfil ----------------
+def nomes_unicos(colunas):
+    """Nomes das colunas como texto, com sufixo _2, _3... nos repetidos (o perfil é um dict por nome)"""
+    usados, nomes = set(), []
+    for coluna in map(str, colunas):
+        nome, n = coluna, 1
+        while nome in usados:
+            n += 1
+            nome = f"{coluna}_{n}"
+        usados.add(nome)
+        nomes.append(nome)
+    return nomes
+
+def perfilar(df, top_k=TOP_K, tipos_origem=None):
+    """
+    Perfil de todas as colunas da amostra em poucas operações vetorizadas:
+    as agregações numéricas rodam sobre o DataFrame inteiro e as de texto sobre
+    um formato longo (coluna, valor) agrupado por coluna, sem laço por coluna
+    em Python. `tipos_origem` ({coluna: tipo Arrow}) tem prioridade sobre o dtype.
+    Retorna {coluna: {tipo, nulos, distintos, min, max, top, ...}}
+    """
+    total = len(df)
+    # Colunas repetidas (ex.: SELECT com JOIN) fariam df[c] devolver um DataFrame; o tipo de
+    # origem é por nome e não diz qual das repetidas é qual, então nelas vale o dtype
+    originais = list(map(str, df.columns))
+    nomes = nomes_unicos(originais)
+    tipos_origem = {nome: (tipos_origem or {}).get(original) for nome, original in zip(nomes, originais)
+                    if originais.count(original) == 1}
+    df = preparar_colunas(df.set_axis(nomes, axis=1), tipos_origem)
+    perfil = {str(c): {"tipo": tipo_arrow(tipos_origem.get(str(c))) or tipo_coluna(df[c].dtype)}
+              for c in df.columns}
+    if not perfil:
+        return perfil
+
+    # Séries viram listas/dicts antes dos laços: indexar Series item a item é o gargalo com milhares de colunas
+    nulos = (df.isna().mean() if total else pd.Series(0.0, index=df.columns)).tolist()
+    for nome, n_nulos in zip(perfil, nulos):
+        perfil[nome]["nulos"] = round(float(n_nulos), 4)
+        perfil[nome]["distintos"] = 0
+
+    # Numéricas e datas: min/max/média direto nas colunas
+    numericas = df.select_dtypes(include="number").select_dtypes(exclude="bool")
+    if not numericas.empty:
+        for nome, estatistica in (("min", numericas.min()), ("max", numericas.max()), ("media", numericas.mean())):
+            for coluna, valor in estatistica.to_dict().items():
+                valor = _valor(valor)
+                # min/max do DataFrame saem em float quando há colunas decimais junto
+                if nome != "media" and perfil[str(coluna)]["tipo"] == "inteiro" and isinstance(valor, float):
+                    valor = int(valor)
+                perfil[str(coluna)][nome] = valor
+    booleanas = df.select_dtypes(include=["bool", "boolean"])
+    if not booleanas.empty:
+        for coluna, fracao in booleanas.mean().to_dict().items():
+            perfil[str(coluna)]["verdadeiros"] = _valor(fracao)
+    datas = df.select_dtypes(include=["datetime", "datetimetz"])
+    if not datas.empty:
+        for nome, estatistica in (("min", datas.min()), ("max", datas.max())):
+            for coluna, valor in estatistica.to_dict().items():
+                perfil[str(coluna)][nome] = _valor(valor)
+
+    # Formato longo com todos os valores não nulos como texto (colunas renomeadas
+    # para posições, para nomes como "valor" não colidirem com os do melt)
+    posicional = df.set_axis(range(df.shape[1]), axis=1)
+    longo = posicional.melt(var_name="coluna", value_name="valor").dropna(subset=["valor"])
+    if longo.empty:
+        return perfil
+    longo["coluna"] = longo["coluna"].map(dict(enumerate(perfil)))
+    longo["valor"] = longo["valor"].astype(str)
+
+    # Daqui em diante só os pares (coluna, valor) distintos, com a contagem de cada um
+    pares = longo.value_counts(["coluna", "valor"]).reset_index(name="n")
+    por_coluna = pares.groupby("coluna", sort=False)
+    for coluna, n_distintos in por_coluna.size().to_dict().items():
+        perfil[coluna]["distintos"] = int(n_distintos)
+
+    # Top-k valores (só quando há repetição; colunas todas distintas não têm "mais frequentes")
+    repetidas = pares["coluna"].map(por_coluna["n"].max()) > 1
+    top = pares[repetidas].groupby("coluna", sort=False).head(top_k)
+    for coluna, valor, n in zip(top["coluna"].tolist(), top["valor"].tolist(), top["n"].tolist()):
+        perfil[coluna].setdefault("top", []).append({"valor": _valor(valor), "n": int(n)})
+
+    # Texto: tamanhos, min/max lexicográfico e padrões (médias ponderadas pela contagem)
+    colunas_texto = [c for c, p in perfil.items() if p["tipo"] == "texto"]
+    texto = pares[pares["coluna"].isin(colunas_texto)]
+    if texto.empty:
+        return perfil
+    grupos = texto["coluna"]
+    total_valores = texto["n"].groupby(grupos).sum()
+    tamanho = texto["valor"].str.len()
+    tamanhos = pd.DataFrame({
+        "min": tamanho.groupby(grupos).min(),
+        "max": tamanho.groupby(grupos).max(),
+        "medio": (tamanho * texto["n"]).groupby(grupos).sum() / total_valores,
+    })
+    extremos = texto.groupby("coluna")["valor"].agg(["min", "max"]).to_dict("index")
+    for coluna, linha in tamanhos.to_dict("index").items():
+        perfil[coluna]["tamanho"] = {"min": int(linha["min"]), "max": int(linha["max"]),
+                                     "medio": round(float(linha["medio"]), 1)}
+        perfil[coluna]["min"] = _valor(extremos[coluna]["min"])
+        perfil[coluna]["max"] = _valor(extremos[coluna]["max"])
+
+    candidatos = texto["valor"].str.strip()
+    for padrao, regex in PADROES.items():
+        casados = candidatos.str.fullmatch(regex).astype(bool) * texto["n"]
+        taxa = casados.groupby(grupos).sum() / total_valores
+        for coluna in taxa[taxa >= LIMIAR_PADRAO].index.tolist():
+            perfil[coluna].setdefault("padrao", padrao)
+
+    return perfil
+
+def resumo_coluna(info):
+    """Frase curta com o perfil da coluna, usada na descrição das colunas da Etapa 5"""
+    partes = [info.get("tipo_origem") or info["tipo"]]
+    if info.get("padrao"):
+        partes.append(f"padrão {info['padrao'].upper()}")
+    partes.append("sem nulos" if not info.get("nulos") else f"{info['nulos']:.0%} nulos")
+    partes.append(f"{info.get('distintos', 0)} valores distintos")
+    if info.get("verdadeiros") is not None:
+        partes.append(f"{info['verdadeiros']:.0%} verdadeiros")
+    if info.get("min") is not None and info.get("max") is not None and info["tipo"] != "texto":
+        partes.append(f"de {info['min']} a {info['max']}")
+    if info.get("top"):
+        partes.append("mais frequentes: " + ", ".join(str(t["valor"]) for t in info["top"][:3]))
+    tabela = info.get("tabela")
+    if tabela:
+        inteira = [f"{tabela.get('nulos', 0):.0%} nulos"]
+        if tabela.get("distintos_aprox") is not None:
+            inteira.append(f"~{tabela['distintos_aprox']} distintos")
+        if tabela.get("min") is not None and tabela.get("max") is not None:
+            inteira.append(f"de {tabela['min']} a {tabela['max']}")
+        partes.append("na tabela inteira: " + ", ".join(inteira))
+    return "; ".join(partes)
+
+# ---------------- Artefato ----------------
+def caminho_perfil(guid, pasta=HISTORICO_DIR):
+    return os.path.join(pasta, f"{guid}_perfil.yaml")
+
+def carregar_perfil(guid, pasta=HISTORICO_DIR):
+    caminho = caminho_perfil(guid, pasta)
+    if not os.path.exists(caminho):
+        return None
+    with open(caminho, "r", encoding="utf-8") as f:
+        return yaml.safe_load(f)
+
+def carregar_estatisticas_tabela(guid, pasta=HISTORICO_DIR):
+    """Estatísticas da tabela inteira calculadas no Dremio (AMOSTRA_AGREGADOS=1), se houver"""
+    caminho = os.path.join(pasta, f"{guid}_amostra_meta.yaml")
+    if not os.path.exists(caminho):
+        return None
+    with open(caminho, "r", encoding="utf-8") as f:
+        return (yaml.safe_load(f) or {}).get("estatisticas_tabela")
+
+def executar_perfil(guid, pasta=HISTORICO_DIR):
+    """
+    Perfila a amostra da Etapa 3 e grava {guid}_perfil.yaml. Se a Etapa 3
+    calculou estatísticas da tabela inteira, elas entram em "tabela" em cada coluna.
+    """
+    path_amostra = caminho_amostra(guid, pasta)
+    if not path_amostra:
+        raise FileNotFoundError(f"❌ Amostra de {guid} não encontrada. Rode a Etapa 3 antes.")
+
+    inicio = time.perf_counter()
+    df = ler_amostra(path_amostra)
+    tipos_origem = {origem["nome"]: origem["tipo"] for origem in schema_origem_amostra(path_amostra)}
+    colunas = perfilar(df, tipos_origem=tipos_origem)
+    for nome, tipo in tipos_origem.items():
+        if nome in colunas:
+            colunas[nome]["tipo_origem"] = tipo
+    estatisticas_tabela = carregar_estatisticas_tabela(guid, pasta) or {}
+    for nome, estatisticas in (estatisticas_tabela.get("colunas") or {}).items():
+        if nome in colunas:
+            colunas[nome]["tabela"] = estatisticas
+    duracao = time.perf_counter() - inicio
+
+    caminho = caminho_perfil(guid, pasta)
+    with open(caminho, "w", encoding="utf-8") as f:
+        yaml.safe_dump({
+            "guid": guid,
+            "gerado_em": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "linhas_amostra": len(df),
+            "linhas_tabela": estatisticas_tabela.get("linhas"),
+            "tempo": round(duracao, 3),
+            "colunas": colunas,
+        }, f, allow_unicode=True, sort_keys=False)
+
+    print(f"🧮 Perfil de {len(colunas)} colunas ({len(df)} linhas) em {duracao:.2f}s: {caminho}")
+    return caminho
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("❌ Uso: python perfil.py <GUID>")
+        sys.exit(1)
+
+    try:
+        executar_perfil(sys.argv[1])
+    except Exception as e:
+        print(f"❌ Erro no perfil: {e}")
+        sys.exit(1)
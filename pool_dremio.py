@@ -0,0 +1,150 @@
+import os
+import time
+import threading
+from contextlib import contextmanager
+
+# ---------------- Pool de Conexões do Dremio ----------------
+class PoolDremio:
+    """
+    Pool de conexões do Dremio reaproveitadas entre tabelas/GUIDs, evitando
+    autenticação e handshake a cada amostra.
+
+    `fabrica` é uma função sem argumentos que abre uma conexão e devolve
+    (conexao, transporte). Conexões paradas há mais de `checar_apos` segundos
+    passam por um health check (SELECT 1) antes de serem entregues, as ociosas
+    há mais de `max_ocioso` segundos são fechadas, e conexões quebradas são
+    descartadas e reabertas sem o chamador perceber.
+    """
+
+    def __init__(self, fabrica, max_conexoes=4, max_ocioso=300, checar_apos=30, timeout=120):
+        self.fabrica = fabrica
+        self.max_conexoes = max_conexoes
+        self.max_ocioso = max_ocioso
+        self.checar_apos = checar_apos
+        self.timeout = timeout
+        self._livres = []  # [(conexao, transporte, ultimo_uso)], a mais recente no fim
+        self._abertas = 0
+        self._cond = threading.Condition()
+        self.contadores = {"criadas": 0, "reutilizadas": 0, "descartadas": 0, "expiradas": 0, "esperas": 0}
+
+    # ---- Health check ----
+    @staticmethod
+    def saudavel(conexao):
+        try:
+            cursor = conexao.cursor()
+            try:
+                cursor.execute("SELECT 1")
+                cursor.fetchall()
+            finally:
+                cursor.close()
+            return True
+        except Exception:
+            return False
+
+    @staticmethod
+    def _fechar(conexao):
+        try:
+            conexao.close()
+        except Exception:
+            pass
+
+    def _remover_ociosas(self):
+        """Fecha as conexões livres paradas há mais de max_ocioso (chamado com o lock)"""
+        agora = time.monotonic()
+        ativas = []
+        for conexao, transporte, ultimo_uso in self._livres:
+            if agora - ultimo_uso > self.max_ocioso:
+                self._fechar(conexao)
+                self._abertas -= 1
+                self.contadores["expiradas"] += 1
+            else:
+                ativas.append((conexao, transporte, ultimo_uso))
+        self._livres = ativas
+
+    # ---- Empréstimo ----
+    def _adquirir(self):
+        prazo = time.monotonic() + self.timeout
+        while True:
+            with self._cond:
+                self._remover_ociosas()
+                while not self._livres and self._abertas >= self.max_conexoes:
+                    self.contadores["esperas"] += 1
+                    if not self._cond.wait(max(prazo - time.monotonic(), 0)):
+                        raise TimeoutError(f"❌ Nenhuma conexão do Dremio livre em {self.timeout}s")
+                if self._livres:
+                    conexao, transporte, ultimo_uso = self._livres.pop()
+                else:
+                    conexao = None
+                    self._abertas += 1
+
+            if conexao is None:
+                try:
+                    conexao, transporte = self.fabrica()
+                except Exception:
+                    with self._cond:
+                        self._abertas -= 1
+                        self._cond.notify()
+                    raise
+                with self._cond:
+                    self.contadores["criadas"] += 1
+                return conexao, transporte
+
+            # Fora do lock: o health check faz ida e volta ao servidor
+            if time.monotonic() - ultimo_uso <= self.checar_apos or self.saudavel(conexao):
+                with self._cond:
+                    self.contadores["reutilizadas"] += 1
+                return conexao, transporte
+            self._descartar(conexao)
+
+    def _descartar(self, conexao):
+        self._fechar(conexao)
+        with self._cond:
+            self._abertas -= 1
+            self.contadores["descartadas"] += 1
+            self._cond.notify()
+
+    def _devolver(self, conexao, transporte):
+        with self._cond:
+            self._livres.append((conexao, transporte, time.monotonic()))
+            self._cond.notify()
+
+    @contextmanager
+    def conexao(self):
+        """
+        Empresta uma conexão: `with pool.conexao() as (conn, transporte): ...`
+        Se o bloco falhar e a conexão não responder mais, ela é descartada.
+        """
+        conexao, transporte = self._adquirir()
+        try:
+            yield conexao, transporte
+        except Exception:
+            if self.saudavel(conexao):
+                self._devolver(conexao, transporte)
+            else:
+                self._descartar(conexao)
+            raise
+        else:
+            self._devolver(conexao, transporte)
+
+    # ---- Encerramento e métricas ----
+    def fechar(self):
+        with self._cond:
+            for conexao, _, _ in self._livres:
+                self._fechar(conexao)
+            self._abertas -= len(self._livres)
+            self._livres = []
+
+    def estatisticas(self):
+        with self._cond:
+            return {**self.contadores, "abertas": self._abertas, "livres": len(self._livres)}
+
+def configuracao_pool():
+    """
+    DREMIO_POOL=0 desliga o pool (uma conexão por amostra, como antes);
+    DREMIO_POOL_MAX (padrão 4) e DREMIO_POOL_OCIOSO (segundos, padrão 300)
+    """
+    return {
+        "ativo": os.getenv("DREMIO_POOL", "1") != "0",
+        "max_conexoes": int(os.getenv("DREMIO_POOL_MAX", "4")),
+        "max_ocioso": float(os.getenv("DREMIO_POOL_OCIOSO", "300")),
+    }
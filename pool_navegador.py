@@ -0,0 +1,297 @@
+import os
+import sys
+import time
+import asyncio
+import threading
+from urllib.parse import urlsplit
+from utilitarios import escrever_json_atomico
+
+try:
+    from playwright.async_api import async_playwright
+except ImportError:  # a Etapa 4 avisa na hora de abrir o navegador
+    async_playwright = None
+
+# Tipos de recurso do Playwright (request.resource_type) que podem ser bloqueados
+RECURSOS_BLOQUEAVEIS = ("image", "media", "font", "stylesheet", "websocket", "manifest")
+# Domínios de analytics/monitoramento bloqueados com "rastreadores" (subdomínios incluídos)
+RASTREADORES = ("google-analytics.com", "googletagmanager.com", "doubleclick.net", "hotjar.com", "segment.io",
+                "segment.com", "newrelic.com", "nr-data.net", "mixpanel.com", "fullstory.com", "intercom.io",
+                "sentry.io", "optimizely.com", "clarity.ms", "facebook.net", "pendo.io", "walkme.com")
+SESSAO_PADRAO = os.path.join("Historico", "cache", "navegador", "sessao.json")
+# Intervalo mínimo entre gravações da sessão (cookies/localStorage) em segundos
+INTERVALO_SESSAO = 60
+
+# ---------------- Pool de Navegador (Etapa 4) ----------------
+class PoolNavegador:
+    """
+    Um Chromium aberto uma vez e reaproveitado entre GUIDs. O Playwright roda
+    num event loop próprio, em uma thread de fundo, e as etapas (que rodam em
+    threads do executor) enviam as renderizações para ele. Um semáforo limita
+    quantas páginas ficam abertas ao mesmo tempo (`max_paginas`); cada link tem
+    timeout próprio e é tentado de novo até `tentativas` vezes. Se o navegador
+    cair, ele é relançado na próxima renderização.
+
+    Requisições de recursos em `bloquear` (tipos do Playwright, ex.: image, font)
+    e para domínios em `rastreadores` são abortadas por interceptação de rota. Os
+    rastreadores valem para o contexto todo; os tipos de recurso, por página, e
+    podem ser liberados numa renderização (o PDF precisa de imagens e fontes).
+    Com `sessao`, cookies e localStorage (storage_state) são carregados desse
+    arquivo ao abrir o contexto e gravados de volta, então o login feito uma vez
+    vale para as próximas execuções e para os outros workers.
+    """
+
+    def __init__(self, max_paginas=4, timeout=60, tentativas=2, headless=True, bloquear=(), rastreadores=(),
+                 sessao=None):
+        self.max_paginas = max_paginas
+        self.timeout = timeout
+        self.tentativas = tentativas
+        self.headless = headless
+        self.bloquear = frozenset(bloquear)
+        self.rastreadores = tuple(d.lower().lstrip(".") for d in rastreadores)
+        self.sessao = sessao
+        self._sessao_salva_em = 0.0
+        self._loop = None
+        self._thread = None
+        self._lock = threading.Lock()
+        self._playwright = None
+        self._navegador = None
+        self._contexto = None
+        self._semaforo = None
+        self._lock_abertura = None
+        self._tempos = []
+        self.contadores = {"paginas": 0, "falhas": 0, "retentativas": 0, "timeouts": 0, "navegadores_abertos": 0,
+                           "bloqueadas": 0, "sessao_reaproveitada": 0}
+
+    # ---- Event loop em segundo plano ----
+    def _garantir_loop(self):
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                self._thread = threading.Thread(target=self._loop.run_forever, name="pool-navegador", daemon=True)
+                self._thread.start()
+            return self._loop
+
+    def executar(self, coro):
+        """Roda uma corrotina no loop do pool e espera o resultado (chamado de qualquer thread)"""
+        return asyncio.run_coroutine_threadsafe(coro, self._garantir_loop()).result()
+
+    # ---- Navegador ----
+    async def _abrir(self):
+        """Abre (ou reabre, se tiver caído) o navegador e o contexto compartilhado"""
+        if self._lock_abertura is None:
+            self._lock_abertura = asyncio.Lock()
+            self._semaforo = asyncio.Semaphore(self.max_paginas)
+        async with self._lock_abertura:
+            if self._navegador is not None and self._navegador.is_connected():
+                return self._contexto
+            if async_playwright is None:
+                raise ImportError("❌ Playwright não instalado (pip install playwright && playwright install chromium)")
+            if self._playwright is None:
+                self._playwright = await async_playwright().start()
+            self._navegador = await self._playwright.chromium.launch(headless=self.headless)
+            opcoes = {}
+            if self.sessao and os.path.exists(self.sessao):
+                opcoes["storage_state"] = self.sessao
+                self.contadores["sessao_reaproveitada"] += 1
+            self._contexto = await self._navegador.new_context(**opcoes)
+            if self.rastreadores:
+                await self._contexto.route("**/*", self._interceptar)
+            self.contadores["navegadores_abertos"] += 1
+            return self._contexto
+
+    # ---- Interceptação de requisições ----
+    def bloqueado(self, tipo_recurso, url, recursos=True):
+        if recursos and tipo_recurso in self.bloquear:
+            return True
+        host = (urlsplit(url).hostname or "").lower()
+        return any(host == d or host.endswith("." + d) for d in self.rastreadores)
+
+    async def _interceptar(self, route, recursos=False):
+        """Rota do contexto (só rastreadores) ou da página (recursos=True: tipos de recurso também)"""
+        request = route.request
+        if self.bloqueado(request.resource_type, request.url, recursos):
+            self.contadores["bloqueadas"] += 1
+            await route.abort("blockedbyclient")
+        else:
+            await route.continue_()
+
+    # ---- Sessão persistida (storage_state) ----
+    async def _salvar_sessao(self, forcar=False):
+        if not self.sessao or self._contexto is None:
+            return
+        if not forcar and time.monotonic() - self._sessao_salva_em < INTERVALO_SESSAO:
+            return
+        try:
+            escrever_json_atomico(self.sessao, await self._contexto.storage_state())
+            self._sessao_salva_em = time.monotonic()
+        except Exception as e:
+            print(f"⚠️  Não foi possível salvar a sessão do navegador em {self.sessao}: {e}")
+
+    async def _renderizar(self, link, acao, bloquear_recursos=True):
+        """
+        Abre o link numa página nova e aplica `acao(page)`, com timeout e retentativas.
+        Abrir a página também é retentado: se o navegador caiu, _abrir o relança
+        """
+        async with self._semaforo:
+            for tentativa in range(1, self.tentativas + 1):
+                page = None
+                inicio = time.perf_counter()
+                try:
+                    contexto = await self._abrir()
+                    page = await contexto.new_page()
+                    if bloquear_recursos and self.bloquear:
+                        await page.route("**/*", lambda route: self._interceptar(route, recursos=True))
+                    resultado = await asyncio.wait_for(self._carregar(page, link, acao), self.timeout)
+                    self._tempos.append(time.perf_counter() - inicio)
+                    self.contadores["paginas"] += 1
+                    return resultado
+                except Exception as e:
+                    if isinstance(e, asyncio.TimeoutError) or "Timeout" in type(e).__name__:
+                        self.contadores["timeouts"] += 1
+                    if tentativa == self.tentativas:
+                        self.contadores["falhas"] += 1
+                        if isinstance(e, asyncio.TimeoutError):
+                            raise TimeoutError(f"Timeout de {self.timeout:g}s em {tentativa} tentativa(s)") from e
+                        raise
+                    self.contadores["retentativas"] += 1
+                    await asyncio.sleep(tentativa)
+                finally:
+                    if page is not None:
+                        try:
+                            await page.close()
+                        except Exception:
+                            pass
+
+    async def _carregar(self, page, link, acao):
+        resposta = await page.goto(link, timeout=self.timeout * 1000)
+        return await acao(page, resposta)
+
+    async def _renderizar_varios(self, itens, bloquear_recursos=True):
+        """Renderiza [(link, acao)] em paralelo (até max_paginas); falhas voltam como exceção"""
+        await self._abrir()  # falha ao lançar o navegador é erro da etapa, não de um link
+        resultados = await asyncio.gather(*(self._renderizar(link, acao, bloquear_recursos) for link, acao in itens),
+                                          return_exceptions=True)
+        await self._salvar_sessao()
+        return resultados
+
+    def renderizar(self, itens, bloquear_recursos=True):
+        """
+        Renderiza vários links de uma vez. `itens` é uma lista de (link, acao), onde
+        acao é uma corrotina que recebe a página já carregada e a resposta do
+        goto (com os cabeçalhos). Retorna a lista de
+        resultados na mesma ordem, com a exceção no lugar dos links que falharam.
+        bloquear_recursos=False carrega imagens/fontes (os rastreadores seguem bloqueados)
+        """
+        return self.executar(self._renderizar_varios(list(itens), bloquear_recursos))
+
+    # ---- Revalidação (requisição condicional, sem renderizar) ----
+    async def _inalterado(self, link, headers):
+        """True se o servidor responder 304 à requisição condicional (usa os cookies do contexto)"""
+        async with self._semaforo:
+            contexto = await self._abrir()
+            resposta = await contexto.request.get(link, headers=headers, timeout=self.timeout * 1000,
+                                                  max_redirects=5)
+            try:
+                return resposta.status == 304
+            finally:
+                await resposta.dispose()
+
+    async def _revalidar_varios(self, itens):
+        await self._abrir()
+        return await asyncio.gather(*(self._inalterado(link, headers) for link, headers in itens),
+                                    return_exceptions=True)
+
+    def revalidar(self, itens):
+        """
+        Requisições condicionais para [(link, headers)]. Retorna {link: True se não
+        mudou}; erros contam como "mudou" (o link é renderizado de novo)
+        """
+        itens = list(itens)
+        resultados = self.executar(self._revalidar_varios(itens))
+        return {link: r is True for (link, _), r in zip(itens, resultados)}
+
+    # ---- Encerramento e métricas ----
+    async def _fechar(self):
+        await self._salvar_sessao(forcar=True)
+        for recurso in (self._contexto, self._navegador):
+            if recurso is not None:
+                try:
+                    await recurso.close()
+                except Exception:
+                    pass
+        if self._playwright is not None:
+            await self._playwright.stop()
+        self._contexto = self._navegador = self._playwright = None
+
+    def fechar(self):
+        with self._lock:
+            loop = self._loop
+        if loop is None:
+            return
+        try:
+            asyncio.run_coroutine_threadsafe(self._fechar(), loop).result(timeout=30)
+        finally:
+            loop.call_soon_threadsafe(loop.stop)
+            self._thread.join(timeout=5)
+            with self._lock:
+                self._loop = self._thread = None
+            self._lock_abertura = self._semaforo = None
+
+    def estatisticas(self):
+        tempos = list(self._tempos)
+        return {
+            **self.contadores,
+            "tempo_medio": round(sum(tempos) / len(tempos), 2) if tempos else 0.0,
+            "tempo_max": round(max(tempos), 2) if tempos else 0.0,
+        }
+
+def configuracao_navegador():
+    """
+    ETAPA4_POOL=0 desliga o pool (um navegador por GUID, como antes);
+    ETAPA4_PAGINAS_PARALELAS (padrão 4), ETAPA4_TIMEOUT (segundos por link,
+    padrão 60) e ETAPA4_TENTATIVAS (padrão 2).
+    ETAPA4_BLOQUEAR: tipos de recurso e/ou "rastreadores" separados por vírgula
+    (padrão "image,media,font,rastreadores"; "nenhum" desliga; os tipos de recurso não
+    valem para o PDF, que é renderizado completo); ETAPA4_RASTREADORES
+    acrescenta domínios. ETAPA4_SESSAO: arquivo do storage_state ("0" desliga)
+    """
+    bloquear = [b.strip().lower() for b in os.getenv("ETAPA4_BLOQUEAR", "image,media,font,rastreadores").split(",")
+                if b.strip() and b.strip().lower() != "nenhum"]
+    invalidos = [b for b in bloquear if b not in RECURSOS_BLOQUEAVEIS + ("rastreadores",)]
+    if invalidos:
+        raise ValueError(f"⚠️ ETAPA4_BLOQUEAR inválido: {invalidos}. Use {RECURSOS_BLOQUEAVEIS} e/ou rastreadores")
+    rastreadores = list(RASTREADORES) if "rastreadores" in bloquear else []
+    rastreadores += [d.strip() for d in os.getenv("ETAPA4_RASTREADORES", "").split(",") if d.strip()]
+    sessao = os.getenv("ETAPA4_SESSAO", SESSAO_PADRAO)
+    return {
+        "ativo": os.getenv("ETAPA4_POOL", "1") != "0",
+        "max_paginas": int(os.getenv("ETAPA4_PAGINAS_PARALELAS", "4")),
+        "timeout": float(os.getenv("ETAPA4_TIMEOUT", "60")),
+        "tentativas": int(os.getenv("ETAPA4_TENTATIVAS", "2")),
+        "bloquear": [b for b in bloquear if b != "rastreadores"],
+        "rastreadores": rastreadores,
+        "sessao": None if sessao in ("", "0") else sessao,
+    }
+
+def criar_navegador(config=None):
+    """PoolNavegador com a configuração das variáveis de ambiente (ou a informada)"""
+    config = dict(config or configuracao_navegador())
+    config.pop("ativo", None)
+    return PoolNavegador(**config)
+
+# ---------------- Login Manual (grava a sessão) ----------------
+async def _login(url, sessao):
+    pool = PoolNavegador(headless=False, sessao=sessao)
+    contexto = await pool._abrir()
+    page = await contexto.new_page()
+    await page.goto(url)
+    await asyncio.get_running_loop().run_in_executor(None, input, "🔐 Faça o login no navegador e tecle Enter aqui... ")
+    await pool._fechar()
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3 or sys.argv[1] != "--login":
+        print("❌ Uso: python pool_navegador.py --login <URL do Confluence>")
+        sys.exit(1)
+    destino = configuracao_navegador()["sessao"] or SESSAO_PADRAO
+    asyncio.run(_login(sys.argv[2], destino))
+    print(f"✅ Sessão salva em {destino}")
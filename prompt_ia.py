@@ -0,0 +1,321 @@
+import os
+import re
+import json
+import time
+import threading
+import yaml
+
+try:
+    import tiktoken
+except ImportError:  # sem tiktoken a contagem é estimada (~4 caracteres por token)
+    tiktoken = None
+
+LOGS_DIR = os.path.join("Historico", "logs")
+MAX_CARACTERES_DESCRICAO = 300
+MAX_ITENS_LINHAGEM = 10
+
+SISTEMA = "Você é um assistente especializado em governança de dados corporativos."
+
+INSTRUCOES = """- Comece com "Preenchido com IA"
+- 2 seções: Descrição da tabela e Contexto Negócio
+- Foco em produto/negócio - NÃO descreva colunas
+- Linguagem técnica para governança
+- Seja abrangente e descreva os produtos/serviços ou instrumentos financeiros identificados na tabela"""
+
+# Seções do prompt na ordem em que aparecem. Quando o orçamento estoura, as de
+# menor prioridade são resumidas (se houver forma compacta) e depois cortadas,
+# nunca abaixo de `minimo` tokens
+SECOES = [
+    {"nome": "metadados", "titulo": "METADADOS", "prioridade": 5, "minimo": 100},
+    {"nome": "colunas", "titulo": "COLUNAS", "prioridade": 4, "minimo": 200},
+    {"nome": "linhagem", "titulo": "LINHAGEM", "prioridade": 1, "minimo": 0},
+    {"nome": "amostra", "titulo": "AMOSTRA", "prioridade": 3, "minimo": 100},
+    {"nome": "documentacao", "titulo": "DOCUMENTAÇÃO", "prioridade": 2, "minimo": 200},
+]
+# Seções que identificam o prompt no cache de respostas: a amostra fica de fora
+# porque as linhas são sorteadas de novo a cada Etapa 3 (só os nomes das colunas contam)
+SECOES_ESTAVEIS = ("metadados", "colunas", "linhagem", "documentacao")
+# Aumentar quando SISTEMA, INSTRUCOES ou a montagem das seções mudarem: invalida as respostas em cache
+VERSAO_PROMPT = 1
+
+def configuracao_prompt():
+    """IA_MODELO (padrão gpt-4.0) e IA_ORCAMENTO_TOKENS (tokens de entrada, padrão 6000; 0 = sem limite)"""
+    return {
+        "modelo": os.getenv("IA_MODELO", "gpt-4.0"),
+        "orcamento": int(os.getenv("IA_ORCAMENTO_TOKENS", "6000")),
+    }
+
+# ---------------- Tokens ----------------
+_codificadores = {}
+
+def _codificador(modelo):
+    if tiktoken is None:
+        return None
+    if modelo not in _codificadores:
+        try:
+            _codificadores[modelo] = tiktoken.encoding_for_model(modelo)
+        except KeyError:
+            _codificadores[modelo] = tiktoken.get_encoding("cl100k_base")
+    return _codificadores[modelo]
+
+def contar_tokens(texto, modelo=None):
+    codificador = _codificador(modelo or configuracao_prompt()["modelo"])
+    if codificador is None:
+        return (len(texto) + 3) // 4
+    return len(codificador.encode(texto, disallowed_special=()))
+
+def _cortar_linha(linha, max_tokens, modelo=None):
+    """Primeiros max_tokens tokens da linha (ou ~4 caracteres por token sem tiktoken)"""
+    codificador = _codificador(modelo or configuracao_prompt()["modelo"])
+    if codificador is None:
+        return linha[:max_tokens * 4] + "…"
+    return codificador.decode(codificador.encode(linha, disallowed_special=())[:max_tokens]) + "…"
+
+def cortar_tokens(texto, max_tokens, modelo=None):
+    """
+    Mantém as primeiras linhas inteiras que cabem em max_tokens e indica quanto foi
+    cortado. Se nem a primeira linha cabe, ela é cortada no meio (a seção não some)
+    """
+    if max_tokens <= 0:
+        return ""
+    linhas, usados = [], 0
+    for linha in texto.splitlines():
+        tokens = contar_tokens(linha + "\n", modelo)
+        if usados + tokens > max_tokens:
+            if not linhas:
+                linhas.append(_cortar_linha(linha, max_tokens, modelo))
+            break
+        linhas.append(linha)
+        usados += tokens
+    restante = texto.count("\n") + 1 - len(linhas)
+    if restante > 0:
+        linhas.append(f"[… {restante} linha(s) omitida(s) pelo limite de tokens]")
+    return "\n".join(linhas)
+
+# ---------------- Projeção dos Metadados do Purview ----------------
+def _texto(valor, limite=MAX_CARACTERES_DESCRICAO):
+    """Descrição sem HTML e espaços repetidos, limitada a `limite` caracteres"""
+    if not valor:
+        return None
+    texto = re.sub(r"\s+", " ", re.sub(r"<[^>]+>", " ", str(valor))).strip()
+    return texto if len(texto) <= limite else texto[:limite] + "…"
+
+def _classificacoes(entidade):
+    return [c.get("typeName") for c in entidade.get("classifications") or [] if isinstance(c, dict) and c.get("typeName")]
+
+def _eh_coluna(type_name):
+    return str(type_name or "").lower().endswith("column")
+
+def _coluna(atributos, classificacoes=()):
+    return {
+        "nome": atributos.get("name"),
+        "tipo": atributos.get("type") or atributos.get("data_type") or atributos.get("dataType"),
+        "descricao": _texto(atributos.get("userDescription") or atributos.get("description")),
+        "classificacoes": list(classificacoes),
+    }
+
+def _nomes_relacionados(itens):
+    if isinstance(itens, dict):
+        itens = [itens]
+    nomes = [i.get("displayText") or i.get("qualifiedName") for i in itens or [] if isinstance(i, dict)]
+    return [n for n in nomes if n][:MAX_ITENS_LINHAGEM]
+
+def projetar_metadados(metadados):
+    """
+    Reduz o YAML do Purview (Etapa 2 completa ou Etapa2browser) ao que ajuda a
+    descrever a tabela: nome, descrição, classificações e termos do glossário,
+    colunas (nome, tipo, descrição) e os nomes de origens/destinos da linhagem.
+    Retorna {"tabela": {...}, "colunas": [...], "linhagem": {...}}
+    """
+    metadados = metadados or {}
+    entidade = metadados.get("entity") or {}
+    atributos = entidade.get("attributes") or {}
+    relacoes = entidade.get("relationshipAttributes") or {}
+
+    tabela = {
+        "nome": atributos.get("name") or metadados.get("name"),
+        "nome_qualificado": atributos.get("qualifiedName") or metadados.get("qualifiedName"),
+        "tipo": entidade.get("typeName"),
+        "descricao": _texto(atributos.get("userDescription") or atributos.get("description")
+                            or metadados.get("description"), 1000),
+        "classificacoes": _classificacoes(entidade),
+        "termos_glossario": _nomes_relacionados(relacoes.get("meanings")),
+    }
+
+    colunas = []
+    for ref in (metadados.get("referredEntities") or {}).values():
+        if _eh_coluna(ref.get("typeName")):
+            colunas.append(_coluna(ref.get("attributes") or {}, _classificacoes(ref)))
+    dados_schema = ((metadados.get("attachedSchema") or {}).get("data") or {})
+    for ref in (dados_schema.get("referredEntities") or {}).values():
+        if _eh_coluna(ref.get("typeName")):
+            colunas.append(_coluna(ref.get("attributes") or {}, _classificacoes(ref)))
+    for atributos_coluna in (metadados.get("columns") or {}).values():
+        colunas.append(_coluna(atributos_coluna or {}))
+
+    linhagem = {}
+    for chave in ("inputToProcesses", "outputFromProcesses", "sources", "sinks"):
+        nomes = _nomes_relacionados(relacoes.get(chave))
+        if nomes:
+            linhagem[chave] = nomes
+    mapa = (metadados.get("lineage") or {}).get("guidEntityMap") or {}
+    guid = metadados.get("guid") or entidade.get("guid")
+    relacionados = [e.get("displayText") for g, e in mapa.items() if g != guid and isinstance(e, dict)]
+    if relacionados:
+        linhagem["entidades_relacionadas"] = [n for n in relacionados if n][:MAX_ITENS_LINHAGEM]
+
+    return {
+        "tabela": {k: v for k, v in tabela.items() if v},
+        "colunas": [c for c in colunas if c["nome"]],
+        "linhagem": linhagem,
+    }
+
+# ---------------- Seções ----------------
+def formatar_colunas(colunas, compacto=False):
+    if compacto:
+        # Só nome e tipo, 10 por linha (para o corte por linhas continuar funcionando)
+        nomes = [f"{c['nome']} ({c['tipo']})" if c.get("tipo") else c["nome"] for c in colunas]
+        return "\n".join(", ".join(nomes[i:i + 10]) for i in range(0, len(nomes), 10))
+    linhas = []
+    for c in colunas:
+        linha = f"- {c['nome']}" + (f" ({c['tipo']})" if c.get("tipo") else "")
+        if c.get("descricao"):
+            linha += f": {c['descricao']}"
+        if c.get("classificacoes"):
+            linha += f" [{', '.join(c['classificacoes'])}]"
+        linhas.append(linha)
+    return "\n".join(linhas)
+
+def _yaml(dados):
+    return yaml.safe_dump(dados, allow_unicode=True, sort_keys=False, width=1000).strip() if dados else ""
+
+def montar_secoes(metadados, amostra, doc):
+    """Textos de cada seção (e a forma compacta, quando houver) a partir dos artefatos brutos"""
+    projecao = projetar_metadados(metadados)
+    textos = {
+        "metadados": (_yaml(projecao["tabela"]), None),
+        "colunas": (formatar_colunas(projecao["colunas"]), formatar_colunas(projecao["colunas"], compacto=True)),
+        "linhagem": (_yaml(projecao["linhagem"]), None),
+        "amostra": (amostra or "", None),
+        "documentacao": (doc or "", None),
+    }
+    return [{**secao, "texto": textos[secao["nome"]][0], "compacto": textos[secao["nome"]][1]} for secao in SECOES]
+
+def aplicar_orcamento(secoes, orcamento, modelo=None, fixos=0):
+    """
+    Ajusta as seções ao orçamento de tokens (`fixos` = instruções e títulos),
+    resumindo e depois cortando as de menor prioridade primeiro.
+    Retorna {nome: {"tokens_originais", "tokens", "acao"}}
+    """
+    relatorio = {}
+    for secao in secoes:
+        secao["tokens"] = contar_tokens(secao["texto"], modelo)
+        relatorio[secao["nome"]] = {"tokens_originais": secao["tokens"], "tokens": secao["tokens"], "acao": "inteira"}
+    if not orcamento:
+        return relatorio
+
+    def excesso():
+        return fixos + sum(s["tokens"] for s in secoes) - orcamento
+
+    # Da menor prioridade para a maior: resume (perde só detalhe) e, se ainda faltar, corta
+    for secao in sorted(secoes, key=lambda s: s["prioridade"]):
+        if excesso() <= 0:
+            break
+        if secao["compacto"] is not None:
+            tokens = contar_tokens(secao["compacto"], modelo)
+            if tokens < secao["tokens"]:
+                secao["texto"], secao["tokens"] = secao["compacto"], tokens
+                relatorio[secao["nome"]].update(tokens=tokens, acao="resumida")
+        limite = max(secao["minimo"], secao["tokens"] - max(excesso(), 0))
+        if limite < secao["tokens"]:
+            secao["texto"] = cortar_tokens(secao["texto"], limite, modelo)
+            secao["tokens"] = contar_tokens(secao["texto"], modelo)
+            relatorio[secao["nome"]].update(tokens=secao["tokens"], acao="cortada" if secao["texto"] else "removida")
+    return relatorio
+
+# ---------------- Prompt ----------------
+def _renderizar(secoes):
+    partes = ["Analise esta tabela para catálogo de dados corporativo:"]
+    for secao in secoes:
+        if secao["texto"]:
+            partes.append(f"**{secao['titulo']}:**\n{secao['texto']}")
+    partes.append(f"**INSTRUÇÕES:**\n{INSTRUCOES}")
+    return "\n\n".join(partes) + "\n"
+
+def montar_prompt(metadados, amostra, doc, orcamento=None, modelo=None):
+    """
+    Prompt compacto: metadados projetados (sem referredEntities/relationshipAttributes
+    brutos), colunas, linhagem resumida, amostra e documentação, dentro do orçamento
+    de tokens. Retorna (prompt, relatório de tokens por seção)
+    """
+    config = configuracao_prompt()
+    orcamento = config["orcamento"] if orcamento is None else orcamento
+    modelo = modelo or config["modelo"]
+    secoes = montar_secoes(metadados, amostra, doc)
+    fixos = contar_tokens(_renderizar([{**s, "texto": ""} for s in secoes]), modelo) \
+        + sum(contar_tokens(f"**{s['titulo']}:**\n\n\n", modelo) for s in secoes)
+    relatorio = aplicar_orcamento(secoes, orcamento, modelo, fixos)
+    prompt = _renderizar(secoes)
+    relatorio["total"] = {"tokens": contar_tokens(prompt, modelo), "orcamento": orcamento,
+                          "estimado": tiktoken is None}
+    return prompt, relatorio
+
+def identidade_prompt(metadados, doc, colunas_amostra=(), orcamento=None):
+    """
+    O que identifica o prompt para o cache de respostas (cliente_ia.chave_resposta):
+    versão, instruções, seções estáveis e as colunas da amostra, sem as linhas
+    """
+    secoes = montar_secoes(metadados, "", doc)
+    return {
+        "versao": VERSAO_PROMPT,
+        "sistema": SISTEMA,
+        "instrucoes": INSTRUCOES,
+        "secoes": {s["nome"]: s["texto"] for s in secoes if s["nome"] in SECOES_ESTAVEIS},
+        "colunas_amostra": [str(c) for c in colunas_amostra],
+        "orcamento": orcamento,
+    }
+
+def montar_mensagens(prompt):
+    return [
+        {"role": "system", "content": SISTEMA},
+        {"role": "user", "content": prompt},
+    ]
+
+# ---------------- Registro de Uso ----------------
+_lock = threading.Lock()
+_contadores = {"prompts": 0, "tokens_prompt": 0, "tokens_resposta": 0, "secoes_reduzidas": 0}
+
+def estatisticas():
+    with _lock:
+        return {"tokens_ia": dict(_contadores)}
+
+def registrar_uso(guid, modelo, relatorio, uso=None, duracao=None, caminho=None, cache=False):
+    """
+    Acrescenta uma linha JSON por execução em Historico/logs/tokens_ia.jsonl.
+    uso: {"prompt_tokens", "completion_tokens"} informado pela API; resposta vinda
+    do cache (cache=True) não conta tokens gastos
+    """
+    caminho = caminho or os.path.join(LOGS_DIR, "tokens_ia.jsonl")
+    os.makedirs(os.path.dirname(caminho), exist_ok=True)
+    uso = uso or {}
+    registro = {
+        "guid": guid,
+        "modelo": modelo,
+        "quando": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "secoes": {k: v for k, v in relatorio.items() if k != "total"},
+        "prompt_estimado": relatorio["total"]["tokens"],
+        "orcamento": relatorio["total"]["orcamento"],
+        "prompt_tokens": uso.get("prompt_tokens"),
+        "completion_tokens": uso.get("completion_tokens"),
+        "cache": cache,
+        "duracao": round(duracao, 3) if duracao is not None else None,
+    }
+    with _lock:
+        with open(caminho, "a", encoding="utf-8") as f:
+            f.write(json.dumps(registro, ensure_ascii=False) + "\n")
+        _contadores["prompts"] += 1
+        if not cache:
+            _contadores["tokens_prompt"] += registro["prompt_tokens"] or registro["prompt_estimado"]
+            _contadores["tokens_resposta"] += registro["completion_tokens"] or 0
+        _contadores["secoes_reduzidas"] += sum(1 for v in registro["secoes"].values() if v["acao"] != "inteira")
+    return registro
@@ -0,0 +1,483 @@
+import os
+import time
+import random
+import threading
+import requests
+from email.utils import parsedate_to_datetime
+from requests.adapters import HTTPAdapter
+from concurrent.futures import ThreadPoolExecutor
+from cache_disco import CacheDisco
+
+# Limites de cada chamada ao /entity/bulk (a URL cresce ~45 caracteres por GUID)
+MAX_GUIDS_BULK = 100
+MAX_URL_BULK = 6000
+# Espera máxima por um Retry-After (um header com data HTTP distante não trava o worker)
+MAX_RETRY_AFTER = 120.0
+
+# Parâmetros do Atlas para buscar só o cabeçalho (sem relacionamentos/referências)
+PARAMS_LEVES = {"minExtInfo": "true", "ignoreRelationships": "true"}
+
+# Respostas que indicam sobrecarga/instabilidade e podem ser tentadas de novo
+STATUS_RETENTAVEIS = {429, 500, 502, 503, 504}
+STATUS_THROTTLING = {429, 503}
+
+_sessao_compartilhada = None
+_clientes = {}
+_lock = threading.RLock()
+
+# ---------------- Sessão e Clientes Compartilhados ----------------
+def sessao_compartilhada(max_conexoes=16):
+    """Sessão HTTP única do processo, com pool de conexões keep-alive"""
+    global _sessao_compartilhada
+    with _lock:
+        if _sessao_compartilhada is None:
+            sessao = requests.Session()
+            adaptador = HTTPAdapter(pool_connections=max_conexoes, pool_maxsize=max_conexoes)
+            sessao.mount("https://", adaptador)
+            sessao.mount("http://", adaptador)
+            _sessao_compartilhada = sessao
+        return _sessao_compartilhada
+
+def criar_cache_purview():
+    """
+    Cache das respostas do Atlas configurado por variáveis de ambiente:
+    PURVIEW_CACHE=0 desliga; PURVIEW_CACHE_TTL (s, padrão 1 dia);
+    PURVIEW_CACHE_MAX_MB (padrão 256); PURVIEW_CACHE_DIR (padrão Historico/cache/purview)
+    """
+    if os.getenv("PURVIEW_CACHE", "1") == "0":
+        return None
+    return CacheDisco(
+        os.getenv("PURVIEW_CACHE_DIR", os.path.join("Historico", "cache", "purview")),
+        ttl=float(os.getenv("PURVIEW_CACHE_TTL", "86400")),
+        max_bytes=int(float(os.getenv("PURVIEW_CACHE_MAX_MB", "256")) * 1024 * 1024)
+    )
+
+def obter_cliente(purview_account, token, invalidar_token=None):
+    """
+    Devolve o cliente compartilhado da conta para essa credencial. O token fica fixo no
+    cliente (trocá-lo num cliente em uso mudaria o token das chamadas de outras threads):
+    cada provedor de token (função) tem o seu cliente e um token em texto novo ganha outro
+    cliente, que substitui o do token anterior da conta. O cache em disco é o mesmo da conta
+    """
+    base_url = url_base_purview(purview_account)
+    chave = (base_url, token, invalidar_token)
+    with _lock:
+        cliente = _clientes.get(chave)
+        if cliente is None:
+            da_conta = [k for k in _clientes if k[0] == base_url]
+            cache = _clientes[da_conta[0]].cache if da_conta else criar_cache_purview()
+            if not callable(token):
+                # Quem ainda usa o cliente do token antigo segue com ele; só não é mais entregue
+                for k in da_conta:
+                    if not callable(k[1]):
+                        del _clientes[k]
+            cliente = _clientes[chave] = ClientePurview(purview_account, token, base_url=base_url, cache=cache,
+                                                        invalidar_token=invalidar_token)
+        return cliente
+
+class LimitadorAdaptativo:
+    """
+    Limita quantas requisições ficam em voo ao mesmo tempo, ajustando o limite no
+    estilo AIMD: cresce aos poucos (+1 a cada `limite` sucessos) e cai pela metade
+    quando o Purview responde com throttling (no máximo uma redução por janela,
+    para uma rajada de 429 não derrubar o limite até o mínimo).
+    """
+
+    def __init__(self, inicial=8, minimo=1, maximo=32, janela_reducao=2.0):
+        self.minimo = minimo
+        self.maximo = maximo
+        self.limite = float(min(max(inicial, minimo), maximo))
+        self.janela_reducao = janela_reducao
+        self.em_uso = 0
+        self._ultima_reducao = 0.0
+        self._cond = threading.Condition()
+
+    def __enter__(self):
+        with self._cond:
+            while self.em_uso >= int(self.limite):
+                self._cond.wait()
+            self.em_uso += 1
+        return self
+
+    def __exit__(self, *exc):
+        with self._cond:
+            self.em_uso -= 1
+            self._cond.notify_all()
+
+    def registrar_sucesso(self):
+        with self._cond:
+            self.limite = min(self.maximo, self.limite + 1.0 / self.limite)
+            self._cond.notify_all()
+
+    def registrar_throttling(self):
+        with self._cond:
+            agora = time.monotonic()
+            if agora - self._ultima_reducao >= self.janela_reducao:
+                self.limite = max(self.minimo, self.limite / 2)
+                self._ultima_reducao = agora
+
+def tempo_retry_after(valor, maximo=MAX_RETRY_AFTER):
+    """
+    Converte o header Retry-After (segundos ou data HTTP) em segundos de espera,
+    limitados a `maximo`. None se não houver header válido ("0" vale 0.0)
+    """
+    if not valor:
+        return None
+    try:
+        espera = float(valor)
+    except ValueError:
+        try:
+            espera = parsedate_to_datetime(valor).timestamp() - time.time()
+        except (TypeError, ValueError):
+            return None
+    return min(max(espera, 0.0), maximo)
+
+def espera_backoff(tentativa, base=0.5, maximo=30.0):
+    """Backoff exponencial com jitter completo: sorteia entre 0 e base * 2^tentativa"""
+    return random.uniform(0, min(maximo, base * (2 ** tentativa)))
+
+# ---------------- Cliente HTTP do Purview (Atlas v2) ----------------
+def url_base_purview(purview_account):
+    """URL base da API Atlas; PURVIEW_BASE_URL permite apontar para um servidor local (testes)"""
+    return os.getenv("PURVIEW_BASE_URL") or f"https://{purview_account}.purview.azure.com/catalog/api/atlas/v2"
+
+class ClientePurview:
+    """
+    Cliente do Purview sobre a sessão compartilhada (conexões TLS reaproveitadas
+    entre chamadas) com um pool de threads para buscar entidades, schemas e
+    linhagem em paralelo.
+
+    `token` pode ser uma string ou uma função sem argumentos que devolve o token atual;
+    com `invalidar_token` (recebe o token recusado), uma resposta 401 invalida o token e
+    a chamada é repetida uma vez com o token novo.
+    Com `cache` (CacheDisco), entidades são reaproveitadas entre execuções: dentro do
+    TTL sem rede; depois dele, só se updateTime/version não mudaram no Purview.
+    Respostas 429/5xx e falhas de conexão são repetidas com backoff (respeitando
+    Retry-After) e a concorrência se ajusta sozinha ao throttling.
+    """
+
+    def __init__(self, purview_account, token, base_url=None, max_paralelo=16, timeout=60, sessao=None, cache=None,
+                 max_tentativas=None, invalidar_token=None):
+        self.purview_account = purview_account
+        self.base_url = (base_url or url_base_purview(purview_account)).rstrip("/")
+        self.timeout = timeout
+        self.token = token
+        self.invalidar_token = invalidar_token
+        self.max_paralelo = max_paralelo
+        self.sessao = sessao or sessao_compartilhada(max_paralelo)
+        self.cache = cache
+        self._pool = None
+        self._lock_pool = threading.Lock()
+        self._lock_contadores = threading.Lock()
+        self.requisicoes = 0
+        self.max_tentativas = max_tentativas or int(os.getenv("PURVIEW_MAX_TENTATIVAS", "5"))
+        self.limitador = LimitadorAdaptativo(inicial=max(max_paralelo // 2, 1), maximo=max_paralelo)
+        self._metricas = {}
+
+    @property
+    def pool(self):
+        """Pool de threads criado só quando o modo concorrente é usado"""
+        with self._lock_pool:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=self.max_paralelo)
+            return self._pool
+
+    def fechar(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=True)
+            self._pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.fechar()
+
+    # ---- HTTP ----
+    def _token_atual(self):
+        return self.token() if callable(self.token) else self.token
+
+    def _get(self, caminho, params=None):
+        endpoint = nome_endpoint(caminho)
+        reautenticado = False
+        tentativa = 0
+        while True:
+            token = self._token_atual()
+            with self.limitador:
+                self._contar(endpoint, "requisicoes")
+                inicio = time.perf_counter()
+                try:
+                    response = self.sessao.get(
+                        f"{self.base_url}/{caminho}",
+                        headers={"Authorization": f"Bearer {token}"},
+                        params=params,
+                        timeout=self.timeout
+                    )
+                except (requests.ConnectionError, requests.Timeout) as e:
+                    response, erro = None, e
+                self._contar(endpoint, "latencia_total", time.perf_counter() - inicio)
+
+            # Token recusado (revogado/expirado antes da hora): reautentica e repete uma vez
+            if response is not None and response.status_code == 401 and self.invalidar_token and not reautenticado:
+                reautenticado = True
+                self._contar(endpoint, "reautenticacoes")
+                self.invalidar_token(token)
+                continue
+
+            if response is not None and response.status_code not in STATUS_RETENTAVEIS:
+                if response.ok:
+                    self.limitador.registrar_sucesso()
+                    self._contar(endpoint, "sucessos")
+                else:
+                    self._contar(endpoint, "erros")
+                response.raise_for_status()
+                return response.json()
+
+            # Throttling/instabilidade: espera e tenta de novo
+            espera = espera_backoff(tentativa)
+            if response is not None:
+                if response.status_code in STATUS_THROTTLING:
+                    self.limitador.registrar_throttling()
+                    self._contar(endpoint, "throttled")
+                retry_after = tempo_retry_after(response.headers.get("Retry-After"))
+                if retry_after is not None:
+                    espera = retry_after
+
+            if tentativa == self.max_tentativas - 1:
+                self._contar(endpoint, "erros")
+                if response is None:
+                    raise erro
+                response.raise_for_status()
+
+            self._contar(endpoint, "retries")
+            self._contar(endpoint, "espera_total", espera)
+            time.sleep(espera)
+            tentativa += 1
+
+    def _contar(self, endpoint, campo, valor=1):
+        with self._lock_contadores:
+            if campo == "requisicoes":
+                self.requisicoes += 1
+            metricas = self._metricas.setdefault(endpoint, {
+                "requisicoes": 0, "sucessos": 0, "throttled": 0, "retries": 0, "erros": 0, "reautenticacoes": 0,
+                "espera_total": 0.0, "latencia_total": 0.0,
+            })
+            metricas[campo] += valor
+
+    def metricas_por_endpoint(self):
+        """Contadores por endpoint (throttling, retries, esperas) e o limite de concorrência atual"""
+        with self._lock_contadores:
+            resultado = {}
+            for endpoint, m in self._metricas.items():
+                resultado[endpoint] = {
+                    **m,
+                    "espera_total": round(m["espera_total"], 3),
+                    "latencia_media": round(m["latencia_total"] / m["requisicoes"], 3) if m["requisicoes"] else 0.0,
+                }
+                del resultado[endpoint]["latencia_total"]
+            return resultado, round(self.limitador.limite, 2)
+
+    # ---- Endpoints ----
+    def url_entidade(self, guid):
+        return f"{self.base_url}/entity/guid/{guid}"
+
+    def chave_entidade(self, guid):
+        """Chave do cache da resposta completa do /entity/guid/{guid}"""
+        return f"{self.base_url}|entity|{guid}"
+
+    def chave_entidade_bulk(self, guid):
+        """
+        Chave do cache das entidades separadas do /entity/bulk: têm só as referredEntities
+        citadas pela entidade, então não podem responder um buscar_entidade
+        """
+        return f"{self.base_url}|entity_bulk|{guid}"
+
+    def buscar_entidade(self, guid):
+        if self.cache is None:
+            return self._get(f"entity/guid/{guid}")
+
+        chave = self.chave_entidade(guid)
+        entrada = self.cache.obter_entrada(chave)
+        if entrada is not None:
+            valor, meta, expirado = entrada
+            if not expirado:
+                self.cache.registrar_uso(chave)
+                return valor
+            # Expirado: confere só o cabeçalho da entidade antes de baixar tudo de novo
+            self.cache.registrar("expirados")
+            leve = self._get(f"entity/guid/{guid}", params=PARAMS_LEVES)
+            if list(versao_entidade(leve.get("entity"))) == meta.get("versao"):
+                self.cache.renovar(chave)
+                return valor
+        else:
+            self.cache.registrar("misses")
+
+        entity_data = self._get(f"entity/guid/{guid}")
+        self.cache.gravar(chave, entity_data, {"versao": list(versao_entidade(entity_data.get("entity")))})
+        return entity_data
+
+    def buscar_linhagem(self, guid, profundidade=3):
+        return self._get(f"lineage/{guid}", params={"depth": profundidade})
+
+    def buscar_entidades_bulk(self, guids, max_guids=MAX_GUIDS_BULK, max_url=MAX_URL_BULK):
+        """
+        Busca várias entidades pelo /entity/bulk, dividindo os GUIDs em lotes que
+        respeitam o limite de quantidade e de tamanho da URL (lotes em paralelo).
+        A resposta é separada por GUID no mesmo formato do /entity/guid/{guid}:
+        {guid: {"entity": ..., "referredEntities": {...}}}. GUIDs não encontrados ficam de fora.
+        Com cache (chaves próprias do bulk, separadas das respostas completas),
+        entradas válidas não vão para a rede e as expiradas são revalidadas
+        juntas numa chamada bulk leve (só cabeçalhos).
+        """
+        guids = list(dict.fromkeys(guids))
+        resultado = {}
+        if self.cache is not None:
+            expirados = {}
+            faltantes = []
+            for guid in guids:
+                chave = self.chave_entidade_bulk(guid)
+                entrada = self.cache.obter_entrada(chave)
+                if entrada is None:
+                    self.cache.registrar("misses")
+                    faltantes.append(guid)
+                elif entrada[2]:
+                    self.cache.registrar("expirados")
+                    expirados[guid] = entrada
+                else:
+                    self.cache.registrar_uso(chave)
+                    resultado[guid] = entrada[0]
+
+            if expirados:
+                cabecalhos = self._bulk(list(expirados), max_guids, max_url, PARAMS_LEVES)
+                for guid, (valor, meta, _) in expirados.items():
+                    leve = cabecalhos.get(guid)
+                    if leve and list(versao_entidade(leve["entity"])) == meta.get("versao"):
+                        self.cache.renovar(self.chave_entidade_bulk(guid))
+                        resultado[guid] = valor
+                    else:
+                        faltantes.append(guid)
+            guids = faltantes
+
+        novos = self._bulk(guids, max_guids, max_url) if guids else {}
+        if self.cache is not None:
+            for guid, entity_data in novos.items():
+                self.cache.gravar(self.chave_entidade_bulk(guid), entity_data,
+                                  {"versao": list(versao_entidade(entity_data["entity"]))})
+        resultado.update(novos)
+        return resultado
+
+    def _bulk(self, guids, max_guids, max_url, params_extra=None):
+        tamanho_base = len(f"{self.base_url}/entity/bulk?")
+        lotes = dividir_em_lotes(guids, tamanho_base, max_guids, max_url)
+
+        def buscar_lote(lote):
+            params = [("guid", g) for g in lote] + list((params_extra or {}).items())
+            return self._get("entity/bulk", params=params)
+
+        respostas = list(self.pool.map(buscar_lote, lotes)) if len(lotes) > 1 else [buscar_lote(l) for l in lotes]
+
+        resultado = {}
+        for resposta in respostas:
+            referidas = resposta.get("referredEntities", {}) or {}
+            for entidade in resposta.get("entities", []) or []:
+                citados = guids_referenciados({
+                    "attributes": entidade.get("attributes", {}),
+                    "relationshipAttributes": entidade.get("relationshipAttributes", {}),
+                })
+                resultado[entidade.get("guid")] = {
+                    "entity": entidade,
+                    "referredEntities": {g: referidas[g] for g in citados if g in referidas},
+                }
+        return resultado
+
+    # ---- Modo concorrente ----
+    def buscar_entidades(self, guids):
+        """Busca várias entidades em paralelo. Retorna {guid: dados ou exceção}"""
+        futuros = {guid: self.pool.submit(self.buscar_entidade, guid) for guid in dict.fromkeys(guids)}
+        return {guid: _resultado_ou_erro(futuro) for guid, futuro in futuros.items()}
+
+    def buscar_pacote(self, guid, incluir_linhagem=False, incluir_referenciadas=False, tipos_com_schema=None):
+        """
+        Busca tudo que a Etapa 2 precisa de um GUID. Entidade e linhagem saem juntas;
+        assim que a entidade chega, o schema attached (só para `tipos_com_schema`,
+        ou qualquer tipo se None) e as entidades referenciadas que não vieram em
+        referredEntities são buscados em paralelo.
+        Retorna {"entity", "schema", "lineage", "referenced"}.
+        """
+        futuro_entidade = self.pool.submit(self.buscar_entidade, guid)
+        futuro_linhagem = self.pool.submit(self.buscar_linhagem, guid) if incluir_linhagem else None
+
+        entity_data = futuro_entidade.result()
+        relacionamentos = entity_data.get("entity", {}).get("relationshipAttributes", {}) or {}
+
+        futuro_schema = None
+        attached = relacionamentos.get("attachedSchema") or []
+        tipo = entity_data.get("entity", {}).get("typeName")
+        if attached and attached[0].get("guid") and (tipos_com_schema is None or tipo in tipos_com_schema):
+            futuro_schema = self.pool.submit(self.buscar_entidade, attached[0]["guid"])
+
+        futuros_ref = {}
+        if incluir_referenciadas:
+            conhecidas = set(entity_data.get("referredEntities", {}))
+            for ref_guid in guids_referenciados(relacionamentos):
+                if ref_guid not in conhecidas and ref_guid not in futuros_ref:
+                    futuros_ref[ref_guid] = self.pool.submit(self.buscar_entidade, ref_guid)
+
+        return {
+            "entity": entity_data,
+            "schema": _resultado_ou_erro(futuro_schema) if futuro_schema else None,
+            "lineage": _resultado_ou_erro(futuro_linhagem) if futuro_linhagem else None,
+            "referenced": {g: _resultado_ou_erro(f) for g, f in futuros_ref.items()},
+        }
+
+    def buscar_pacotes(self, guids, **opcoes):
+        """Executa buscar_pacote para vários GUIDs ao mesmo tempo. Retorna {guid: pacote ou exceção}"""
+        with ThreadPoolExecutor(max_workers=min(len(guids), 8) or 1) as pool_guids:
+            futuros = {guid: pool_guids.submit(self.buscar_pacote, guid, **opcoes) for guid in dict.fromkeys(guids)}
+            return {guid: _resultado_ou_erro(futuro) for guid, futuro in futuros.items()}
+
+# ---------------- Funções Auxiliares ----------------
+def _resultado_ou_erro(futuro):
+    try:
+        return futuro.result()
+    except Exception as e:
+        return e
+
+def nome_endpoint(caminho):
+    """Agrupa caminhos por endpoint para as métricas (entity/guid, entity/bulk, lineage)"""
+    partes = caminho.split("/")
+    if partes[0] == "entity" and len(partes) > 1:
+        return f"entity/{partes[1]}"
+    return partes[0]
+
+def versao_entidade(entidade):
+    """(updateTime, version) da entidade, os mesmos campos gravados por extrair_todas_informacoes"""
+    entidade = entidade or {}
+    return entidade.get("updateTime"), entidade.get("version")
+
+def dividir_em_lotes(guids, tamanho_base, max_guids, max_url):
+    """Agrupa GUIDs em lotes de no máximo `max_guids` itens e `max_url` caracteres de URL"""
+    lotes, atual, tamanho = [], [], tamanho_base
+    for guid in guids:
+        custo = len(f"guid={guid}&")
+        if atual and (len(atual) >= max_guids or tamanho + custo > max_url):
+            lotes.append(atual)
+            atual, tamanho = [], tamanho_base
+        atual.append(guid)
+        tamanho += custo
+    if atual:
+        lotes.append(atual)
+    return lotes
+
+def guids_referenciados(dados):
+    """Coleta os GUIDs citados em relationshipAttributes/attributes (objetos com chave 'guid')"""
+    encontrados = []
+    if isinstance(dados, dict):
+        if isinstance(dados.get("guid"), str):
+            encontrados.append(dados["guid"])
+        for valor in dados.values():
+            encontrados.extend(guids_referenciados(valor))
+    elif isinstance(dados, list):
+        for item in dados:
+            encontrados.extend(guids_referenciados(item))
+    return list(dict.fromkeys(encontrados))
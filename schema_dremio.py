@@ -0,0 +1,140 @@
+import os
+import time
+import yaml
+from amostragem import referencia_tabela, literal
+
+HISTORICO_DIR = "Historico"
+
+# Tabelas por query no INFORMATION_SCHEMA (limita o tamanho do WHERE)
+MAX_TABELAS_QUERY = 200
+
+COLUNAS_INFORMATION_SCHEMA = ("TABLE_SCHEMA", "TABLE_NAME", "COLUMN_NAME", "ORDINAL_POSITION", "DATA_TYPE",
+                              "IS_NULLABLE", "NUMERIC_PRECISION", "NUMERIC_SCALE", "CHARACTER_MAXIMUM_LENGTH")
+
+# ---------------- Nomes de Tabela ----------------
+def dividir_tabela(tabela):
+    """
+    Separa "espaco.pasta.tabela" (com ou sem aspas em cada parte) em
+    (TABLE_SCHEMA, TABLE_NAME) como aparecem no INFORMATION_SCHEMA
+    """
+    partes, atual, entre_aspas, i = [], "", False, 0
+    while i < len(tabela):
+        c = tabela[i]
+        if c == '"':
+            if entre_aspas and tabela[i + 1:i + 2] == '"':
+                atual += '"'
+                i += 1
+            else:
+                entre_aspas = not entre_aspas
+        elif c == "." and not entre_aspas:
+            partes.append(atual)
+            atual = ""
+        else:
+            atual += c
+        i += 1
+    partes.append(atual)
+    partes = [p.strip() for p in partes if p.strip()]
+    return ".".join(partes[:-1]), partes[-1] if partes else ""
+
+# ---------------- Consultas ----------------
+def montar_query_schema(tabelas):
+    """Uma query ao INFORMATION_SCHEMA."COLUMNS" para várias tabelas"""
+    filtros = []
+    for tabela in tabelas:
+        esquema, nome = dividir_tabela(tabela)
+        filtros.append(f"(TABLE_SCHEMA = {literal(esquema)} AND TABLE_NAME = {literal(nome)})")
+    return (f"SELECT {', '.join(COLUNAS_INFORMATION_SCHEMA)} FROM INFORMATION_SCHEMA.\"COLUMNS\" "
+            f"WHERE {' OR '.join(filtros)} ORDER BY TABLE_SCHEMA, TABLE_NAME, ORDINAL_POSITION")
+
+def _coluna_information_schema(linha):
+    registro = dict(zip(COLUNAS_INFORMATION_SCHEMA, linha))
+    coluna = {
+        "nome": registro["COLUMN_NAME"],
+        "tipo": registro["DATA_TYPE"],
+        "anulavel": str(registro["IS_NULLABLE"]).upper() in ("YES", "TRUE", "1"),
+        "posicao": int(registro["ORDINAL_POSITION"]),
+    }
+    for chave, campo in (("precisao", "NUMERIC_PRECISION"), ("escala", "NUMERIC_SCALE"),
+                         ("tamanho", "CHARACTER_MAXIMUM_LENGTH")):
+        if registro[campo] is not None:
+            coluna[chave] = int(registro[campo])
+    return coluna
+
+def ler_schemas(conn, tabelas, max_tabelas=MAX_TABELAS_QUERY):
+    """
+    Lê as colunas de várias tabelas pelo INFORMATION_SCHEMA, em uma query por
+    bloco de `max_tabelas`. Tabelas não encontradas ali (ex.: nomes sem espaço)
+    caem para um SELECT ... LIMIT 0. Retorna {tabela: (fonte, colunas)}
+    """
+    # Tabela repetida na entrada é lida (e recebe as colunas) uma vez só
+    unicas = list(dict.fromkeys(tabelas))
+    chaves = {}
+    for tabela in unicas:
+        chaves.setdefault(tuple(p.lower() for p in dividir_tabela(tabela)), []).append(tabela)
+
+    encontradas = {}
+    cursor = conn.cursor()
+    try:
+        for inicio in range(0, len(unicas), max_tabelas):
+            cursor.execute(montar_query_schema(unicas[inicio:inicio + max_tabelas]))
+            for linha in cursor.fetchall():
+                chave = (str(linha[0]).lower(), str(linha[1]).lower())
+                for tabela in chaves.get(chave, []):
+                    encontradas.setdefault(tabela, []).append(_coluna_information_schema(linha))
+    finally:
+        cursor.close()
+
+    resultado = {}
+    for tabela in unicas:
+        if tabela in encontradas:
+            resultado[tabela] = ("information_schema", encontradas[tabela])
+        else:
+            resultado[tabela] = ("limit0", schema_por_limit0(conn, tabela))
+    return resultado
+
+def schema_por_limit0(conn, tabela):
+    """Colunas pelo cursor.description de um SELECT ... LIMIT 0 (sem ler dados)"""
+    cursor = conn.cursor()
+    try:
+        cursor.execute(f"SELECT * FROM {referencia_tabela(tabela)} LIMIT 0")
+        descricao = cursor.description
+        cursor.fetchall()
+    finally:
+        cursor.close()
+    colunas = []
+    for posicao, d in enumerate(descricao, start=1):
+        tipo = getattr(d[1], "__name__", None) or (str(d[1]) if d[1] is not None else "desconhecido")
+        # null_ok None = desconhecido, tratado como anulável
+        coluna = {"nome": d[0], "tipo": tipo, "anulavel": d[6] is not False, "posicao": posicao}
+        if d[4] is not None:
+            coluna["precisao"] = d[4]
+        if d[5] is not None:
+            coluna["escala"] = d[5]
+        colunas.append(coluna)
+    return colunas
+
+# ---------------- Artefato ----------------
+def caminho_schema(guid, pasta=HISTORICO_DIR):
+    return os.path.join(pasta, f"{guid}_schema.yaml")
+
+def salvar_schema(guid, tabela, fonte, colunas, tempo, pasta=HISTORICO_DIR):
+    """Grava {guid}_schema.yaml com nome, tipo e nulidade de cada coluna"""
+    os.makedirs(pasta, exist_ok=True)
+    caminho = caminho_schema(guid, pasta)
+    with open(caminho, "w", encoding="utf-8") as f:
+        yaml.safe_dump({
+            "guid": guid,
+            "tabela": tabela,
+            "fonte": fonte,
+            "gerado_em": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "tempo": round(tempo, 3),
+            "colunas": colunas,
+        }, f, allow_unicode=True, sort_keys=False)
+    return caminho
+
+def carregar_schema(guid, pasta=HISTORICO_DIR):
+    caminho = caminho_schema(guid, pasta)
+    if not os.path.exists(caminho):
+        return None
+    with open(caminho, "r", encoding="utf-8") as f:
+        return yaml.safe_load(f)
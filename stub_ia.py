@@ -0,0 +1,123 @@
+"""
+Stub local do endpoint de chat completions (compatível com a API da OpenAI)
+para testar a Etapa 5 sem custo: latência simulada, limite de requisições por
+minuto (responde 429 com Retry-After, como a API) e uma fração de erros 500.
+
+Uso: python stub_ia.py [--porta 8089] [--atraso 0.5] [--rpm 0] [--erros 0.0]
+e depois IA_BASE_URL=http://127.0.0.1:8089/v1 OPENAI_API_KEY=stub python Etapa5.py <GUID> <GUID> ...
+"""
+
+import sys
+import json
+import time
+import random
+import argparse
+import threading
+from collections import deque
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+class ServidorIA:
+    """Servidor HTTP local que conta requisições, 429 e erros devolvidos"""
+
+    def __init__(self, porta=0, atraso=0.5, rpm=0, erros=0.0, semente=0):
+        self.atraso = atraso
+        self.rpm = rpm
+        self.erros = erros
+        self.aleatorio = random.Random(semente)
+        self.lock = threading.Lock()
+        self.instantes = deque()
+        self.contadores = {"requisicoes": 0, "respostas": 0, "limitadas": 0, "erros": 0, "simultaneas_max": 0}
+        self._simultaneas = 0
+        servidor = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def _json(self, codigo, corpo, headers=None):
+                dados = json.dumps(corpo, ensure_ascii=False).encode("utf-8")
+                self.send_response(codigo)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(dados)))
+                for nome, valor in (headers or {}).items():
+                    self.send_header(nome, valor)
+                self.end_headers()
+                self.wfile.write(dados)
+
+            def do_POST(self):
+                if not self.path.rstrip("/").endswith("/chat/completions"):
+                    self._json(404, {"error": {"message": "not found"}})
+                    return
+                pedido = json.loads(self.rfile.read(int(self.headers.get("Content-Length") or 0)) or b"{}")
+                codigo, corpo, headers = servidor.responder(pedido)
+                self._json(codigo, corpo, headers)
+
+        self.http = ThreadingHTTPServer(("127.0.0.1", porta), Handler)
+        self.porta = self.http.server_address[1]
+        self.base_url = f"http://127.0.0.1:{self.porta}/v1"
+        threading.Thread(target=self.http.serve_forever, daemon=True).start()
+
+    def responder(self, pedido):
+        agora = time.monotonic()
+        with self.lock:
+            self.contadores["requisicoes"] += 1
+            while self.instantes and agora - self.instantes[0] >= 60:
+                self.instantes.popleft()
+            if self.rpm and len(self.instantes) >= self.rpm:
+                self.contadores["limitadas"] += 1
+                espera = 60 - (agora - self.instantes[0])
+                return 429, {"error": {"message": "Rate limit reached", "type": "requests"}}, \
+                    {"Retry-After": f"{espera:.2f}"}
+            self.instantes.append(agora)
+            falhar = self.aleatorio.random() < self.erros
+            self._simultaneas += 1
+            self.contadores["simultaneas_max"] = max(self.contadores["simultaneas_max"], self._simultaneas)
+        try:
+            time.sleep(self.atraso)
+        finally:
+            with self.lock:
+                self._simultaneas -= 1
+        if falhar:
+            with self.lock:
+                self.contadores["erros"] += 1
+            return 500, {"error": {"message": "erro simulado", "type": "server_error"}}, {}
+
+        prompt = "\n".join(str(m.get("content", "")) for m in pedido.get("messages", []))
+        conteudo = ("Preenchido com IA\n\n## Descrição da tabela\nResposta simulada pelo stub local.\n\n"
+                    "## Contexto Negócio\nSem chamada à API.")
+        with self.lock:
+            self.contadores["respostas"] += 1
+        return 200, {
+            "id": f"stub-{self.contadores['requisicoes']}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": pedido.get("model", "stub"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": conteudo}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": len(prompt) // 4, "completion_tokens": len(conteudo) // 4,
+                      "total_tokens": len(prompt) // 4 + len(conteudo) // 4},
+        }, {}
+
+    def fechar(self):
+        self.http.shutdown()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Stub local do endpoint de chat completions para testar a Etapa 5")
+    parser.add_argument("--porta", type=int, default=8089)
+    parser.add_argument("--atraso", type=float, default=0.5, help="Latência por resposta, em segundos")
+    parser.add_argument("--rpm", type=int, default=0, help="Requisições por minuto antes de responder 429 (0 = sem limite)")
+    parser.add_argument("--erros", type=float, default=0.0, help="Fração das requisições que recebem 500")
+    args = parser.parse_args(argv)
+
+    servidor = ServidorIA(args.porta, args.atraso, args.rpm, args.erros)
+    print(f"🤖 Stub em {servidor.base_url} (Ctrl+C para parar)")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        print(f"\n📊 {servidor.contadores}")
+    finally:
+        servidor.fechar()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,100 @@
+import os
+import re
+import glob
+
+# Onde fica o conteúdo principal (Confluence primeiro); sem nenhum, usa o body
+SELETORES_CONTEUDO = "#main-content, .wiki-content, article, main, [role=main]"
+# Elementos que não são conteúdo
+SELETORES_REMOVIDOS = ("script, style, noscript, template, nav, header, footer, aside, form, button, svg, "
+                       "iframe, [hidden], [aria-hidden=true], .aui-nav, .page-metadata, #likes-and-labels-container")
+
+# Percorre o DOM já renderizado e devolve blocos em markdown: títulos, parágrafos,
+# itens de lista, tabelas (com |) e blocos de código
+EXTRAIR_BLOCOS_JS = """
+([seletoresConteudo, seletoresRemovidos]) => {
+    const raiz = document.querySelector(seletoresConteudo) || document.body;
+    const clone = raiz.cloneNode(true);
+    clone.querySelectorAll(seletoresRemovidos).forEach(e => e.remove());
+
+    const BLOCOS = new Set(["p", "div", "section", "article", "main", "ul", "ol", "dl", "dt", "dd",
+                            "blockquote", "figure", "figcaption", "details", "summary", "hr"]);
+    const limpar = t => (t || "").replace(/\\s+/g, " ").trim();
+    const blocos = [];
+    let linha = "";
+    const quebrar = () => { const t = limpar(linha); if (t && t !== "-") blocos.push(t); linha = ""; };
+
+    const tabela = el => {
+        const linhas = [...el.querySelectorAll("tr")]
+            .map(tr => [...tr.children].map(c => limpar(c.textContent).replace(/\\|/g, "\\\\|")))
+            .filter(l => l.some(c => c));
+        if (!linhas.length) return;
+        const n = Math.max(...linhas.map(l => l.length));
+        const formatar = l => "| " + [...l, ...Array(n - l.length).fill("")].join(" | ") + " |";
+        blocos.push([formatar(linhas[0]), "|" + " --- |".repeat(n), ...linhas.slice(1).map(formatar)].join("\\n"));
+    };
+
+    const visitar = no => {
+        for (const filho of no.childNodes) {
+            if (filho.nodeType === Node.TEXT_NODE) { linha += filho.textContent; continue; }
+            if (filho.nodeType !== Node.ELEMENT_NODE) continue;
+            const tag = filho.tagName.toLowerCase();
+            if (/^h[1-6]$/.test(tag)) {
+                quebrar();
+                const t = limpar(filho.textContent);
+                if (t) blocos.push("#".repeat(Number(tag[1])) + " " + t);
+            } else if (tag === "table") {
+                quebrar(); tabela(filho);
+            } else if (tag === "pre") {
+                quebrar(); blocos.push("```\\n" + filho.textContent.replace(/\\s+$/, "") + "\\n```");
+            } else if (tag === "li") {
+                quebrar(); linha = "- "; visitar(filho); quebrar();
+            } else if (tag === "br") {
+                linha += " ";
+            } else if (BLOCOS.has(tag)) {
+                quebrar(); visitar(filho); quebrar();
+            } else {
+                visitar(filho);
+            }
+        }
+    };
+    visitar(clone);
+    quebrar();
+    return {titulo: limpar(document.title), blocos};
+}
+"""
+
+# ---------------- Conversão ----------------
+def montar_markdown(titulo, link, blocos):
+    """Junta os blocos extraídos num markdown compacto (sem blocos repetidos em sequência)"""
+    partes = [f"# {titulo or link}", f"Fonte: {link}"]
+    for bloco in blocos:
+        if bloco != partes[-1]:
+            partes.append(bloco)
+    return re.sub(r"\n{3,}", "\n\n", "\n\n".join(partes)).strip() + "\n"
+
+async def extrair_markdown(page):
+    """Markdown do conteúdo principal da página carregada (sem menus, scripts, rodapés)"""
+    dados = await page.evaluate(EXTRAIR_BLOCOS_JS, [SELETORES_CONTEUDO, SELETORES_REMOVIDOS])
+    return montar_markdown(dados["titulo"], page.url, dados["blocos"])
+
+# ---------------- Leitura (Etapa 5) ----------------
+def caminhos_documentos(guid, extensao, pasta="Historico"):
+    """{guid}_docN.<extensao> em ordem numérica (doc2 antes de doc10)"""
+    caminhos = glob.glob(os.path.join(pasta, f"{glob.escape(guid)}_doc*.{extensao}"))
+    padrao = re.compile(rf"_doc(\d+)\.{re.escape(extensao)}$")
+    numerados = [(int(m.group(1)), c) for c in caminhos if (m := padrao.search(c))]
+    return [c for _, c in sorted(numerados)]
+
+def ler_markdowns(guid, pasta="Historico"):
+    """Texto de cada {guid}_docN.md (link repetido entra uma vez); lista vazia se não houver"""
+    textos = []
+    for caminho in caminhos_documentos(guid, "md", pasta):
+        with open(caminho, "r", encoding="utf-8") as f:
+            texto = f.read().strip()
+        if texto and texto not in textos:
+            textos.append(texto)
+    return textos
+
+def carregar_markdown(guid, pasta="Historico"):
+    """Texto de todos os {guid}_docN.md separados por ---; vazio se não houver"""
+    return "\n\n---\n\n".join(ler_markdowns(guid, pasta))
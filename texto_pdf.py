@@ -0,0 +1,151 @@
+import os
+import atexit
+import hashlib
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import PyPDF2
+from cache_disco import CacheDisco
+from texto_documento import caminhos_documentos
+
+# ---------------- Configuração ----------------
+def configuracao_pdf():
+    """
+    PDF_PROCESSOS (padrão: núcleos da máquina); PDF_PAGINAS_POR_TAREFA (padrão 8;
+    se tudo couber numa tarefa só, a leitura é feita no próprio processo); PDF_CACHE=0 desliga o
+    cache do texto; PDF_CACHE_DIR (padrão Historico/cache/pdf_texto); PDF_CACHE_MAX_MB (padrão 256)
+    """
+    return {
+        "processos": int(os.getenv("PDF_PROCESSOS", "0")) or os.cpu_count() or 1,
+        "paginas_por_tarefa": max(int(os.getenv("PDF_PAGINAS_POR_TAREFA", "8")), 1),
+        "cache": os.getenv("PDF_CACHE", "1") != "0",
+        "cache_dir": os.getenv("PDF_CACHE_DIR", os.path.join("Historico", "cache", "pdf_texto")),
+        "cache_max_bytes": int(float(os.getenv("PDF_CACHE_MAX_MB", "256")) * 1024 * 1024),
+    }
+
+# ---------------- Recursos Compartilhados ----------------
+_lock = threading.Lock()
+_pool = None
+_cache = None
+_cache_criado = False
+_contadores = {"pdfs": 0, "paginas": 0, "tarefas_paralelas": 0}
+
+def obter_pool(processos):
+    """
+    Pool de processos da Etapa 5, criado na primeira extração grande e reaproveitado entre GUIDs.
+    Usa "spawn": o executor em processo já tem várias threads (DAG, Purview, renovação do token,
+    Playwright) e um fork nesse estado pode herdar locks travados. Os workers só importam
+    este módulo para rodar extrair_paginas
+    """
+    global _pool
+    with _lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=processos, mp_context=multiprocessing.get_context("spawn"))
+            atexit.register(fechar_pool)
+        return _pool
+
+def fechar_pool():
+    global _pool
+    with _lock:
+        if _pool is not None:
+            _pool.shutdown(wait=True)
+            _pool = None
+
+def obter_cache(config):
+    global _cache, _cache_criado
+    with _lock:
+        if not _cache_criado:
+            _cache = CacheDisco(config["cache_dir"], max_bytes=config["cache_max_bytes"]) if config["cache"] else None
+            _cache_criado = True
+        return _cache
+
+def estatisticas():
+    with _lock:
+        metricas = {"texto_pdf": dict(_contadores)}
+    if _cache is not None:
+        metricas["cache_pdf"] = _cache.estatisticas()
+    return metricas
+
+# ---------------- Extração ----------------
+def hash_arquivo(caminho):
+    sha = hashlib.sha256()
+    with open(caminho, "rb") as f:
+        for bloco in iter(lambda: f.read(1024 * 1024), b""):
+            sha.update(bloco)
+    return sha.hexdigest()
+
+def extrair_paginas(caminho, inicio, fim):
+    """Texto das páginas [inicio, fim) do PDF (roda nos processos do pool)"""
+    with open(caminho, "rb") as f:
+        leitor = PyPDF2.PdfReader(f)
+        return [leitor.pages[i].extract_text() or "" for i in range(inicio, fim)]
+
+def _numero_paginas(caminho):
+    with open(caminho, "rb") as f:
+        return len(PyPDF2.PdfReader(f).pages)
+
+def extrair_pdfs(caminhos, config=None):
+    """
+    Texto de vários PDFs. O texto fica em cache pelo hash do conteúdo do arquivo
+    (o mesmo PDF em outro GUID ou numa nova execução não é lido de novo); os que
+    faltam têm as páginas divididas em tarefas de `paginas_por_tarefa` e
+    distribuídas no pool de processos. Retorna {caminho: texto}
+    """
+    config = config or configuracao_pdf()
+    cache = obter_cache(config)
+    hashes = {caminho: hash_arquivo(caminho) for caminho in caminhos}
+    por_hash, pendentes = {}, {}
+    for caminho, resumo in hashes.items():
+        if resumo in por_hash or resumo in pendentes:
+            continue  # mesmo arquivo com outro nome: lido uma vez só
+        texto = cache.obter(resumo) if cache is not None else None
+        if texto is not None:
+            por_hash[resumo] = texto
+        else:
+            pendentes[resumo] = caminho
+
+    tarefas = {}
+    for resumo, caminho in pendentes.items():
+        total = _numero_paginas(caminho)
+        passo = config["paginas_por_tarefa"]
+        tarefas[resumo] = [(inicio, min(inicio + passo, total)) for inicio in range(0, total, passo)]
+
+    # Com uma tarefa só não compensa subir processos
+    if sum(len(t) for t in tarefas.values()) > 1 and config["processos"] > 1:
+        pool = obter_pool(config["processos"])
+        futuros = {resumo: [pool.submit(extrair_paginas, pendentes[resumo], i, f) for i, f in intervalos]
+                   for resumo, intervalos in tarefas.items()}
+        paginas = {resumo: [p for futuro in lista for p in futuro.result()] for resumo, lista in futuros.items()}
+        paralelas = sum(len(lista) for lista in futuros.values())
+    else:
+        paginas = {resumo: [p for i, f in intervalos for p in extrair_paginas(pendentes[resumo], i, f)]
+                   for resumo, intervalos in tarefas.items()}
+        paralelas = 0
+
+    for resumo, caminho in pendentes.items():
+        por_hash[resumo] = "\n".join(paginas[resumo])
+        if cache is not None:
+            cache.gravar(resumo, por_hash[resumo], {"arquivo": os.path.basename(caminho)})
+
+    with _lock:
+        _contadores["pdfs"] += len(pendentes)
+        _contadores["paginas"] += sum(len(p) for p in paginas.values())
+        _contadores["tarefas_paralelas"] += paralelas
+    return {caminho: por_hash[resumo] for caminho, resumo in hashes.items()}
+
+def ler_pdfs(guid, pasta="Historico"):
+    """Texto de cada {guid}_docN.pdf (PDF repetido entra uma vez); lista vazia se não houver"""
+    caminhos = caminhos_documentos(guid, "pdf", pasta)
+    if not caminhos:
+        return []
+    textos = []
+    extraidos = extrair_pdfs(caminhos)
+    for caminho in caminhos:
+        texto = extraidos[caminho].strip()
+        if texto and texto not in textos:
+            textos.append(texto)
+    return textos
+
+def carregar_pdfs(guid, pasta="Historico"):
+    """Texto de todos os {guid}_docN.pdf separados por ---; vazio se não houver"""
+    return "\n\n---\n\n".join(ler_pdfs(guid, pasta))
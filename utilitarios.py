@@ -0,0 +1,108 @@
+import os
+import json
+import time
+import socket
+import tempfile
+
+# ---------------- Escrita Atômica ----------------
+def escrever_json_atomico(caminho, dados):
+    """
+    Grava JSON em arquivo temporário e substitui o destino de uma vez,
+    evitando arquivos truncados se o processo cair no meio da escrita
+    """
+    pasta = os.path.dirname(os.path.abspath(caminho))
+    os.makedirs(pasta, exist_ok=True)
+
+    fd, caminho_tmp = tempfile.mkstemp(dir=pasta, prefix=".tmp_", suffix=".json")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(dados, f, ensure_ascii=False, indent=2)
+        os.replace(caminho_tmp, caminho)
+    except Exception:
+        if os.path.exists(caminho_tmp):
+            os.remove(caminho_tmp)
+        raise
+
+def ler_json(caminho, padrao=None):
+    """Lê um JSON, devolvendo o valor padrão se o arquivo não existir ou estiver corrompido"""
+    if not os.path.exists(caminho):
+        return padrao
+    try:
+        with open(caminho, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return padrao
+
+# ---------------- Bloqueio entre Processos ----------------
+def processo_vivo(pid):
+    """True se o processo `pid` ainda existe nesta máquina"""
+    if os.name == "nt":
+        # os.kill(pid, 0) no Windows manda CTRL_C_EVENT; consulta o processo pela API
+        import ctypes
+        kernel32 = ctypes.WinDLL("kernel32", use_last_error=True)
+        handle = kernel32.OpenProcess(0x1000, False, pid)  # PROCESS_QUERY_LIMITED_INFORMATION
+        if not handle:
+            return ctypes.get_last_error() == 5  # ERROR_ACCESS_DENIED: existe, mas é de outro usuário
+        try:
+            codigo = ctypes.c_ulong()
+            kernel32.GetExitCodeProcess(handle, ctypes.byref(codigo))
+            return codigo.value == 259  # STILL_ACTIVE
+        finally:
+            kernel32.CloseHandle(handle)
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+class BloqueioArquivo:
+    """
+    Lock simples entre processos baseado em um arquivo `.lock` criado de forma
+    exclusiva, com o PID e a máquina de quem o segura. Funciona em Windows e Linux.
+    Um lock abandonado só é descartado quando o processo dono já morreu; se o dono
+    for de outra máquina (pasta compartilhada) ou o arquivo não tiver dono legível,
+    vale a idade: descartado depois de `expira_em` segundos.
+    """
+
+    def __init__(self, caminho, timeout=30, expira_em=60):
+        self.caminho_lock = f"{caminho}.lock"
+        self.timeout = timeout
+        self.expira_em = expira_em
+
+    def _abandonado(self):
+        try:
+            with open(self.caminho_lock, "r", encoding="utf-8") as f:
+                pid, _, maquina = f.read().partition("\n")
+            idade = time.time() - os.path.getmtime(self.caminho_lock)
+        except OSError:
+            return False
+        if pid.strip().isdigit() and maquina.strip() == socket.gethostname():
+            return not processo_vivo(int(pid))
+        return idade > self.expira_em
+
+    def __enter__(self):
+        inicio = time.time()
+        while True:
+            try:
+                fd = os.open(self.caminho_lock, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+                os.write(fd, f"{os.getpid()}\n{socket.gethostname()}".encode())
+                os.close(fd)
+                return self
+            except FileExistsError:
+                if self._abandonado():
+                    try:
+                        os.remove(self.caminho_lock)
+                    except OSError:
+                        pass
+                    continue
+                if time.time() - inicio > self.timeout:
+                    raise TimeoutError(f"❌ Não foi possível obter o lock {self.caminho_lock}")
+                time.sleep(0.05)
+
+    def __exit__(self, *exc):
+        try:
+            os.remove(self.caminho_lock)
+        except OSError:
+            pass